@@ -83,9 +83,9 @@ class User(AbstractUser):
         return UserAchievement.objects.filter(user=self).count()
     
     def get_unread_notifications_count(self):
-        """Возвращает количество непрочитанных уведомлений"""
-        from game.models import Notification
-        return Notification.objects.filter(user=self, is_read=False).count()
+        """Возвращает количество непрочитанных уведомлений (счетчик в кеше)"""
+        from game.notifications import get_unread_count
+        return get_unread_count(self)
     
     def get_avatar_border_class(self):
         """Возвращает CSS класс для рамки аватара в зависимости от выбранной рамки"""
@@ -337,6 +337,21 @@ class ProfileViewsTest(TestCase):
         self.assertFalse(UserLevelProgress.objects.filter(user=user).exists())
         self.assertFalse(UserAchievement.objects.filter(user=user).exists())
 
+    def test_achievement_list_keeps_catalog_snapshot(self):
+        """Дозаполнение редкости не меняет общие объекты каталога"""
+        from game.catalog import get_catalog, invalidate_catalog
+        from game.models import Achievement, Topic
+        from .views import build_achievement_list
+        Topic.objects.create(name='Бюджет')
+        Achievement.objects.create(name='Мастер Бюджет', description='Описание', rarity='')
+        invalidate_catalog()
+        shared = get_catalog().get_achievement('Мастер Бюджет')
+
+        items = build_achievement_list(self.user)
+        self.assertEqual(items[0]['achievement'].rarity, 'common')
+        self.assertEqual(shared.rarity, '')
+        self.assertEqual(Achievement.objects.get(name='Мастер Бюджет').rarity, 'common')
+
 class UserIntegrationTest(TestCase):
     """Интеграционные тесты для пользователей"""
     
@@ -1,88 +1,95 @@
+import copy
+
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
 from .forms import CustomUserCreationForm
 from .models import User
-from game.models import Topic, UserLevelProgress, UserAchievement, Achievement
-
-
-@login_required
-@login_required
-def mobile_achievements(request):
-    """Страница достижений для мобильной версии"""
-    user = request.user
-    
-    # Получаем все достижения пользователя
-    user_achievements = UserAchievement.objects.filter(user=user).select_related('achievement').order_by('-earned_at')
+from game.achievements import forget_earned_achievements
+from game.catalog import bump_catalog_version, get_catalog
+from game.leaderboard_sync import mark_leaderboard_dirty
+from game.progress import get_topic_progress, reset_topic_progress
+from game.models import UserLevelProgress, UserAchievement, Achievement
+
+
+def build_achievement_list(user):
+    """
+    Список всех достижений со статусом получения пользователем.
+    
+    Определения достижений берем из кеша каталога, а полученные
+    пользователем — одним запросом.
+    """
+    catalog = get_catalog()
+    earned = dict(
+        UserAchievement.objects.filter(user=user).values_list('achievement_id', 'earned_at')
+    )
     
-    # Получаем все возможные достижения
     all_achievements = []
     
     # Добавляем системные достижения (не привязанные к темам)
-    system_achievements = Achievement.objects.filter(
-        name__in=['Первые шаги', 'Легенда финансовой грамотности']
-    )
-    
-    for achievement in system_achievements:
-        # Проверяем, получено ли достижение пользователем
-        user_achievement = UserAchievement.objects.filter(
-            user=user, achievement=achievement
-        ).first()
-        
+    for name in ['Первые шаги', 'Легенда финансовой грамотности']:
+        achievement = catalog.get_achievement(name)
+        if achievement is None:
+            continue
         all_achievements.append({
             'achievement': achievement,
-            'earned': user_achievement is not None,
-            'earned_at': user_achievement.earned_at if user_achievement else None
+            'earned': achievement.id in earned,
+            'earned_at': earned.get(achievement.id)
         })
     
     # Добавляем достижения для тем с разными уровнями редкости
     rarity_levels = ['common', 'uncommon', 'rare', 'legendary']
     icon_classes = ['fa-solid fa-star', 'fa-solid fa-gem', 'fa-solid fa-trophy', 'fa-solid fa-crown']
     
-    for index, topic in enumerate(Topic.objects.all()):
+    for index, topic in enumerate(catalog.get_topics()):
         achievement_name = f"Мастер {topic.name}"
-        achievement_description = f"Пройдены все уровни по теме «{topic.name}»"
         
         # Определяем редкость в зависимости от индекса
         rarity_index = index % len(rarity_levels)
         rarity = rarity_levels[rarity_index]
         icon = icon_classes[rarity_index]
         
-        # Получаем или создаем достижение с редкостью
-        achievement, _ = Achievement.objects.get_or_create(
-            name=achievement_name,
-            defaults={
-                "description": achievement_description,
-                "rarity": rarity,
-                "icon": icon
-            }
-        )
+        # Создаем достижение только если его еще нет в каталоге
+        achievement = catalog.get_achievement(achievement_name)
+        if achievement is None:
+            achievement, _ = Achievement.objects.get_or_create(
+                name=achievement_name,
+                defaults={
+                    "description": f"Пройдены все уровни по теме «{topic.name}»",
+                    "rarity": rarity,
+                    "icon": icon
+                }
+            )
         
-        # Если достижение уже существует без редкости, добавляем её
+        # Если достижение уже существует без редкости, добавляем её.
+        # Объект из каталога общий для всех запросов worker'а: меняем копию,
+        # а в БД пишем через update и сбрасываем каталог после фиксации
         if not achievement.rarity:
+            achievement = copy.copy(achievement)
             achievement.rarity = rarity
             achievement.icon = icon
-            achievement.save()
-        
-        # Проверяем, получено ли достижение пользователем
-        user_achievement = UserAchievement.objects.filter(
-            user=user, achievement=achievement
-        ).first()
+            Achievement.objects.filter(pk=achievement.pk).update(rarity=rarity, icon=icon)
+            transaction.on_commit(bump_catalog_version)
         
         all_achievements.append({
             'achievement': achievement,
-            'earned': user_achievement is not None,
-            'earned_at': user_achievement.earned_at if user_achievement else None
+            'earned': achievement.id in earned,
+            'earned_at': earned.get(achievement.id)
         })
     
     # Сортируем: сначала полученные, потом неполученные
-    achievements = sorted(all_achievements, key=lambda x: (not x['earned'], x['achievement'].name))
-    
+    return sorted(all_achievements, key=lambda x: (not x['earned'], x['achievement'].name))
+
+
+@login_required
+def mobile_achievements(request):
+    """Страница достижений для мобильной версии"""
     return render(request, 'accounts/mobile_achievements.html', {
-        'achievements': achievements,
+        'achievements': build_achievement_list(request.user),
     })
 
 def profile(request):
@@ -96,22 +103,15 @@ def profile(request):
         'planning': {'name': 'Планирование', 'icon': 'fa-bullseye', 'topics': [], 'total_levels': 0, 'completed_levels': 0},
     }
     
-    topics = Topic.objects.prefetch_related('level_set').all()
-    for topic in topics:
-        total = topic.level_set.count()
-        completed = UserLevelProgress.objects.filter(
-            user=user,
-            level__topic=topic,
-            completed=True
-        ).count()
+    catalog = get_catalog()
+    topic_progress = get_topic_progress(user)
+    for topic in catalog.get_topics():
+        total = catalog.get_level_count(topic.id)
+        counters = topic_progress.get(topic.id)
         
         # Подсчитываем правильные ответы для системы оценки по процентам
-        correct_answers = UserLevelProgress.objects.filter(
-            user=user,
-            level__topic=topic,
-            completed=True,
-            score__gte=80  # 80% и выше считается успешным прохождением
-        ).count()
+        # (пройдено с результатом 80% и выше)
+        correct_answers = counters.high_score_count if counters else 0
         
         if topic.main_category in categories:
             categories[topic.main_category]['topics'].append(topic)
@@ -125,71 +125,7 @@ def profile(request):
         else:
             category['progress_percent'] = 0
 
-    # Получаем все достижения пользователя
-    user_achievements = UserAchievement.objects.filter(user=user).select_related('achievement').order_by('-earned_at')
-    
-    # Получаем все возможные достижения
-    all_achievements = []
-    
-    # Добавляем системные достижения (не привязанные к темам)
-    system_achievements = Achievement.objects.filter(
-        name__in=['Первые шаги', 'Легенда финансовой грамотности']
-    )
-    
-    for achievement in system_achievements:
-        # Проверяем, получено ли достижение пользователем
-        user_achievement = UserAchievement.objects.filter(
-            user=user, achievement=achievement
-        ).first()
-        
-        all_achievements.append({
-            'achievement': achievement,
-            'earned': user_achievement is not None,
-            'earned_at': user_achievement.earned_at if user_achievement else None
-        })
-    
-    # Добавляем достижения для тем с разными уровнями редкости
-    rarity_levels = ['common', 'uncommon', 'rare', 'legendary']
-    icon_classes = ['fa-solid fa-star', 'fa-solid fa-gem', 'fa-solid fa-trophy', 'fa-solid fa-crown']
-    
-    for index, topic in enumerate(Topic.objects.all()):
-        achievement_name = f"Мастер {topic.name}"
-        achievement_description = f"Пройдены все уровни по теме «{topic.name}»"
-        
-        # Определяем редкость в зависимости от индекса
-        rarity_index = index % len(rarity_levels)
-        rarity = rarity_levels[rarity_index]
-        icon = icon_classes[rarity_index]
-        
-        # Получаем или создаем достижение с редкостью
-        achievement, _ = Achievement.objects.get_or_create(
-            name=achievement_name,
-            defaults={
-                "description": achievement_description,
-                "rarity": rarity,
-                "icon": icon
-            }
-        )
-        
-        # Если достижение уже существует без редкости, добавляем её
-        if not achievement.rarity:
-            achievement.rarity = rarity
-            achievement.icon = icon
-            achievement.save()
-        
-        # Проверяем, получено ли достижение пользователем
-        user_achievement = UserAchievement.objects.filter(
-            user=user, achievement=achievement
-        ).first()
-        
-        all_achievements.append({
-            'achievement': achievement,
-            'earned': user_achievement is not None,
-            'earned_at': user_achievement.earned_at if user_achievement else None
-        })
-    
-    # Сортируем: сначала полученные, потом неполученные
-    achievements = sorted(all_achievements, key=lambda x: (not x['earned'], x['achievement'].name))
+    achievements = build_achievement_list(user)
 
     return render(request, 'accounts/profile.html', {
         'categories': categories,
@@ -214,6 +150,7 @@ class RegisterView(CreateView):
         # Устанавливаем аватарку по умолчанию при регистрации
         user.default_avatar = 'default1'  # Монеты
         user.save()
+        mark_leaderboard_dirty(user)
         login(self.request, user)
         messages.success(self.request, "Регистрация прошла успешно! Добро пожаловать в FinQuest!")
         return redirect(self.success_url)
@@ -251,12 +188,15 @@ def settings_view(request):
 def reset_progress(request):
     # Удаляем прогресс и достижения
     UserLevelProgress.objects.filter(user=request.user).delete()
+    reset_topic_progress(request.user)
     UserAchievement.objects.filter(user=request.user).delete()
+    forget_earned_achievements(request.user)
     # Сбрасываем очки и монеты
     request.user.points = 0
     request.user.coins = 0
     request.user.level_number = 1
     request.user.save()
+    mark_leaderboard_dirty(request.user)
     messages.success(request, "Прогресс сброшен!")
     return redirect('profile')
 
@@ -54,11 +54,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Для статических файлов на Render
+    'game.middleware.QueryBudgetMiddleware',  # Учет запросов к БД и бюджеты view
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'game.middleware.DeferredUpdatesMiddleware',  # Пакетные обновления рейтинга в конце запроса
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -82,6 +84,18 @@ TEMPLATES = [
     },
 ]
 
+# Логировать число запросов к БД на каждый контекст-процессор (game.context_processors)
+CONTEXT_PROCESSOR_PROFILING = os.environ.get('CONTEXT_PROCESSOR_PROFILING') == '1'
+
+# Версия деплоя: входит в ключи кеша страниц (game.page_cache), поэтому
+# после выкладки кешированные страницы не отдаются. Render передает хеш коммита.
+DEPLOY_VERSION = os.environ.get('DEPLOY_VERSION') or os.environ.get('RENDER_GIT_COMMIT', '')
+
+# Бюджет запросов к БД для view без декоратора query_budget (game.middleware.QueryBudgetMiddleware)
+QUERY_BUDGET_DEFAULT = {'queries': 50, 'db_ms': 500}
+# Заголовок Server-Timing с временем БД (видно во вкладке Network браузера)
+QUERY_BUDGET_SERVER_TIMING = os.environ.get('QUERY_BUDGET_SERVER_TIMING') == '1'
+
 WSGI_APPLICATION = 'finquest.wsgi.application'
 
 
@@ -100,6 +114,28 @@ DATABASES = {
 }
 
 
+# Cache
+# Каталог, рейтинг, попытки викторин и счетчики уведомлений кешируются
+# (game/catalog.py и др.). Чтобы изменения видели все worker'ы gunicorn,
+# кеш должен быть общим: задайте REDIS_URL (нужен пакет redis). Без него
+# используется LocMemCache — отдельный в каждом процессе, что подходит
+# только для разработки и запуска с одним worker'ом.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,311 @@
+"""
+Событийный движок достижений
+
+Вместо полной проверки всех достижений на каждый просмотр страницы
+каждое правило объявляет события, на которые реагирует. При событии
+вычисляются только затронутые правила — по снимку статистики
+пользователя, который загружает лениво только нужные данные. Новые
+достижения и уведомления записываются пакетно.
+
+Использование:
+    from game.achievements import dispatch, LEVEL_COMPLETED, POINTS_CHANGED
+    new_achievements = dispatch(user, LEVEL_COMPLETED, POINTS_CHANGED)
+"""
+from collections import namedtuple
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .catalog import get_catalog, bump_catalog_version
+from .leaderboard_sync import mark_leaderboard_dirty
+from .notifications import notify
+from .quests import update_daily_quest_progress
+from .models import Achievement, UserAchievement, Streak, UserLevelProgress, UserTopicProgress
+
+ANSWER_RECORDED = 'answer_recorded'
+LEVEL_COMPLETED = 'level_completed'
+POINTS_CHANGED = 'points_changed'
+STREAK_CHANGED = 'streak_changed'
+ACHIEVEMENT_EARNED = 'achievement_earned'
+ALL_EVENTS = (ANSWER_RECORDED, LEVEL_COMPLETED, POINTS_CHANGED, STREAK_CHANGED, ACHIEVEMENT_EARNED)
+
+EARNED_CACHE_TIMEOUT = 60 * 60
+RECENT_LIMIT = 10
+
+# Описание достижения, которое правило предлагает выдать.
+# create=False — выдаем только если достижение заведено в каталоге.
+Award = namedtuple('Award', ['name', 'defaults', 'emoji', 'counts_for_quest', 'create'])
+
+
+def _award(name, defaults, emoji='🏆', counts_for_quest=False, create=True):
+    return Award(name, defaults, emoji, counts_for_quest, create)
+
+
+_rules = {event: [] for event in ALL_EVENTS}
+
+
+def rule(*events):
+    """Регистрирует правило для перечисленных событий"""
+    def decorator(func):
+        for event in events:
+            _rules[event].append(func)
+        return func
+    return decorator
+
+
+def _earned_cache_key(user_id):
+    return f'achievements:earned:{user_id}'
+
+
+def _recent_cache_key(user_id):
+    return f'achievements:recent:{user_id}'
+
+
+def forget_earned_achievements(user):
+    """Сбрасывает кеш полученных достижений (например, при сбросе прогресса)"""
+    cache.delete_many([_earned_cache_key(user.pk), _recent_cache_key(user.pk)])
+
+
+def get_recent_achievements(user):
+    """
+    Последние полученные достижения и их общее число (для мобильного меню).
+
+    Кешируется на пользователя и сбрасывается при выдаче достижения.
+    """
+    key = _recent_cache_key(user.pk)
+    recent = cache.get(key)
+    if recent is None:
+        user_achievements = UserAchievement.objects.filter(
+            user=user
+        ).select_related('achievement').order_by('-earned_at')[:RECENT_LIMIT]
+        recent = {
+            'achievements': [
+                {'achievement': ua.achievement, 'earned_at': ua.earned_at}
+                for ua in user_achievements
+            ],
+            'count': UserAchievement.objects.filter(user=user).count(),
+        }
+        cache.set(key, recent, EARNED_CACHE_TIMEOUT)
+    return recent
+
+
+class UserStats:
+    """Ленивый снимок статистики пользователя для правил"""
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def completed_by_topic(self):
+        return dict(
+            UserTopicProgress.objects.filter(user=self.user).values_list('topic_id', 'completed_count')
+        )
+
+    @cached_property
+    def total_completed(self):
+        return sum(self.completed_by_topic.values())
+
+    @cached_property
+    def has_answered(self):
+        """Есть хотя бы одна попытка прохождения (не обязательно успешная)"""
+        return UserLevelProgress.objects.filter(user=self.user).exists()
+
+    @property
+    def points(self):
+        return self.user.points
+
+    @cached_property
+    def streak(self):
+        return Streak.objects.filter(user=self.user).values_list('current_streak', flat=True).first() or 0
+
+    @cached_property
+    def earned(self):
+        """Названия уже полученных достижений (кешируются между запросами)"""
+        key = _earned_cache_key(self.user.pk)
+        names = cache.get(key)
+        if names is None:
+            names = set(
+                UserAchievement.objects.filter(user=self.user).values_list('achievement__name', flat=True)
+            )
+            cache.set(key, names, EARNED_CACHE_TIMEOUT)
+        return names
+
+    def remember_earned(self, names):
+        self.earned.update(names)
+        cache.set(_earned_cache_key(self.user.pk), self.earned, EARNED_CACHE_TIMEOUT)
+
+
+# --- Правила ---
+
+@rule(ANSWER_RECORDED, LEVEL_COMPLETED)
+def first_steps(stats):
+    # «Ответили на первый вопрос»: засчитывается любая попытка, не только прохождение
+    if "Первые шаги" not in stats.earned and stats.has_answered:
+        yield _award("Первые шаги", {}, create=False)
+
+
+@rule(LEVEL_COMPLETED)
+def topic_masters(stats):
+    catalog = get_catalog()
+    for topic_id, completed in stats.completed_by_topic.items():
+        topic = catalog.topics_by_id.get(topic_id)
+        total = catalog.get_level_count(topic_id)
+        if topic is not None and total > 0 and completed >= total:
+            yield _award(
+                f"Мастер {topic.name}",
+                {
+                    "description": f"Пройдены все уровни по теме «{topic.name}»",
+                    "icon": "fa-trophy",
+                    "rarity": "common"
+                },
+                counts_for_quest=True
+            )
+
+
+@rule(LEVEL_COMPLETED)
+def explorer(stats):
+    for milestone in [10, 25, 50, 100]:
+        if stats.total_completed >= milestone:
+            yield _award(f"Исследователь {milestone}", {"description": f"Пройдено {milestone} уровней"}, emoji='🎯')
+
+
+@rule(POINTS_CHANGED)
+def rich(stats):
+    for milestone in [500, 1000, 2500, 5000]:
+        if stats.points >= milestone:
+            yield _award(f"Богач {milestone}", {"description": f"Заработано {milestone} очков"}, emoji='💰')
+
+
+@rule(STREAK_CHANGED)
+def persistence(stats):
+    for milestone in [7, 14, 30, 100]:
+        if stats.streak >= milestone:
+            yield _award(f"Постоянство {milestone}", {"description": f"Серия в {milestone} дней"}, emoji='🔥')
+
+
+@rule(ACHIEVEMENT_EARNED)
+def collector(stats):
+    for milestone in [5, 10, 20, 50]:
+        if len(stats.earned) >= milestone:
+            yield _award(
+                f"Коллекционер {milestone}",
+                {"description": f"Получено {milestone} достижений"},
+                counts_for_quest=True
+            )
+
+
+# --- Выдача ---
+
+def _resolve_achievements(awards):
+    """Находит Achievement для наград, создавая недостающие одним запросом"""
+    catalog = get_catalog()
+    resolved = {}
+    missing = []
+    for award in awards:
+        achievement = catalog.get_achievement(award.name)
+        if achievement is not None:
+            resolved[award.name] = achievement
+        elif award.create:
+            missing.append(Achievement(name=award.name, **award.defaults))
+
+    if missing:
+        Achievement.objects.bulk_create(missing, ignore_conflicts=True)
+        # bulk_create не шлет post_save — сбрасываем каталог вручную после фиксации
+        transaction.on_commit(bump_catalog_version)
+        for achievement in Achievement.objects.filter(name__in=[a.name for a in missing]):
+            resolved[achievement.name] = achievement
+    return resolved
+
+
+def _grant(user, stats, awards):
+    resolved = _resolve_achievements(awards)
+    awards = [award for award in awards if award.name in resolved]
+    if not awards:
+        return []
+
+    # Строки вставляются по одной: награду и уведомление получает только тот
+    # запрос, чья вставка прошла. Параллельный запрос с тем же достижением
+    # упирается в unique_together и ничего не начисляет повторно
+    granted = []
+    for award in awards:
+        try:
+            with transaction.atomic():
+                UserAchievement.objects.create(user=user, achievement=resolved[award.name])
+        except IntegrityError:
+            continue
+        granted.append(award)
+    stats.remember_earned(award.name for award in awards)
+    if not granted:
+        return []
+
+    cache.delete(_recent_cache_key(user.pk))
+    mark_leaderboard_dirty(user)
+
+    notify(user, *(f"{award.emoji} Получено достижение: {award.name}" for award in granted))
+
+    quest_awards = sum(1 for award in granted if award.counts_for_quest)
+    if quest_awards:
+        update_daily_quest_progress(user, 'achievements_earned', quest_awards)
+
+    return [resolved[award.name] for award in granted]
+
+
+def _sync_level_number(user):
+    """Повышает номер уровня пользователя, если очков стало достаточно"""
+    old_level = user.level_number
+    new_level = user.get_level_number()
+    if new_level > old_level:
+        user.level_number = new_level
+        user._meta.model.objects.filter(pk=user.pk).update(level_number=new_level)
+        notify(user, f"🎉 Поздравляем! Вы достигли {user.get_level_title()} (уровень {new_level})!")
+
+
+def dispatch(user, *events):
+    """
+    Обрабатывает события пользователя и выдает новые достижения.
+
+    Возвращает список словарей с данными новых достижений для показа.
+    """
+    stats = UserStats(user)
+    new_achievements = []
+    pending = set(events)
+
+    while pending:
+        rules = []
+        for event in ALL_EVENTS:
+            if event in pending:
+                rules.extend(r for r in _rules[event] if r not in rules)
+        pending = set()
+
+        candidates = {}
+        for rule_func in rules:
+            for award in rule_func(stats):
+                if award.name not in stats.earned:
+                    candidates.setdefault(award.name, award)
+        if not candidates:
+            break
+
+        granted = _grant(user, stats, list(candidates.values()))
+        if granted:
+            new_achievements.extend(granted)
+            pending.add(ACHIEVEMENT_EARNED)
+
+    if POINTS_CHANGED in events:
+        _sync_level_number(user)
+
+    return [
+        {
+            'name': achievement.name,
+            'description': achievement.description,
+            'icon': achievement.icon,
+            'rarity': achievement.rarity,
+            'rarity_display': achievement.get_rarity_display()
+        }
+        for achievement in new_achievements
+    ]
+
+
+def check_all(user):
+    """Полная проверка всех правил (для пересчета и обратной совместимости)"""
+    return dispatch(user, *ALL_EVENTS)
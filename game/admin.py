@@ -3,9 +3,9 @@ from django.utils.html import format_html
 from django.forms import Textarea
 from django.db import models
 from .models import (
-    Topic, Level, LevelOption, UserLevelProgress, Achievement, 
+    Topic, Level, LevelOption, UserLevelProgress, UserTopicProgress, Achievement, 
     UserAchievement, Streak, Notification, Hint, Article, 
-    AvatarItem, Leaderboard, DailyQuest, UserDailyProgress
+    AvatarItem, Leaderboard, DailyQuest, UserDailyProgress, QuizAttempt
 )
 
 @admin.register(Topic)
@@ -72,6 +72,20 @@ class UserLevelProgressAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'level__title']
     readonly_fields = ['completion_time', 'best_time']
 
+@admin.register(QuizAttempt)
+class QuizAttemptAdmin(admin.ModelAdmin):
+    list_display = ['user', 'level', 'started_at', 'updated_at', 'finished_at']
+    list_filter = ['level__topic']
+    search_fields = ['user__username', 'level__title']
+    readonly_fields = ['started_at', 'updated_at']
+
+@admin.register(UserTopicProgress)
+class UserTopicProgressAdmin(admin.ModelAdmin):
+    list_display = ['user', 'topic', 'completed_count', 'high_score_count', 'best_score_sum', 'updated_at']
+    list_filter = ['topic__main_category']
+    search_fields = ['user__username', 'topic__name']
+    readonly_fields = ['updated_at']
+
 @admin.register(Achievement)
 class AchievementAdmin(admin.ModelAdmin):
     list_display = ['name', 'description', 'category']
@@ -0,0 +1,131 @@
+"""
+Скомпилированные ключи ответов уровней
+
+Проверка ответа раньше каждый раз обходила level.content: разбирала JSON
+из строки, собирала списки правильных индексов, приводила ответы к
+нижнему регистру. Теперь content уровня один раз компилируется в
+неизменяемый ключ (frozenset правильных индексов, нормализованные
+строки, отсортированные пары сопоставлений, числовые допуски), и проверка
+сводится к поиску в ключе и сравнению множеств.
+
+Ключи хранятся в памяти worker'а по id уровня вместе с хешем content.
+Пока версия каталога не меняется (см. game/catalog.py), ключ отдается
+без проверок; после смены версии хеш content пересчитывается и ключ
+компилируется заново, только если content действительно изменился.
+"""
+import hashlib
+import json
+from collections import namedtuple
+from types import MappingProxyType
+
+from .catalog import get_catalog_version
+
+AnswerKey = namedtuple('AnswerKey', ['level_id', 'content_hash', 'type', 'data'])
+
+# Вопрос викторины с JSON-контентом
+QuestionKey = namedtuple('QuestionKey', ['type', 'option_count', 'correct', 'matches', 'order'])
+
+QuestKey = namedtuple('QuestKey', ['steps', 'total_steps'])
+StoryKey = namedtuple('StoryKey', ['choices'])
+PuzzleKey = namedtuple('PuzzleKey', ['answers'])
+ScenarioKey = namedtuple('ScenarioKey', ['correct'])
+CalculationKey = namedtuple('CalculationKey', ['problems'])
+MatchingKey = namedtuple('MatchingKey', ['matches'])
+SortingKey = namedtuple('SortingKey', ['order'])
+SimulationKey = namedtuple('SimulationKey', ['responses'])
+
+_keys = {}
+
+
+def normalize_answer(text):
+    return str(text).lower().strip()
+
+
+def sorted_pairs(pairs):
+    return tuple(sorted(tuple(pair) for pair in pairs))
+
+
+def load_content(content):
+    """content уровня как dict (старые уровни хранят JSON строкой)"""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            content = {}
+    return content if isinstance(content, dict) else {}
+
+
+def content_hash(content):
+    raw = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def compile_question(question):
+    options = question.get('options', [])
+    return QuestionKey(
+        type=question.get('type') or 'single',
+        option_count=len(options),
+        correct=frozenset(i for i, option in enumerate(options) if option.get('correct')),
+        matches=sorted_pairs(question.get('correct_matches', [])),
+        order=tuple(question.get('correct_order', [])),
+    )
+
+
+def _compile_data(level_type, content):
+    if level_type == 'quiz':
+        return tuple(compile_question(question) for question in content.get('questions', []))
+    if level_type == 'quest':
+        return QuestKey(
+            steps=MappingProxyType({
+                str(step): frozenset(normalize_answer(ans) for ans in data.get('correct_answers', []))
+                for step, data in content.get('steps', {}).items()
+            }),
+            total_steps=content.get('total_steps', 1),
+        )
+    if level_type == 'story':
+        return StoryKey(choices=MappingProxyType({
+            str(choice_id): (choice.get('is_correct', False), choice.get('consequence', ''))
+            for choice_id, choice in content.get('choices', {}).items()
+        }))
+    if level_type == 'puzzle':
+        return PuzzleKey(answers=frozenset(normalize_answer(ans) for ans in content.get('correct_answers', [])))
+    if level_type == 'scenario':
+        return ScenarioKey(correct=content.get('correct_answer', 0))
+    if level_type == 'calculation':
+        return CalculationKey(problems=tuple(
+            (question.get('correct_answer', 0), question.get('tolerance', 0))
+            for question in content.get('questions', [])
+        ))
+    if level_type == 'matching':
+        return MatchingKey(matches=sorted_pairs(content.get('correct_matches', [])))
+    if level_type == 'sorting':
+        return SortingKey(order=tuple(content.get('correct_order', [])))
+    if level_type == 'simulation':
+        dialogue = content.get('dialogue', [])
+        responses = dialogue[0].get('responses', []) if dialogue else []
+        return SimulationKey(responses=tuple(
+            (response.get('result') == 'win', response.get('message', '')) for response in responses
+        ))
+    return None
+
+
+def get_answer_key(level):
+    """Ключ ответов уровня из кеша worker'а (компилируется при первом обращении)"""
+    version = get_catalog_version()
+    entry = _keys.get(level.pk)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    content = load_content(level.content)
+    digest = content_hash(content)
+    if entry is not None and entry[1].content_hash == digest and entry[1].type == level.type:
+        key = entry[1]
+    else:
+        key = AnswerKey(level.pk, digest, level.type, _compile_data(level.type, content))
+    _keys[level.pk] = (version, key)
+    return key
+
+
+def clear_answer_keys():
+    """Сбрасывает ключи текущего worker'а (для тестов)"""
+    _keys.clear()
@@ -0,0 +1,233 @@
+"""
+Потоковый импорт статей из JSON
+
+Файл статей имеет вид
+    {"articles": {<категория>: {"name": ..., "subcategories": {
+        <подкатегория>: {"name": <название темы>, "articles": [{...}, ...]}}}}}
+
+iter_articles() читает его кусками (json_stream) и разбирает по одной
+статье за раз, поэтому память ограничена размером одной статьи и одной
+пачки, а не всего файла.
+
+import_articles() сопоставляет темы по заранее загруженному словарю
+name → id (один запрос), ищет существующие статьи по названию одним
+запросом на пачку и пишет пачку через bulk_create / bulk_update.
+Очистка и сборка HTML статьи (render_article) — чистый CPU, ее можно
+распараллелить по процессам (workers > 1).
+"""
+import multiprocessing
+from collections import namedtuple, Counter
+from html import escape
+from html.parser import HTMLParser
+from itertools import islice
+
+from django.db import transaction
+
+from .json_stream import READ_SIZE, JsonStream
+from .models import Article, Topic
+from .search import index_objects
+
+ArticleRow = namedtuple('ArticleRow', ['topic_name', 'title', 'content'])
+ImportStats = namedtuple('ImportStats', ['processed', 'created', 'updated', 'unchanged', 'skipped', 'missing_topics'])
+
+# Теги, которые удаляются вместе с содержимым, и теги, которые просто выбрасываются
+DROP_WITH_CONTENT = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript', 'frameset'}
+DROP_TAGS = {'link', 'meta', 'base', 'frame', 'form', 'input', 'button', 'textarea', 'select'}
+URL_ATTRS = {'href', 'src', 'xlink:href', 'action', 'formaction', 'background', 'poster'}
+UNSAFE_SCHEMES = ('javascript:', 'vbscript:', 'data:')
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts = []
+        self.skipping = 0
+
+    def _tag(self, tag, attrs, closed):
+        if self.skipping or tag in DROP_TAGS:
+            return
+        safe = [
+            (name, value) for name, value in attrs
+            if not name.startswith('on') and not (
+                name in URL_ATTRS and value
+                and ''.join(value.split()).lower().startswith(UNSAFE_SCHEMES)
+            )
+        ]
+        if len(safe) == len(attrs):
+            # Чистый тег отдаем как был (сохраняется регистр атрибутов SVG: viewBox и т.п.)
+            self.parts.append(self.get_starttag_text())
+            return
+        rendered = ''.join(
+            f' {name}' if value is None else f' {name}="{escape(value)}"' for name, value in safe
+        )
+        self.parts.append(f"<{tag}{rendered}{' /' if closed else ''}>")
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_WITH_CONTENT:
+            self.skipping += 1
+            return
+        self._tag(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in DROP_WITH_CONTENT:
+            self._tag(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_WITH_CONTENT:
+            self.skipping = max(0, self.skipping - 1)
+        elif not self.skipping and tag not in DROP_TAGS:
+            self.parts.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        if not self.skipping:
+            self.parts.append(f'&{name};')
+
+    def handle_charref(self, name):
+        if not self.skipping:
+            self.parts.append(f'&#{name};')
+
+
+def sanitize_html(html):
+    """Убирает из HTML статьи скрипты, обработчики on* и ссылки javascript:/data:"""
+    parser = _Sanitizer()
+    parser.feed(html or '')
+    parser.close()
+    return ''.join(parser.parts)
+
+
+def render_article(item):
+    """(название темы, данные статьи из JSON) → ArticleRow с итоговым content"""
+    topic_name, data = item
+    content = f"""
+{escape(data.get('summary', ''), quote=False)}
+
+{sanitize_html(data.get('content', ''))}
+
+---
+Теги: {escape(', '.join(data.get('tags', [])), quote=False)}
+Сложность: {escape(str(data.get('difficulty', '')), quote=False)}
+Время чтения: {escape(str(data.get('reading_time', '')), quote=False)}
+Автор: {escape(str(data.get('author', '')), quote=False)}
+"""
+    return ArticleRow(topic_name, data['title'][:200], content.strip())
+
+
+def _subcategory(stream):
+    name = None
+    pending = []
+    for key in stream.keys():
+        if key == 'name':
+            name = stream.value()
+            yield from ((name, article) for article in pending)
+            pending = []
+        elif key == 'articles':
+            for _ in stream.items():
+                article = stream.value()
+                if name is None:
+                    # Название темы идет после статей — придется подержать их в памяти
+                    pending.append(article)
+                else:
+                    yield name, article
+        else:
+            stream.value()
+    yield from ((None, article) for article in pending)
+
+
+def iter_articles(fp, read_size=READ_SIZE):
+    """Пары (название темы, данные статьи) из файла, без загрузки его целиком"""
+    stream = JsonStream(fp, read_size)
+    for key in stream.keys():
+        if key != 'articles':
+            stream.value()
+            continue
+        for _ in stream.keys():
+            for category_key in stream.keys():
+                if category_key != 'subcategories':
+                    stream.value()
+                    continue
+                for _ in stream.keys():
+                    yield from _subcategory(stream)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _write_chunk(rows, topic_ids, stats, missing):
+    by_title = {}
+    for row in rows:
+        topic_id = topic_ids.get(row.topic_name)
+        if topic_id is None:
+            stats['skipped'] += 1
+            missing.add(row.topic_name)
+            continue
+        # Повтор названия в файле: побеждает последняя версия, как при последовательном импорте
+        by_title[row.title] = (topic_id, row.content)
+
+    existing = {}
+    for article in Article.objects.filter(title__in=list(by_title)).order_by('-id'):
+        # При дубликатах в БД обновляется самая ранняя статья (как get_or_create по title)
+        existing[article.title] = article
+
+    create, update = [], []
+    for title, (topic_id, content) in by_title.items():
+        article = existing.get(title)
+        if article is None:
+            create.append(Article(title=title, topic_id=topic_id, content=content))
+        elif article.topic_id != topic_id or article.content != content:
+            article.topic_id = topic_id
+            article.content = content
+            update.append(article)
+        else:
+            stats['unchanged'] += 1
+
+    with transaction.atomic():
+        Article.objects.bulk_create(create)
+        if update:
+            Article.objects.bulk_update(update, ['topic', 'content'])
+        # bulk-операции не отправляют сигналы — индекс обновляем сами
+        index_objects(create + update)
+    stats['created'] += len(create)
+    stats['updated'] += len(update)
+    stats['processed'] += len(rows)
+
+
+def import_articles(fp, chunk_size=500, workers=1, progress=None, read_size=READ_SIZE):
+    """
+    Импортирует статьи из открытого файла пачками по chunk_size.
+    Статьи сопоставляются с существующими по названию: новые создаются,
+    измененные (тема или текст) обновляются. progress(stats) вызывается
+    после каждой пачки. Возвращает ImportStats.
+    """
+    topic_ids = dict(Topic.objects.values_list('name', 'id'))
+    stats = Counter()
+    missing = set()
+    articles = iter_articles(fp, read_size)
+
+    pool = multiprocessing.get_context('fork').Pool(workers) if workers > 1 else None
+    try:
+        for chunk in _chunks(articles, chunk_size):
+            # map по пачке, а не imap по всему потоку: Pool вычитывает входной итератор
+            # целиком, и память перестала бы быть ограниченной
+            rows = pool.map(render_article, chunk) if pool else [render_article(item) for item in chunk]
+            _write_chunk(rows, topic_ids, stats, missing)
+            if progress is not None:
+                progress(_stats(stats, missing))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return _stats(stats, missing)
+
+
+def _stats(stats, missing):
+    return ImportStats(
+        stats['processed'], stats['created'], stats['updated'], stats['unchanged'], stats['skipped'],
+        sorted(missing, key=str),
+    )
@@ -0,0 +1,144 @@
+"""
+Кеш каталога контента (темы, уровни, подсказки, достижения)
+
+Каталог меняется только при редактировании контента, поэтому каждый
+worker держит у себя готовый read-only снимок и перестраивает его только
+когда меняется версия каталога. Версия хранится в кеше Django и
+увеличивается после фиксации транзакции, изменившей контент (сигналы
+post_save/post_delete в game/signals.py, массовые загрузки).
+
+Изменения видны всем worker'ам только при общем кеше (REDIS_URL, см.
+CACHES в settings). С LocMemCache по умолчанию версия живет в своем
+процессе: каталог сбрасывается только в том worker'е, где изменили
+контент, — годится для разработки и запуска с одним worker'ом.
+"""
+import copy
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import Topic, Level, Hint, Achievement
+
+CATALOG_VERSION_KEY = 'game:catalog_version'
+
+# Краткое описание уровня без тяжелого поля content
+LevelSummary = namedtuple('LevelSummary', [
+    'id', 'topic_id', 'title', 'type', 'difficulty',
+    'order_in_topic', 'reward_points', 'reward_coins',
+])
+
+
+class Catalog:
+    """Неизменяемый снимок каталога контента"""
+
+    def __init__(self, version):
+        self.version = version
+
+        self._topics = list(Topic.objects.all())
+        self.topics_by_id = {topic.id: topic for topic in self._topics}
+        self.children = {}
+        for topic in self._topics:
+            if topic.parent_category_id is not None:
+                self.children.setdefault(topic.parent_category_id, []).append(topic)
+
+        self.levels_by_topic = {}
+        self.levels_by_id = {}
+        levels = Level.objects.order_by('topic_id', 'order_in_topic', 'id').values_list(*LevelSummary._fields)
+        for row in levels:
+            level = LevelSummary(*row)
+            self.levels_by_topic.setdefault(level.topic_id, []).append(level)
+            self.levels_by_id[level.id] = level
+        self.level_counts = {topic_id: len(items) for topic_id, items in self.levels_by_topic.items()}
+
+        # Как и раньше во view, берем первую подсказку уровня
+        self.hints = {}
+        for hint in Hint.objects.order_by('id'):
+            self.hints.setdefault(hint.level_id, hint)
+
+        self.achievements = list(Achievement.objects.all())
+        self.achievements_by_name = {a.name: a for a in self.achievements}
+
+    def get_topics(self):
+        """
+        Возвращает копии тем для текущего запроса.
+
+        Views навешивают на темы атрибуты (progress, icon), поэтому
+        отдаем поверхностные копии, чтобы не испортить общий снимок.
+        """
+        return [copy.copy(topic) for topic in self._topics]
+
+    def get_subtopics(self, parent_id):
+        """Копии подкатегорий для основной категории"""
+        return [
+            copy.copy(topic) for topic in self.children.get(parent_id, [])
+            if topic.is_subcategory
+        ]
+
+    def get_main_category(self, slug):
+        """Основная категория (не подкатегория) по slug или None"""
+        for topic in self._topics:
+            if topic.main_category == slug and not topic.is_subcategory:
+                return copy.copy(topic)
+        return None
+
+    def get_levels(self, topic_id):
+        """Упорядоченные краткие описания уровней темы"""
+        return self.levels_by_topic.get(topic_id, [])
+
+    def get_level_count(self, topic_id):
+        return self.level_counts.get(topic_id, 0)
+
+    def get_next_level(self, level):
+        """Следующий по порядку уровень в теме или None"""
+        for candidate in self.levels_by_topic.get(level.topic_id, []):
+            if candidate.order_in_topic > level.order_in_topic:
+                return candidate
+        return None
+
+    def get_hint(self, level_id):
+        return self.hints.get(level_id)
+
+    def get_achievement(self, name):
+        return self.achievements_by_name.get(name)
+
+
+_lock = threading.Lock()
+_catalog = None
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Кеш пуст (перезапуск/вытеснение) — начинаем новую версию,
+        # чтобы ни один worker не использовал старый снимок
+        version = time.time_ns()
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Помечает каталог устаревшим во всех worker'ах, разделяющих кеш"""
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def get_catalog():
+    """Возвращает актуальный снимок каталога, перестраивая его при смене версии"""
+    global _catalog
+    version = get_catalog_version()
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _lock:
+        if _catalog is None or _catalog.version != version:
+            _catalog = Catalog(version)
+        return _catalog
+
+
+def invalidate_catalog():
+    """Сбрасывает локальный снимок и версию (для тестов и команд загрузки)"""
+    global _catalog
+    _catalog = None
+    bump_catalog_version()
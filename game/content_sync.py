@@ -0,0 +1,276 @@
+"""
+Синхронизация каталога контента (темы, уровни, достижения)
+
+Вместо «удалить все и создать заново» (что каскадно удаляет прогресс
+пользователей) желаемый каталог сравнивается с БД по естественным ключам:
+- тема — по name;
+- уровень — по (тема, title); переименованный уровень — по
+  (тема, order_in_topic), перенесенный в другую тему — по title;
+- достижение — по name.
+
+Достижения каталога не единственные: «Мастер <тема>» создаются во время
+работы (game/achievements.py), поэтому достижения, которых нет в описании,
+удаляются только по явному delete_achievements=True — вместе с ними
+каскадом пропадают выданные пользователям UserAchievement.
+
+plan_sync() строит план (что создать, изменить, удалить), ничего не
+записывая, — его можно показать как dry-run. apply_sync() применяет план
+одной транзакцией через bulk_create / bulk_update / delete. Сигналы
+post_save при этом не срабатывают, поэтому версия каталога поднимается
+один раз после фиксации. Сравниваются только поля, указанные в описании
+каталога; остальные поля существующих строк не трогаются.
+
+Формат каталога:
+    {
+        'topics': [{'name': ..., 'parent': <name или None>, ...поля Topic}],
+        'levels': [{'topic': <name>, 'title': ..., 'order_in_topic': ..., ...поля Level}],
+        'achievements': [{'name': ..., ...поля Achievement}],
+    }
+"""
+from collections import namedtuple
+
+from django.db import transaction
+
+from .catalog import bump_catalog_version
+from .models import Topic, Level, Achievement, UserAchievement, UserLevelProgress
+from .progress import rebuild_topic_progress
+from .search import index_objects
+
+ModelPlan = namedtuple('ModelPlan', ['create', 'update', 'delete', 'fields'])
+SyncPlan = namedtuple('SyncPlan', ['topics', 'levels', 'achievements', 'moved_levels', 'orphaned_progress'])
+
+
+class CatalogError(ValueError):
+    """Описание каталога противоречиво (дубликаты ключей, ссылки на несуществующие темы)"""
+
+
+def _diff(obj, values):
+    """Переносит values в obj; возвращает список измененных полей"""
+    changed = []
+    for field, value in values.items():
+        if getattr(obj, field) != value:
+            setattr(obj, field, value)
+            changed.append(field)
+    return changed
+
+
+def _unique(items, key, what):
+    seen = set()
+    for item in items:
+        value = key(item)
+        if value in seen:
+            raise CatalogError(f"Повторяется {what}: {value}")
+        seen.add(value)
+
+
+def _plan_topics(specs, delete_missing):
+    _unique(specs, lambda spec: spec['name'], 'тема')
+    names = {spec['name'] for spec in specs}
+    for spec in specs:
+        if spec.get('parent') and spec['parent'] not in names:
+            raise CatalogError(f"Тема {spec['name']}: нет родительской темы {spec['parent']}")
+
+    existing = {topic.name: topic for topic in Topic.objects.select_related('parent_category')}
+    fields = set()
+    create, update = [], []
+    for spec in specs:
+        values = {key: value for key, value in spec.items() if key != 'parent'}
+        fields.update(values)
+        topic = existing.get(spec['name'])
+        if topic is None:
+            create.append((Topic(**values), spec.get('parent')))
+            continue
+        changed = _diff(topic, values)
+        # Родитель сверяется по имени: у новой родительской темы еще нет pk
+        parent = topic.parent_category.name if topic.parent_category_id else None
+        if 'parent' in spec and parent != spec['parent']:
+            changed.append('parent_category')
+        if changed:
+            update.append((topic, spec.get('parent')))
+    delete = [topic for name, topic in existing.items() if name not in names] if delete_missing else []
+    return ModelPlan(create, update, delete, sorted(fields - {'name'}) + ['parent_category'])
+
+
+def _plan_levels(specs, topic_names, delete_missing):
+    _unique(specs, lambda spec: (spec['topic'], spec['title']), 'уровень')
+    for spec in specs:
+        if spec['topic'] not in topic_names:
+            raise CatalogError(f"Уровень {spec['title']}: нет темы {spec['topic']}")
+
+    existing = list(Level.objects.select_related('topic'))
+    by_title = {(level.topic.name, level.title): level for level in existing}
+    matched = set()
+    pending = []
+    for spec in specs:
+        level = by_title.get((spec['topic'], spec['title']))
+        if level is not None:
+            matched.add(level.pk)
+        pending.append((spec, level))
+
+    # Уровни, не найденные по названию, ищем по порядку в теме (переименование),
+    # затем по одному названию (перенос в другую тему, если название однозначно)
+    unmatched = [level for level in existing if level.pk not in matched]
+    by_order = {(level.topic.name, level.order_in_topic): level for level in unmatched}
+    titles = {}
+    for level in unmatched:
+        titles.setdefault(level.title, []).append(level)
+    fields = set()
+    create, update = [], []
+    moved = 0
+    for spec, level in pending:
+        values = {key: value for key, value in spec.items() if key != 'topic'}
+        fields.update(values)
+        if level is None:
+            level = by_order.get((spec['topic'], spec.get('order_in_topic')))
+            if level is None and len(titles.get(spec['title'], [])) == 1:
+                level = titles[spec['title']][0]
+            if level is not None and level.pk in matched:
+                level = None
+            if level is not None:
+                matched.add(level.pk)
+        if level is None:
+            create.append((Level(**values), spec['topic']))
+            continue
+        changed = _diff(level, values)
+        if level.topic.name != spec['topic']:
+            changed.append('topic')
+            moved += 1
+        if changed:
+            update.append((level, spec['topic']))
+    delete = [level for level in existing if level.pk not in matched] if delete_missing else []
+    return ModelPlan(create, update, delete, sorted(fields) + ['topic']), moved
+
+
+def _plan_achievements(specs, delete_missing):
+    _unique(specs, lambda spec: spec['name'], 'достижение')
+    existing = {achievement.name: achievement for achievement in Achievement.objects.all()}
+    fields = set()
+    create, update = [], []
+    for spec in specs:
+        fields.update(spec)
+        achievement = existing.get(spec['name'])
+        if achievement is None:
+            create.append(Achievement(**spec))
+        elif _diff(achievement, spec):
+            update.append(achievement)
+    names = {spec['name'] for spec in specs}
+    delete = [a for name, a in existing.items() if name not in names] if delete_missing else []
+    return ModelPlan(create, update, delete, sorted(fields - {'name'}))
+
+
+def plan_sync(catalog, delete_missing=True, delete_achievements=False):
+    """
+    План синхронизации каталога с БД (в БД ничего не записывается).
+    delete_missing удаляет отсутствующие в описании темы и уровни,
+    delete_achievements — достижения.
+    """
+    topic_specs = catalog.get('topics', [])
+    topics = _plan_topics(topic_specs, delete_missing)
+    topic_names = {spec['name'] for spec in topic_specs} | set(
+        Topic.objects.values_list('name', flat=True)
+    ) - {topic.name for topic in topics.delete}
+    levels, moved = _plan_levels(catalog.get('levels', []), topic_names, delete_missing)
+    achievements = _plan_achievements(catalog.get('achievements', []), delete_achievements)
+
+    # Прогресс, который пропадет вместе с удаляемыми уровнями, темами и достижениями
+    deleted_levels = Level.objects.filter(pk__in=[level.pk for level in levels.delete])
+    deleted_topics = [topic.pk for topic in topics.delete]
+    orphaned = UserLevelProgress.objects.filter(level__in=deleted_levels).count()
+    if deleted_topics:
+        kept = [level.pk for level, _ in levels.update]
+        orphaned += UserLevelProgress.objects.filter(level__topic_id__in=deleted_topics).exclude(
+            level__in=deleted_levels
+        ).exclude(level_id__in=kept).count()
+    if achievements.delete:
+        orphaned += UserAchievement.objects.filter(
+            achievement_id__in=[achievement.pk for achievement in achievements.delete]
+        ).count()
+    return SyncPlan(topics, levels, achievements, moved, orphaned)
+
+
+def has_changes(plan):
+    return any(
+        model_plan.create or model_plan.update or model_plan.delete
+        for model_plan in (plan.topics, plan.levels, plan.achievements)
+    )
+
+
+def describe_plan(plan):
+    """Строки отчета о плане (для dry-run и логов)"""
+    lines = []
+    for title, model_plan, label in (
+        ('Темы', plan.topics, lambda item: item[0].name),
+        ('Уровни', plan.levels, lambda item: f'{item[1]} / {item[0].title}'),
+        ('Достижения', plan.achievements, lambda item: item.name),
+    ):
+        lines.append(
+            f'{title}: создать {len(model_plan.create)}, изменить {len(model_plan.update)}, '
+            f'удалить {len(model_plan.delete)}'
+        )
+        lines.extend(f'  + {label(item)}' for item in model_plan.create)
+        lines.extend(f'  ~ {label(item)}' for item in model_plan.update)
+    for topic in plan.topics.delete:
+        lines.append(f'  - тема {topic.name}')
+    for level in plan.levels.delete:
+        lines.append(f'  - уровень {level.topic.name} / {level.title}')
+    for achievement in plan.achievements.delete:
+        lines.append(f'  - достижение {achievement.name}')
+    if plan.moved_levels:
+        lines.append(f'Уровней переносится в другие темы: {plan.moved_levels}')
+    if plan.orphaned_progress:
+        lines.append(f'Будет удалено записей прогресса пользователей: {plan.orphaned_progress}')
+    return lines
+
+
+def apply_sync(plan, batch_size=500):
+    """Применяет план одной транзакцией"""
+    with transaction.atomic():
+        Topic.objects.bulk_create([topic for topic, _ in plan.topics.create], batch_size=batch_size)
+        topics = {topic.name: topic for topic in Topic.objects.all()}
+
+        # Родители проставляются после создания: у новых тем теперь есть pk
+        parented = []
+        for topic, parent in plan.topics.create + plan.topics.update:
+            topic = topics[topic.name] if topic.pk is None else topic
+            topic.parent_category = topics[parent] if parent else None
+            parented.append(topic)
+        updated_topics = [topic for topic, _ in plan.topics.update]
+        if updated_topics:
+            Topic.objects.bulk_update(updated_topics, plan.topics.fields, batch_size=batch_size)
+        created_with_parent = [topic for topic in parented if topic.parent_category_id and topic not in updated_topics]
+        if created_with_parent:
+            Topic.objects.bulk_update(created_with_parent, ['parent_category'], batch_size=batch_size)
+
+        for level, topic_name in plan.levels.create + plan.levels.update:
+            level.topic = topics[topic_name]
+        Level.objects.bulk_create([level for level, _ in plan.levels.create], batch_size=batch_size)
+        if plan.levels.update:
+            Level.objects.bulk_update(
+                [level for level, _ in plan.levels.update], plan.levels.fields, batch_size=batch_size
+            )
+
+        # bulk-операции не отправляют сигналы; удаления ниже индекс обрабатывает сам
+        index_objects(parented + [level for level, _ in plan.levels.create + plan.levels.update])
+
+        # Удаляем последними: уровни и подтемы, перенесенные из удаляемых тем,
+        # к этому моменту уже не ссылаются на них и не удалятся каскадом
+        Level.objects.filter(pk__in=[level.pk for level in plan.levels.delete]).delete()
+        Topic.objects.filter(pk__in=[topic.pk for topic in plan.topics.delete]).delete()
+        Achievement.objects.filter(pk__in=[a.pk for a in plan.achievements.delete]).delete()
+
+        Achievement.objects.bulk_create(plan.achievements.create, batch_size=batch_size)
+        if plan.achievements.update:
+            Achievement.objects.bulk_update(plan.achievements.update, plan.achievements.fields, batch_size=batch_size)
+
+        # Счетчики тем зависят от состава уровней: пересчитываем, только если он поменялся
+        if plan.levels.delete or plan.topics.delete or plan.moved_levels:
+            rebuild_topic_progress()
+        transaction.on_commit(bump_catalog_version)
+
+
+def sync_catalog(catalog, delete_missing=True, delete_achievements=False, dry_run=False):
+    """Сравнивает каталог с БД и (если не dry_run) применяет изменения; возвращает план"""
+    plan = plan_sync(catalog, delete_missing=delete_missing, delete_achievements=delete_achievements)
+    if not dry_run and has_changes(plan):
+        apply_sync(plan)
+    return plan
@@ -1,22 +1,71 @@
-from .models import Notification, Achievement, UserAchievement
+import logging
+from functools import wraps
 
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from .achievements import get_recent_achievements
+from .db_optimization import QueryCounter
+from .notifications import get_unread_count
+
+logger = logging.getLogger(__name__)
+
+
+def _count_queries(request, name, func, *args):
+    """
+    Выполняет func и, если включен CONTEXT_PROCESSOR_PROFILING, записывает
+    число запросов к БД в request.context_processor_queries и в лог
+    """
+    if not getattr(settings, 'CONTEXT_PROCESSOR_PROFILING', False):
+        return func(*args)
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        result = func(*args)
+    costs = request.__dict__.setdefault('context_processor_queries', {})
+    costs[name] = costs.get(name, 0) + counter.count
+    match = getattr(request, 'resolver_match', None)
+    logger.info(
+        "Контекст-процессор %s: %d запросов (%s)",
+        name, counter.count, match.view_name if match else request.path
+    )
+    return result
+
+
+def profiled(processor):
+    """Учитывает запросы, сделанные контекст-процессором при вызове"""
+    @wraps(processor)
+    def wrapper(request):
+        return _count_queries(request, processor.__name__, processor, request)
+    return wrapper
+
+
+def lazy(request, name, func):
+    """
+    Значение контекста, которое вычисляется только при чтении из шаблона.
+    Запросы при вычислении учитываются за контекст-процессором name.
+    """
+    return SimpleLazyObject(lambda: _count_queries(request, name, func))
+
+
+@profiled
 def notifications_context(request):
     """Добавляет количество непрочитанных уведомлений в контекст всех шаблонов"""
     try:
         if request.user.is_authenticated:
+            user = request.user
             return {
-                'unread_notifications_count': Notification.objects.filter(
-                    user=request.user, 
-                    is_read=False
-                ).count()
+                'unread_notifications_count': lazy(
+                    request, 'notifications_context', lambda: get_unread_count(user)
+                )
             }
     except Exception:
         # В случае ошибки возвращаем 0, чтобы не ломать шаблоны
         pass
     return {'unread_notifications_count': 0}
 
-def mobile_view_context(request):
-    """Автоматически определяет мобильное устройство по User-Agent"""
+def is_mobile_request(request):
+    """Мобильное ли устройство: по User-Agent или принудительно из сессии"""
     user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
     
     # Список ключевых слов для определения мобильных устройств
@@ -33,30 +82,30 @@ def mobile_view_context(request):
     if 'force_mobile_view' in request.session:
         is_mobile = request.session['force_mobile_view']
     
+    return is_mobile
+
+
+def mobile_view_context(request):
+    """Автоматически определяет мобильное устройство по User-Agent"""
     return {
-        'mobile_view': is_mobile
+        'mobile_view': is_mobile_request(request)
     }
 
+@profiled
 def achievements_context(request):
-    """Добавляет достижения пользователя в контекст всех шаблонов (для мобильного меню)"""
+    """
+    Добавляет достижения пользователя в контекст всех шаблонов (для мобильного меню).
+    Запросы выполняются, только если шаблон действительно читает значения,
+    а результат кешируется на пользователя (см. get_recent_achievements).
+    """
     if request.user.is_authenticated:
-        # Получаем только полученные достижения, ограничиваем до 10 последних
-        user_achievements = UserAchievement.objects.filter(
-            user=request.user
-        ).select_related('achievement').order_by('-earned_at')[:10]
-        
-        achievements_list = []
-        for ua in user_achievements:
-            achievements_list.append({
-                'achievement': ua.achievement,
-                'earned_at': ua.earned_at
-            })
-        
+        user = request.user
+        recent = lazy(request, 'achievements_context', lambda: get_recent_achievements(user))
         return {
-            'mobile_achievements': achievements_list,
-            'mobile_achievements_count': UserAchievement.objects.filter(user=request.user).count()
+            'mobile_achievements': SimpleLazyObject(lambda: recent['achievements']),
+            'mobile_achievements_count': SimpleLazyObject(lambda: recent['count']),
         }
     return {
         'mobile_achievements': [],
         'mobile_achievements_count': 0
-    }
\ No newline at end of file
+    }
@@ -1,6 +1,11 @@
 """
 Функции для оптимизации запросов к БД
 """
+import logging
+import time
+from collections import namedtuple
+from functools import wraps
+
 from django.db import connection
 from django.db.models import Prefetch, Count, Q
 from .models import (
@@ -8,6 +13,8 @@ from .models import (
     Achievement, UserAchievement, Notification
 )
 
+logger = logging.getLogger(__name__)
+
 
 def get_optimized_topics_with_progress(user):
     """
@@ -16,7 +23,7 @@ def get_optimized_topics_with_progress(user):
     """
     # 1 запрос: все темы с уровнями
     topics = Topic.objects.prefetch_related(
-        'level_set'
+        Prefetch('level_set', queryset=Level.objects.summaries())
     ).annotate(
         total_levels=Count('level_set')
     )
@@ -54,7 +61,7 @@ def get_optimized_levels_with_progress(user, topic):
     Оптимизированное получение уровней с прогрессом
     """
     # Получаем уровни с прогрессом одним запросом
-    levels = Level.objects.filter(
+    levels = Level.objects.summaries().filter(
         topic=topic
     ).select_related(
         'topic'
@@ -145,9 +152,53 @@ def bulk_create_user_progress(user, levels):
     )
 
 
+class QueryCounter:
+    """
+    Счетчик запросов и времени БД для connection.execute_wrapper.
+    В отличие от connection.queries работает и при DEBUG = False.
+    
+    Использование:
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            ...
+        print(counter.count, counter.duration)
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # секунды
+    
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+
+
+QueryBudget = namedtuple('QueryBudget', ['queries', 'db_ms'], defaults=(None, None))
+
+
+def query_budget(queries=None, db_ms=None):
+    """
+    Бюджет запросов к БД для view (проверяет QueryBudgetMiddleware).
+    
+    Использование:
+        @query_budget(queries=15, db_ms=100)
+        def my_view(request):
+            ...
+    """
+    def decorator(view):
+        view.query_budget = QueryBudget(queries, db_ms)
+        return view
+    return decorator
+
+
 def print_query_count():
     """
-    Выводит количество запросов к БД (для отладки)
+    Выводит количество запросов к БД (для отладки, только при DEBUG = True;
+    в production используйте QueryBudgetMiddleware)
     Использование:
         from game.db_optimization import print_query_count
         print_query_count()
@@ -168,27 +219,25 @@ def reset_query_count():
 # Декоратор для подсчета запросов к БД
 def count_queries(func):
     """
-    Декоратор для подсчета количества запросов к БД
+    Декоратор для подсчета количества запросов к БД (работает и без DEBUG)
     
     Использование:
         @count_queries
         def my_view(request):
             ...
     """
-    from functools import wraps
-    
     @wraps(func)
     def wrapper(*args, **kwargs):
-        reset_query_count()
-        result = func(*args, **kwargs)
-        query_count = len(connection.queries)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            result = func(*args, **kwargs)
         
-        if query_count > 10:
-            print(f"⚠️ ВНИМАНИЕ: {func.__name__} сделал {query_count} запросов к БД!")
-        else:
-            print(f"✅ {func.__name__}: {query_count} запросов к БД")
+        level = logging.WARNING if counter.count > 10 else logging.INFO
+        logger.log(
+            level, "%s: %d запросов к БД, %.1f мс",
+            func.__name__, counter.count, counter.duration * 1000
+        )
         
         return result
     
     return wrapper
-
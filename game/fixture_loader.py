@@ -0,0 +1,137 @@
+"""
+Быстрая загрузка фикстур каталога (темы, уровни, варианты ответов)
+
+loaddata читает файл целиком и сохраняет объекты по одному через save(),
+каждый раз отправляя сигналы. Здесь фикстура читается потоково
+(json_stream), поля преобразуются тем же десериализатором Django, что и
+в loaddata, внешние ключи проверяются по множествам id в памяти (id из БД
+плюс уже загруженные), а строки пишутся пачками через bulk_create /
+bulk_update. Сигналы не срабатывают, поэтому версия каталога поднимается
+один раз после фиксации транзакции, а поисковый индекс обновляется пачками.
+
+Как и в loaddata, объект с уже существующим pk обновляется.
+"""
+import os
+from collections import namedtuple
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+
+from .catalog import bump_catalog_version
+from .json_stream import READ_SIZE, iter_array
+from .models import Topic, Level, LevelOption
+from .progress import rebuild_topic_progress
+from .search import KINDS, index_objects
+
+# Порядок важен: внешние ключи проверяются по уже загруженным моделям
+FIXTURE_FILES = (
+    ('topics.json', Topic),
+    ('levels.json', Level),
+    ('level_options.json', LevelOption),
+)
+
+LoadStats = namedtuple('LoadStats', ['model', 'created', 'updated'])
+
+
+class FixtureError(ValueError):
+    """Фикстура не соответствует модели или ссылается на несуществующие объекты"""
+
+
+def _known_ids(model, ids):
+    if model not in ids:
+        ids[model] = set(model.objects.values_list('pk', flat=True))
+    return ids[model]
+
+
+def load_fixture(fp, model, ids, batch_size=2000, progress=None, read_size=READ_SIZE):
+    """
+    Загружает одну фикстуру модели model из открытого файла.
+    ids — {модель: множество известных pk}; недостающие множества читаются
+    из БД (один запрос на модель), загруженные pk добавляются.
+    """
+    label = model._meta.label_lower
+    known = _known_ids(model, ids)
+    foreign_keys = [field for field in model._meta.concrete_fields if field.many_to_one]
+    for field in foreign_keys:
+        _known_ids(field.related_model, ids)
+    fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    forward_refs = {}
+    created = updated = 0
+
+    records = iter_array(fp, read_size)
+    # Точка сохранения: при ошибке не остается частично загруженного файла
+    with transaction.atomic():
+        while chunk := list(islice(records, batch_size)):
+            for record in chunk:
+                if record.get('model') != label:
+                    raise FixtureError(f"Ожидалась модель {label}, получена {record.get('model')!r}")
+                if record.get('pk') is None:
+                    raise FixtureError(f'{label}: у каждой записи должен быть pk')
+
+            batch = {}
+            for deserialized in Deserializer(chunk):
+                obj = deserialized.object
+                for field in foreign_keys:
+                    value = getattr(obj, field.attname)
+                    if value is None or value in ids[field.related_model]:
+                        continue
+                    if field.related_model is model:
+                        # Ссылка вперед по той же фикстуре (родительская тема ниже по файлу)
+                        forward_refs[obj.pk] = (field.name, value)
+                        continue
+                    raise FixtureError(f'{label} pk={obj.pk}: {field.name}={value} не существует')
+                batch[obj.pk] = obj
+
+            create = [obj for pk, obj in batch.items() if pk not in known]
+            update = [obj for pk, obj in batch.items() if pk in known]
+            model.objects.bulk_create(create, batch_size=batch_size)
+            if update:
+                model.objects.bulk_update(update, fields, batch_size=batch_size)
+            if model._meta.model_name in KINDS:
+                index_objects(create + update)
+            known.update(batch)
+            created += len(create)
+            updated += len(update)
+            if progress is not None:
+                progress(LoadStats(label, created, updated))
+
+        for pk, (name, value) in forward_refs.items():
+            if value not in known:
+                raise FixtureError(f'{label} pk={pk}: {name}={value} не существует')
+    return LoadStats(label, created, updated)
+
+
+def load_fixture_files(directory, files=FIXTURE_FILES, clear=False, batch_size=2000, progress=None):
+    """
+    Загружает фикстуры каталога одной транзакцией.
+    Возвращает (список LoadStats, список ненайденных файлов).
+    """
+    stats, missing = [], []
+    with transaction.atomic():
+        if clear:
+            for _, model in reversed(files):
+                model.objects.all().delete()
+
+        ids = {}
+        for filename, model in files:
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                missing.append(path)
+                continue
+            with open(path, encoding='utf-8') as fp:
+                stats.append(load_fixture(fp, model, ids, batch_size=batch_size, progress=progress))
+
+        # Явные pk сдвигают последовательности (PostgreSQL), как после loaddata
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), [model for _, model in files])
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+        # Очистка удаляет прохождения, а обновленные уровни могли сменить тему
+        if clear or any(item.updated for item in stats if item.model == Level._meta.label_lower):
+            rebuild_topic_progress()
+        transaction.on_commit(bump_catalog_version)
+    return stats, missing
@@ -0,0 +1,103 @@
+"""
+Проверка ответов на вопросы викторин с JSON-контентом
+
+Одни и те же функции используются пошаговым режимом (level_play, форма
+на каждый вопрос) и пакетным (level_submit, все ответы одним JSON):
+- answer_from_post / answer_from_json приводят ответ к единому виду;
+- grade_question возвращает процент правильности ответа;
+- public_question отдает клиенту вопрос без правильных ответов.
+
+Проверка идет по скомпилированному ключу вопроса (QuestionKey из
+game/answer_keys.py), а не по сырому content.
+"""
+
+
+from .answer_keys import sorted_pairs
+
+
+class InvalidAnswer(Exception):
+    """Ответ не выбран или не соответствует вопросу"""
+
+
+def answer_from_post(key, data):
+    """Ответ на вопрос (по ключу вопроса key) из данных формы level_play"""
+    question_type = key.type
+    try:
+        if question_type == 'matching':
+            # match_<правый индекс> = <левый индекс>
+            return [
+                [int(data.get(field)), int(field.split('_')[1])]
+                for field in data.keys() if field.startswith('match_')
+            ]
+        if question_type == 'sorting':
+            # Собираем в правильном порядке (sort_0, sort_1, sort_2, ...)
+            sort_fields = sorted(
+                (field for field in data.keys() if field.startswith('sort_')),
+                key=lambda field: int(field.split('_')[1])
+            )
+            return [int(data.get(field)) for field in sort_fields]
+        if question_type == 'multiple':
+            selected = data.getlist('answers')
+            if not selected:
+                raise InvalidAnswer("Выберите хотя бы один вариант ответа!")
+            return [int(i) for i in selected]
+        selected = int(data.get('answer', -1))
+    except (TypeError, ValueError):
+        raise InvalidAnswer("Неверный вариант ответа!")
+    if selected < 0:
+        raise InvalidAnswer("Выберите вариант ответа!")
+    if selected >= key.option_count:
+        raise InvalidAnswer("Неверный вариант ответа!")
+    return selected
+
+
+def answer_from_json(key, raw):
+    """Ответ на вопрос (по ключу вопроса key) из JSON пакетной отправки"""
+    question_type = key.type
+    try:
+        if question_type == 'matching':
+            return [[int(left), int(right)] for left, right in raw]
+        if question_type in ('sorting', 'multiple'):
+            answer = [int(i) for i in raw]
+            if question_type == 'multiple' and not answer:
+                raise InvalidAnswer("Выберите хотя бы один вариант ответа!")
+            return answer
+        selected = int(raw)
+    except (TypeError, ValueError):
+        raise InvalidAnswer("Неверный формат ответа!")
+    if not 0 <= selected < key.option_count:
+        raise InvalidAnswer("Неверный вариант ответа!")
+    return selected
+
+
+def grade_question(key, answer):
+    """Процент правильности ответа на вопрос (0–100)"""
+    if key.type == 'matching':
+        return 100 if sorted_pairs(answer) == key.matches else 0
+    if key.type == 'sorting':
+        return 100 if tuple(answer) == key.order else 0
+    if key.type == 'multiple':
+        if not key.correct:
+            return 0
+        # Доля выбранных правильных вариантов от общего числа правильных
+        return len(key.correct.intersection(answer)) / len(key.correct) * 100
+    return 100 if answer in key.correct else 0
+
+
+def is_question_correct(question_type, percentage):
+    """Засчитан ли вопрос: множественный выбор — от 80%, остальные — полностью"""
+    if question_type == 'multiple':
+        return percentage >= 80
+    return percentage == 100
+
+
+def public_question(question):
+    """Вопрос для клиента без правильных ответов"""
+    hidden = {'correct_matches', 'correct_order'}
+    data = {key: value for key, value in question.items() if key not in hidden}
+    if 'options' in question:
+        data['options'] = [
+            {key: value for key, value in option.items() if key != 'correct'}
+            for option in question['options']
+        ]
+    return data
@@ -0,0 +1,95 @@
+"""
+Инкрементальное чтение больших JSON-файлов
+
+JsonStream читает файл кусками по read_size символов. Структура (объекты
+и массивы) обходится вручную через keys() / items(), а каждое значение
+декодируется целиком json.JSONDecoder.raw_decode. Память ограничена
+размером одного значения, а не всего файла.
+"""
+import json
+
+READ_SIZE = 64 * 1024
+
+
+class JsonStream:
+    """Инкрементальный разбор JSON: структура обходится вручную, значения — raw_decode"""
+
+    def __init__(self, fp, read_size=READ_SIZE):
+        self.fp = fp
+        self.read_size = read_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.fp.read(self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('Неожиданный конец JSON')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Ожидался {char!r} в позиции {self.pos}: {self.buf[self.pos:self.pos + 20]!r}')
+        self.pos += 1
+
+    def value(self):
+        """Декодирует очередное значение целиком, дочитывая файл, пока оно не поместится в буфер"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self._fill():
+                    raise
+                continue
+            # Число на границе буфера может продолжаться в следующем куске
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _items(self, close):
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == close:
+                return
+            if char != ',':
+                raise ValueError(f'Ожидался "," или {close!r} в позиции {self.pos - 1}')
+
+    def keys(self):
+        """Ключи объекта; значение каждого ключа должен прочитать вызывающий код"""
+        self.expect('{')
+        for _ in self._items('}'):
+            key = self.value()
+            self.expect(':')
+            yield key
+
+    def items(self):
+        """Элементы массива; каждый элемент должен прочитать вызывающий код"""
+        self.expect('[')
+        yield from self._items(']')
+
+
+def iter_array(fp, read_size=READ_SIZE):
+    """Элементы JSON-массива верхнего уровня (формат фикстур Django) по одному"""
+    stream = JsonStream(fp, read_size)
+    for _ in stream.items():
+        yield stream.value()
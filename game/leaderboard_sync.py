@@ -0,0 +1,174 @@
+"""
+Событийное обновление турнирной таблицы
+
+Код, меняющий очки, монеты, пройденные уровни, достижения или серию,
+вызывает mark_leaderboard_dirty(user). Внутри запроса (см.
+DeferredUpdatesMiddleware) пользователи только помечаются, а записи
+рейтинга пересчитываются пачкой в конце запроса через bulk_update.
+Вне запроса (команды, shell) пересчет выполняется сразу.
+
+Страницы рейтинга и dashboard при этом только читают таблицу. Записи
+пользователей, у которых после перехода не было ни одного события,
+создает backfill_leaderboard() (миграция 0023, manage.py backfill_leaderboard).
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import Leaderboard, UserAchievement, Streak, UserTopicProgress
+from .ranking import record_score_changes
+
+LEADERBOARD_FIELDS = ['total_points', 'total_coins', 'levels_completed', 'achievements_count', 'streak_days']
+
+_local = threading.local()
+
+
+def _dirty_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def mark_leaderboard_dirty(user):
+    """Помечает запись рейтинга пользователя устаревшей"""
+    stack = _dirty_stack()
+    if stack:
+        stack[-1].add(user.pk)
+    else:
+        flush_leaderboard([user.pk])
+
+
+@contextmanager
+def deferred_leaderboard_updates():
+    """Откладывает пересчет рейтинга до выхода из блока"""
+    stack = _dirty_stack()
+    stack.append(set())
+    try:
+        yield
+    finally:
+        dirty = stack.pop()
+        if dirty:
+            if stack:
+                stack[-1].update(dirty)
+            else:
+                flush_leaderboard(dirty)
+
+
+def collect_leaderboard_stats(user_ids):
+    """Статистика для рейтинга по списку пользователей (по запросу на источник)"""
+    from accounts.models import User
+
+    stats = {
+        row['id']: {
+            'total_points': row['points'],
+            'total_coins': row['coins'],
+            'levels_completed': 0,
+            'achievements_count': 0,
+            'streak_days': 0,
+        }
+        for row in User.objects.filter(pk__in=user_ids).values('id', 'points', 'coins')
+    }
+    levels = UserTopicProgress.objects.filter(user_id__in=stats).values('user_id').annotate(
+        total=Sum('completed_count')
+    ).order_by()
+    for row in levels:
+        stats[row['user_id']]['levels_completed'] = row['total'] or 0
+    achievements = UserAchievement.objects.filter(user_id__in=stats).values('user_id').annotate(
+        total=Count('id')
+    ).order_by()
+    for row in achievements:
+        stats[row['user_id']]['achievements_count'] = row['total']
+    for user_id, streak in Streak.objects.filter(user_id__in=stats).values_list('user_id', 'current_streak'):
+        stats[user_id]['streak_days'] = streak
+    return stats
+
+
+def flush_leaderboard(user_ids, batch_size=500):
+    """Пересчитывает записи рейтинга для пользователей пачкой"""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        _flush_batch(user_ids[start:start + batch_size])
+
+
+def _insert_entries(entries):
+    """
+    Вставляет новые записи рейтинга. Возвращает (вставленные записи,
+    user_id записей, которые параллельный запрос успел создать раньше).
+    """
+    try:
+        with transaction.atomic():
+            Leaderboard.objects.bulk_create(entries)
+        return entries, []
+    except IntegrityError:
+        pass
+    # Конфликт в пачке — вставляем по одной, чтобы знать, какие строки наши
+    created, conflicts = [], []
+    for entry in entries:
+        entry.pk = None
+        try:
+            with transaction.atomic():
+                entry.save(force_insert=True)
+        except IntegrityError:
+            conflicts.append(entry.user_id)
+        else:
+            created.append(entry)
+    return created, conflicts
+
+
+def _flush_batch(user_ids):
+    stats = collect_leaderboard_stats(user_ids)
+    if not stats:
+        return
+
+    with transaction.atomic():
+        existing = {
+            entry.user_id: entry
+            for entry in Leaderboard.objects.select_for_update().filter(user_id__in=stats)
+        }
+        created, conflicts = _insert_entries([
+            Leaderboard(user_id=user_id, **values)
+            for user_id, values in stats.items() if user_id not in existing
+        ])
+        score_changes = [(None, entry.total_points) for entry in created]
+        if conflicts:
+            # Записи, созданные параллельно, обновляем как существующие:
+            # гистограмма меняется от сохраненных в них очков
+            existing.update(
+                (entry.user_id, entry)
+                for entry in Leaderboard.objects.select_for_update().filter(user_id__in=conflicts)
+            )
+
+        now = timezone.now()
+        to_update = []
+        for user_id, entry in existing.items():
+            values = stats[user_id]
+            if all(getattr(entry, field) == value for field, value in values.items()):
+                continue
+            score_changes.append((entry.total_points, values['total_points']))
+            for field, value in values.items():
+                setattr(entry, field, value)
+            entry.last_updated = now
+            to_update.append(entry)
+
+        if to_update:
+            # bulk_update не трогает auto_now — обновляем last_updated явно
+            Leaderboard.objects.bulk_update(to_update, LEADERBOARD_FIELDS + ['last_updated'])
+        record_score_changes(score_changes)
+
+
+def backfill_leaderboard(recompute=False, batch_size=500):
+    """
+    Создает записи рейтинга пользователям, у которых их нет
+    (recompute=True — пересчитывает все). Возвращает число пользователей.
+    """
+    from accounts.models import User
+
+    users = User.objects.order_by('pk')
+    if not recompute:
+        users = users.filter(leaderboard_entry__isnull=True)
+    user_ids = list(users.values_list('pk', flat=True))
+    flush_leaderboard(user_ids, batch_size=batch_size)
+    return len(user_ids)
@@ -0,0 +1,41 @@
+"""
+Варианты ответов старых уровней quiz/test (LevelOption)
+
+Раньше проверка делала запрос на каждый вопрос (filter по question_number
+или get по id выбранного варианта), а шаблон на каждый вопрос заново
+перебирал level.options.all. Теперь варианты уровня загружаются одним
+запросом (prefetch на экземпляре уровня), группируются по номеру вопроса,
+и проверка сводится к сравнению множеств id правильных вариантов.
+Тот же список групп используется для отрисовки вопросов.
+"""
+from collections import namedtuple
+
+from django.db.models import prefetch_related_objects
+
+from .answer_keys import load_content
+
+OptionGroup = namedtuple('OptionGroup', ['number', 'text', 'hint', 'options', 'correct_ids'])
+
+
+def get_option_groups(level):
+    """Варианты уровня по вопросам; повторные вызовы на том же level не делают запросов"""
+    prefetch_related_objects([level], 'options')
+    by_number = {}
+    for option in level.options.all():
+        by_number.setdefault(option.question_number, []).append(option)
+
+    # Текст вопроса и подсказка (если есть) лежат в content['questions'] по порядку
+    questions = load_content(level.content).get('questions', [])
+    groups = []
+    for number, options in sorted(by_number.items()):
+        question = questions[number - 1] if 0 < number <= len(questions) else {}
+        if not isinstance(question, dict):
+            question = {}
+        groups.append(OptionGroup(
+            number=number,
+            text=question.get('text', ''),
+            hint=question.get('hint', ''),
+            options=tuple(options),
+            correct_ids=frozenset(str(option.id) for option in options if option.is_correct),
+        ))
+    return groups
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from game.leaderboard_sync import backfill_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Создает записи рейтинга (Leaderboard) пользователям, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='recompute',
+            help='Пересчитать записи всех пользователей, а не только недостающие'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Размер пакета пользователей'
+        )
+
+    def handle(self, *args, **options):
+        count = backfill_leaderboard(recompute=options['recompute'], batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Записи рейтинга обновлены: {count} пользователей')
+        )
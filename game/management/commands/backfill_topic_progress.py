@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from game.progress import rebuild_topic_progress
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики прогресса по темам (UserTopicProgress) из UserLevelProgress'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='ID пользователя (можно указать несколько раз); по умолчанию — все'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для bulk_create'
+        )
+
+    def handle(self, *args, **options):
+        created = rebuild_topic_progress(
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Счетчики пересчитаны: {created} записей')
+        )
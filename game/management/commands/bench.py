@@ -0,0 +1,185 @@
+import json
+import math
+import random
+import statistics
+import subprocess
+import time
+from io import StringIO
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import User
+from game.catalog import invalidate_catalog
+from game.db_optimization import QueryCounter
+from game.leaderboard_sync import flush_leaderboard
+from game.models import Level, UserLevelProgress
+from game.progress import rebuild_topic_progress
+
+
+class Rollback(Exception):
+    pass
+
+
+# Отдельный кеш процесса: замеры сбрасывают его между страницами, не трогая
+# общий кеш (Redis) с сессиями и ключами рабочих worker'ов
+BENCH_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'finquest-bench',
+    },
+}
+
+
+VIEWS = (
+    # (имя, url name, нужен ли id уровня)
+    ('dashboard', 'dashboard', False),
+    ('level_play', 'level_play', True),
+    ('level_result', 'level_result', True),
+    ('profile', 'profile', False),
+    ('leaderboard', 'leaderboard', False),
+)
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    rank = min(max(1, math.ceil(pct / 100 * len(ordered))), len(ordered))
+    return ordered[rank - 1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет основные страницы (dashboard, level_play, level_result, profile, leaderboard) '
+        'на детерминированных данных: перцентили времени ответа, число запросов и размер ответа в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Количество синтетических пользователей')
+        parser.add_argument('--iterations', type=int, default=50, help='Запросов к каждой странице')
+        parser.add_argument('--warmup', type=int, default=5, help='Прогревочных запросов (не учитываются)')
+        parser.add_argument('--seed', type=int, default=42, help='Seed генератора данных')
+        parser.add_argument('--views', nargs='+', choices=[name for name, _, _ in VIEWS], help='Только эти страницы')
+        parser.add_argument('--output', help='Записать JSON в файл (иначе вывод в stdout)')
+
+    def handle(self, *args, **options):
+        # Данные создаются в транзакции и откатываются: рабочая БД не меняется
+        with override_settings(CACHES=BENCH_CACHES):
+            try:
+                with transaction.atomic():
+                    users, level = self.seed(options)
+                    views = self.run_views(users, level, options)
+                    raise Rollback
+            except Rollback:
+                pass
+            cache.clear()
+            invalidate_catalog()
+
+        report = {
+            'revision': git_revision(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'users': options['users'],
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'views': views,
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+            self.stderr.write(f"Результаты записаны в {options['output']}")
+        else:
+            self.stdout.write(data)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        call_command('create_new_structure', stdout=StringIO())
+        levels = list(Level.objects.summaries().order_by('topic_id', 'order_in_topic', 'id'))
+
+        users = User.objects.bulk_create([
+            User(
+                username=f'bench_user_{i}',
+                points=rng.randint(0, 5000),
+                coins=rng.randint(0, 500),
+            )
+            for i in range(options['users'])
+        ])
+        progress = []
+        for user in users:
+            # Первый уровень пройден у всех (для level_result), остальные — случайно
+            for index, level in enumerate(levels):
+                if index == 0 or rng.random() < 0.3:
+                    score = rng.choice([60, 80, 100])
+                    progress.append(UserLevelProgress(
+                        user=user, level=level, completed=True, score=score, best_score=score,
+                        attempts=rng.randint(1, 3), completion_time=rng.randint(30, 600),
+                    ))
+        UserLevelProgress.objects.bulk_create(progress)
+
+        user_ids = [user.pk for user in users]
+        rebuild_topic_progress(user_ids)
+        flush_leaderboard(user_ids)
+        self.stderr.write(
+            f'Данные: {len(levels)} уровней, {len(users)} пользователей, {len(progress)} прохождений'
+        )
+        return users, levels[0]
+
+    def run_views(self, users, level, options):
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+        selected = options['views'] or [name for name, _, _ in VIEWS]
+
+        results = {}
+        for name, url_name, with_level in VIEWS:
+            if name not in selected:
+                continue
+            url = reverse(url_name, args=[level.pk] if with_level else [])
+            cache.clear()  # только кеш замера (BENCH_CACHES)
+            timings, queries, sizes, statuses = [], [], [], set()
+            for i in range(options['warmup'] + options['iterations']):
+                client = clients[i % len(clients)]
+                counter = QueryCounter()
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    response = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+                if i < options['warmup']:
+                    continue
+                timings.append(elapsed)
+                queries.append(counter.count)
+                sizes.append(len(response.content))
+                statuses.add(response.status_code)
+
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'mean_ms': round(statistics.fmean(timings), 2),
+                'queries_median': statistics.median(queries),
+                'queries_max': max(queries),
+                'bytes_median': statistics.median(sizes),
+                'status': sorted(statuses),
+            }
+            self.stderr.write(
+                f"{name:>13}: p50 {results[name]['p50_ms']} мс, p95 {results[name]['p95_ms']} мс, "
+                f"запросов {results[name]['queries_median']}"
+            )
+        return results
@@ -0,0 +1,116 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from game.achievements import dispatch, LEVEL_COMPLETED, POINTS_CHANGED
+from game.catalog import invalidate_catalog
+from game.models import (
+    Topic, Level, UserLevelProgress, Achievement, UserAchievement, Streak, Notification
+)
+from game.progress import progress_state, save_level_progress
+from game.quests import update_daily_quest_progress
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_check_achievements(user):
+    """Прежняя полная проверка достижений (эталон «до» для сравнения)"""
+    if not UserAchievement.objects.filter(user=user, achievement__name="Первые шаги").exists():
+        first = Achievement.objects.filter(name="Первые шаги").first()
+        if first and UserLevelProgress.objects.filter(user=user).exists():
+            UserAchievement.objects.create(user=user, achievement=first)
+            Notification.objects.create(user=user, text=f"🏆 Получено достижение: {first.name}")
+
+    for topic in Topic.objects.all():
+        total = topic.level_set.count()
+        completed = UserLevelProgress.objects.filter(user=user, level__topic=topic, completed=True).count()
+        if total > 0 and completed == total:
+            achievement, _ = Achievement.objects.get_or_create(
+                name=f"Мастер {topic.name}",
+                defaults={"description": f"Пройдены все уровни по теме «{topic.name}»"}
+            )
+            _, created = UserAchievement.objects.get_or_create(user=user, achievement=achievement)
+            if created:
+                update_daily_quest_progress(user, 'achievements_earned', 1)
+                Notification.objects.create(user=user, text=f"🏆 Получено достижение: {achievement.name}")
+
+    total_levels_completed = UserLevelProgress.objects.filter(user=user, completed=True).count()
+    total_achievements = UserAchievement.objects.filter(user=user).count()
+    milestones = [
+        ("Исследователь", [10, 25, 50, 100], total_levels_completed),
+        ("Богач", [500, 1000, 2500, 5000], user.points),
+    ]
+    streak = Streak.objects.filter(user=user).first()
+    if streak:
+        milestones.append(("Постоянство", [7, 14, 30, 100], streak.current_streak))
+    milestones.append(("Коллекционер", [5, 10, 20, 50], total_achievements))
+    for prefix, values, current in milestones:
+        for milestone in values:
+            if current >= milestone:
+                achievement, _ = Achievement.objects.get_or_create(
+                    name=f"{prefix} {milestone}", defaults={"description": prefix}
+                )
+                _, created = UserAchievement.objects.get_or_create(user=user, achievement=achievement)
+                if created:
+                    Notification.objects.create(user=user, text=f"Получено достижение: {achievement.name}")
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает количество запросов к БД на одно прохождение уровня: старая проверка достижений против событийной'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--topics', type=int, default=16, help='Количество тем')
+        parser.add_argument('--levels', type=int, default=3, help='Уровней в теме')
+        parser.add_argument('--completions', type=int, default=30, help='Сколько уровней пройти')
+
+    def handle(self, *args, **options):
+        results = {}
+        for mode in ('before', 'after'):
+            try:
+                with transaction.atomic():
+                    results[mode] = self.run_scenario(mode, options)
+                    raise Rollback
+            except Rollback:
+                pass
+        invalidate_catalog()
+
+        for mode, counts in results.items():
+            self.stdout.write(
+                f'{mode:>6}: в среднем {sum(counts) / len(counts):.1f} запросов на прохождение, '
+                f'максимум {max(counts)}'
+            )
+        ratio = sum(results['before']) / max(sum(results['after']), 1)
+        self.stdout.write(self.style.SUCCESS(f'Сокращение запросов: в {ratio:.1f} раз'))
+
+    def run_scenario(self, mode, options):
+        invalidate_catalog()
+        user = User.objects.create_user(username=f'bench_achievements_{mode}', password='bench')
+        Achievement.objects.get_or_create(name='Первые шаги', defaults={'description': 'Ответили на первый вопрос'})
+        levels = []
+        for t in range(options['topics']):
+            topic = Topic.objects.create(name=f'Бенчмарк тема {t}', main_category='basics')
+            for i in range(options['levels']):
+                levels.append(Level.objects.create(
+                    topic=topic, title=f'Уровень {i}', description='', order_in_topic=i + 1
+                ))
+
+        counts = []
+        for level in levels[:options['completions']]:
+            progress = UserLevelProgress.objects.create(user=user, level=level)
+            before = progress_state(progress)
+            progress.completed = True
+            progress.score = progress.best_score = 100
+            save_level_progress(progress, level, before)
+            user.points += level.reward_points
+            user.save()
+
+            with CaptureQueriesContext(connection) as ctx:
+                if mode == 'before':
+                    legacy_check_achievements(user)
+                else:
+                    dispatch(user, LEVEL_COMPLETED, POINTS_CHANGED)
+            counts.append(len(ctx))
+        return counts
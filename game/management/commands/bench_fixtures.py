@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from game.catalog import invalidate_catalog
+from game.db_optimization import QueryCounter
+from game.fixture_loader import FIXTURE_FILES, load_fixture_files
+
+
+class Rollback(Exception):
+    pass
+
+
+PK_OFFSET = 1_000_000  # не пересекается с id рабочего каталога
+
+
+def write_fixtures(directory, options_count, options_per_level=20, levels_per_topic=25):
+    """Синтетические topics.json / levels.json / level_options.json заданного размера"""
+    level_count = max(1, options_count // options_per_level)
+    topic_count = max(1, level_count // levels_per_topic)
+
+    def dump(filename, records):
+        with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+            json.dump(list(records), f, ensure_ascii=False, indent=2)
+
+    dump('topics.json', (
+        {'model': 'game.topic', 'pk': PK_OFFSET + t, 'fields': {
+            'name': f'bench_fixtures {t}', 'description': 'Тема для замера', 'main_category': 'basics',
+            'order_in_category': t + 1, 'is_active': True,
+        }}
+        for t in range(topic_count)
+    ))
+    dump('levels.json', (
+        {'model': 'game.level', 'pk': PK_OFFSET + l, 'fields': {
+            'type': 'quiz', 'topic': PK_OFFSET + l % topic_count, 'title': f'Уровень {l}',
+            'description': 'Уровень для замера', 'difficulty': 1, 'order_in_topic': l // topic_count + 1,
+            'content': {'questions': [{'text': f'Вопрос {q}'} for q in range(options_per_level // 4)]},
+        }}
+        for l in range(level_count)
+    ))
+    dump('level_options.json', (
+        {'model': 'game.leveloption', 'pk': PK_OFFSET + o, 'fields': {
+            'level': PK_OFFSET + o // options_per_level, 'text': f'Вариант ответа {o}',
+            'is_correct': o % 4 == 0, 'order': o % 4 + 1, 'question_number': o % options_per_level // 4 + 1,
+            'hint': '',
+        }}
+        for o in range(level_count * options_per_level)
+    ))
+    return topic_count, level_count, level_count * options_per_level
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время загрузки фикстур каталога: loaddata против потокового загрузчика пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--options', type=int, default=50_000, help='Вариантов ответа в фикстуре')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Размер пачки быстрого загрузчика')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            topics, levels, level_options = write_fixtures(directory, options['options'])
+            self.stdout.write(f'Фикстура: {topics} тем, {levels} уровней, {level_options} вариантов')
+            paths = [os.path.join(directory, filename) for filename, _ in FIXTURE_FILES]
+
+            self.run_mode('loaddata', lambda: call_command('loaddata', *paths, verbosity=0))
+            self.run_mode('fast', lambda: load_fixture_files(directory, batch_size=options['batch_size']))
+        invalidate_catalog()
+
+    def run_mode(self, mode, load):
+        # Каждый режим грузит в свою транзакцию, которая откатывается
+        counter = QueryCounter()
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    load()
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(f'{mode:>8}: {elapsed:.2f} с, запросов {counter.count}')
@@ -0,0 +1,77 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game.catalog import invalidate_catalog
+from game.models import Topic, Level
+
+
+class Rollback(Exception):
+    pass
+
+
+def blob(size_kb, seed):
+    """content уровня примерно заданного размера (вопросы с вариантами и пояснениями)"""
+    questions = []
+    size = 0
+    while size < size_kb * 1024:
+        text = f'Вопрос {seed}.{len(questions)}: ' + 'пояснение к задаче ' * 20
+        questions.append({
+            'question': text,
+            'type': 'single',
+            'options': [{'text': f'Вариант {i} ' * 10, 'correct': i == 0} for i in range(4)],
+        })
+        size += len(text.encode('utf-8')) + 4 * 100
+    return {'questions': questions}
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время и память загрузки списка уровней темы: полные уровни против сводок без content'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--levels', type=int, default=50, help='Уровней в теме')
+        parser.add_argument('--content-kb', type=int, default=64, help='Размер content одного уровня, КБ')
+        parser.add_argument('--repeat', type=int, default=20, help='Сколько раз загружать список')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                topic = Topic.objects.create(name='bench_level_content')
+                Level.objects.bulk_create([
+                    Level(
+                        topic=topic, title=f'Уровень {i}', description='', order_in_topic=i,
+                        content=blob(options['content_kb'], i)
+                    )
+                    for i in range(options['levels'])
+                ])
+                self.stdout.write(
+                    f"Тема: {options['levels']} уровней по ~{options['content_kb']} КБ content"
+                )
+                self.run_mode('full', Level.objects.all(), topic, options)
+                self.run_mode('summary', Level.objects.summaries(), topic, options)
+                raise Rollback
+        except Rollback:
+            pass
+        invalidate_catalog()
+
+    def run_mode(self, mode, queryset, topic, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            levels = list(queryset.filter(topic=topic).order_by('order_in_topic'))
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # Пиковая память на одну загрузку списка (как в topic_levels)
+        tracemalloc.start()
+        levels = list(queryset.filter(topic=topic).order_by('order_in_topic'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del levels
+
+        self.stdout.write(
+            f'{mode:>8}: медиана {statistics.median(timings):.2f} мс, '
+            f'максимум {max(timings):.2f} мс, пик памяти {peak / 1024:.0f} КБ'
+        )
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, DatabaseError
+
+from accounts.models import User
+from game.models import DailyQuest, UserDailyProgress, Notification
+from game.quests import deferred_quest_updates, update_daily_quest_progress
+
+
+def legacy_update_daily_quest_progress(user, quest_type, progress_value=1):
+    """Прежнее обновление заданий: get_or_create и save на каждое задание (эталон «до»)"""
+    today = date.today()
+    for quest in DailyQuest.objects.filter(quest_type=quest_type, is_active=True):
+        user_progress, _ = UserDailyProgress.objects.get_or_create(
+            user=user, quest=quest, date=today, defaults={'current_progress': 0}
+        )
+        if not user_progress.completed_at:
+            user_progress.current_progress += progress_value
+            user_progress.save()
+            if user_progress.current_progress >= quest.target_value:
+                user_progress.completed_at = date.today()
+                user_progress.save()
+                user.coins += quest.reward_coins
+                user.points += quest.reward_points
+                user.level_number = user.get_level_number()
+                user.save()
+                Notification.objects.create(user=user, text=f"🎁 Задание выполнено: {quest.title}")
+
+
+class Command(BaseCommand):
+    help = 'Измеряет пропускную способность учета ежедневных заданий при параллельных прохождениях уровней'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Количество параллельных потоков')
+        parser.add_argument('--users', type=int, default=4, help='Количество пользователей (потоки делят их между собой)')
+        parser.add_argument('--completions', type=int, default=25, help='Прохождений уровня на поток')
+
+    def handle(self, *args, **options):
+        # Потоки работают через свои соединения, поэтому откатываемая транзакция
+        # не подходит: замер идет в отдельной временной БД, рабочая не меняется
+        test_settings = connection.settings_dict['TEST']
+        old_test_name = test_settings['NAME']
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == 'sqlite' and not old_test_name:
+                # БД в памяти не подходит для параллельных соединений
+                test_settings['NAME'] = os.path.join(tmp, 'bench_quests.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.run_bench(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                test_settings['NAME'] = old_test_name
+
+    def run_bench(self, options):
+        total = options['threads'] * options['completions']
+        quests = [
+            # Недостижимая цель — по ней проверяем, что приращения не теряются
+            DailyQuest.objects.create(
+                title='bench_quests: уровни', description='', quest_type='levels_completed',
+                target_value=total + 1, reward_coins=0
+            ),
+            DailyQuest.objects.create(
+                title='bench_quests: очки', description='', quest_type='points_earned',
+                target_value=50, reward_coins=10, reward_points=5
+            ),
+        ]
+        for mode in ('before', 'after'):
+            self.run_mode(mode, options, quests[0])
+
+    def run_mode(self, mode, options, counter_quest):
+        users = [
+            User.objects.create(username=f'bench_quests_{mode}_{i}')
+            for i in range(options['users'])
+        ]
+        errors = []
+
+        def complete_level(user):
+            if mode == 'before':
+                legacy_update_daily_quest_progress(user, 'levels_completed', 1)
+                legacy_update_daily_quest_progress(user, 'points_earned', 10)
+                legacy_update_daily_quest_progress(user, 'achievements_earned', 1)
+            else:
+                with deferred_quest_updates():
+                    update_daily_quest_progress(user, 'levels_completed', 1)
+                    update_daily_quest_progress(user, 'points_earned', 10)
+                    update_daily_quest_progress(user, 'achievements_earned', 1)
+
+        def worker(index):
+            try:
+                for _ in range(options['completions']):
+                    # Каждый поток работает со своей копией пользователя, как отдельный запрос
+                    user = User.objects.get(pk=users[index % len(users)].pk)
+                    try:
+                        complete_level(user)
+                    except DatabaseError as exc:
+                        errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = options['threads'] * options['completions']
+        recorded = sum(UserDailyProgress.objects.filter(
+            quest=counter_quest, user__in=users
+        ).values_list('current_progress', flat=True))
+        self.stdout.write(
+            f'{mode:>6}: {total / elapsed:.1f} прохождений/с, ошибок {len(errors)}, '
+            f'учтено {recorded} из {total} прохождений'
+        )
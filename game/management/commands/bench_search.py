@@ -0,0 +1,80 @@
+import random
+import statistics
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from game.article_import import iter_articles
+from game.catalog import invalidate_catalog
+from game.models import Article, Topic
+from game.search import TAG_RE, index_objects, search
+from game.stemmer import tokenize
+
+
+class Rollback(Exception):
+    pass
+
+
+QUERIES = ('накопления', 'финансовой подушки', 'кредит', 'инвестиции риск доходность', 'мошенник')
+
+
+def vocabulary(path='game/fixtures/articles_data.json'):
+    """Слова реальных статей с частотами — синтетический текст получает похожее распределение"""
+    counts = Counter()
+    with open(path, encoding='utf-8') as f:
+        for _, data in iter_articles(f):
+            counts.update(tokenize(TAG_RE.sub(' ', data['title'] + ' ' + data['content'])))
+    words = [word for word, _ in counts.most_common()]
+    # Закон Ципфа: частота обратно пропорциональна рангу
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время поиска при росте числа статей (индекс FTS5 / tsvector)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 30_000], help='Размеры корпуса')
+        parser.add_argument('--words', type=int, default=300, help='Слов в статье')
+        parser.add_argument('--iterations', type=int, default=50, help='Повторов каждого запроса')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words, weights = vocabulary()
+        self.stdout.write(f'СУБД: {connection.vendor}, словарь {len(words)} слов, запросы: {", ".join(QUERIES)}')
+        try:
+            with transaction.atomic():
+                topic = Topic.objects.create(name='bench_search', description='')
+                count = 0
+                for size in sorted(options['sizes']):
+                    # Корпус растет до следующего размера; индекс обновляется пачками, как при импорте
+                    while count < size:
+                        batch = Article.objects.bulk_create([
+                            Article(
+                                topic=topic, title=' '.join(rng.choices(words, weights, k=6)).capitalize(),
+                                content='<p>' + ' '.join(rng.choices(words, weights, k=options['words'])) + '</p>',
+                            )
+                            for _ in range(min(1000, size - count))
+                        ])
+                        index_objects(batch)
+                        count += len(batch)
+                    self.measure(size, options['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+        invalidate_catalog()
+
+    def measure(self, size, iterations):
+        timings = []
+        for _ in range(iterations):
+            for query in QUERIES:
+                started = time.perf_counter()
+                search(query)
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{size:>7} статей: медиана {statistics.median(timings):.2f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f} мс'
+        )
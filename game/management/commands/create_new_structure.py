@@ -3,22 +3,59 @@
 # В будущем можно выделить в отдельные файлы: questions_basics.py, questions_security.py, etc.
 # Для использования: from .questions_basics import get_basics_questions
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from game.content_sync import CatalogError, describe_plan, has_changes, sync_catalog
 from game.models import Topic, Level, Achievement
-from django.contrib.auth.models import User
 
 class Command(BaseCommand):
-    help = 'Создает новую структуру: 4 категории × 4 подкатегории × 3 уровня'
+    help = (
+        'Синхронизирует структуру каталога: 4 категории × 4 подкатегории × 3 уровня. '
+        'Меняются только отличающиеся строки, прогресс пользователей сохраняется'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать план изменений')
+        parser.add_argument(
+            '--keep-missing', action='store_true',
+            help='Не удалять темы и уровни, которых нет в описании'
+        )
+        parser.add_argument(
+            '--delete-achievements', action='store_true',
+            help='Удалить достижения, которых нет в описании (вместе с выданными пользователям)'
+        )
 
     def handle(self, *args, **options):
-        # Очищаем старые данные
-        Level.objects.all().delete()
-        Topic.objects.all().delete()
-        Achievement.objects.all().delete()
+        try:
+            plan = sync_catalog(
+                self.build_catalog(),
+                delete_missing=not options['keep_missing'],
+                delete_achievements=options['delete_achievements'],
+                dry_run=options['dry_run'],
+            )
+        except CatalogError as exc:
+            raise CommandError(str(exc))
         
-        self.stdout.write('Старые данные удалены')
+        for line in describe_plan(plan):
+            self.stdout.write(line)
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry-run: изменения не применены'))
+            return
+        if not has_changes(plan):
+            self.stdout.write(self.style.SUCCESS('Каталог уже актуален'))
+            return
         
-        # Создаем основные категории
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Каталог: {Topic.objects.filter(is_subcategory=False).count()} категорий, '
+                f'{Topic.objects.filter(is_subcategory=True).count()} подкатегорий, '
+                f'{Level.objects.count()} уровней, '
+                f'{Achievement.objects.count()} достижений'
+            )
+        )
+
+    def build_catalog(self):
+        """Желаемый каталог в формате game.content_sync"""
+        # Основные категории
         categories = [
             {
                 'name': 'Основы финансов',
@@ -194,43 +231,46 @@ class Command(BaseCommand):
             }
         ]
         
-        # Создаем категории и подкатегории
+        catalog = {'topics': [], 'levels': [], 'achievements': []}
+        
+        # Категории и подкатегории
         for cat_data in categories:
-            category = Topic.objects.create(
-                name=cat_data['name'],
-                main_category=cat_data['main_category'],
-                description=cat_data['description'],
-                is_subcategory=False
-            )
+            catalog['topics'].append({
+                'name': cat_data['name'],
+                'main_category': cat_data['main_category'],
+                'description': cat_data['description'],
+                'is_subcategory': False,
+                'parent': None,
+            })
             
             for subcat_data in cat_data['subcategories']:
-                subcategory = Topic.objects.create(
-                    name=subcat_data['name'],
-                    main_category=cat_data['main_category'],
-                    description=subcat_data['description'],
-                    is_subcategory=True,
-                    parent_category=category
-                )
+                catalog['topics'].append({
+                    'name': subcat_data['name'],
+                    'main_category': cat_data['main_category'],
+                    'description': subcat_data['description'],
+                    'is_subcategory': True,
+                    'parent': cat_data['name'],
+                })
                 
-                # Создаем уровни для подкатегории
+                # Уровни подкатегории
                 for i, level_data in enumerate(subcat_data['levels']):
-                    # Создаем вопросы для уровня
-                    questions = self.create_questions(level_data['questions'], level_data['difficulty'], subcategory.name)
+                    # Вопросы для уровня
+                    questions = self.create_questions(level_data['questions'], level_data['difficulty'], subcat_data['name'])
                     
-                    Level.objects.create(
-                        topic=subcategory,
-                        title=level_data['name'],
-                        description=f"Уровень {level_data['name']} для темы {subcategory.name}",
-                        type='quiz',
-                        difficulty=1 if level_data['difficulty'] == 'easy' else 2 if level_data['difficulty'] == 'medium' else 3,
-                        order_in_topic=i + 1,
-                        content=questions,
-                        reward_points=10 if level_data['difficulty'] == 'easy' else 15 if level_data['difficulty'] == 'medium' else 20,
-                        reward_coins=5 if level_data['difficulty'] == 'easy' else 8 if level_data['difficulty'] == 'medium' else 12
-                    )
+                    catalog['levels'].append({
+                        'topic': subcat_data['name'],
+                        'title': level_data['name'],
+                        'description': f"Уровень {level_data['name']} для темы {subcat_data['name']}",
+                        'type': 'quiz',
+                        'difficulty': 1 if level_data['difficulty'] == 'easy' else 2 if level_data['difficulty'] == 'medium' else 3,
+                        'order_in_topic': i + 1,
+                        'content': questions,
+                        'reward_points': 10 if level_data['difficulty'] == 'easy' else 15 if level_data['difficulty'] == 'medium' else 20,
+                        'reward_coins': 5 if level_data['difficulty'] == 'easy' else 8 if level_data['difficulty'] == 'medium' else 12
+                    })
         
-        # Создаем достижения
-        achievements = [
+        # Достижения
+        catalog['achievements'] = [
             {
                 'name': 'Первые шаги',
                 'description': 'Ответили на первый вопрос',
@@ -247,17 +287,7 @@ class Command(BaseCommand):
             }
         ]
         
-        for achievement_data in achievements:
-            Achievement.objects.create(**achievement_data)
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Создано: {Topic.objects.filter(is_subcategory=False).count()} категорий, '
-                f'{Topic.objects.filter(is_subcategory=True).count()} подкатегорий, '
-                f'{Level.objects.count()} уровней, '
-                f'{Achievement.objects.count()} достижений'
-            )
-        )
+        return catalog
 
     def create_questions(self, count, difficulty, subcategory_name):
         """Создает вопросы для уровня в зависимости от подкатегории"""
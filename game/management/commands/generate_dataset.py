@@ -0,0 +1,207 @@
+import multiprocessing
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from game.models import (
+    Level, UserLevelProgress, Streak, Notification, Leaderboard, DailyQuest, UserDailyProgress, QuizAttempt
+)
+from game.progress import rebuild_topic_progress
+from game.ranking import rebuild_rank_index
+
+# Активность пользователя — распределение Парето (мало очень активных, много случайных)
+PARETO_ALPHA = 1.2
+ACTIVITY_CAP = 50
+ACTIVITY_MEAN = 3.7  # среднее min(pareto(1.2), 50), для нормировки числа уведомлений
+
+SCORES = (100, 80, 60, 40)
+SCORE_WEIGHTS = (45, 30, 15, 10)
+
+NOTIFICATION_TEXTS = (
+    "🎉 Уровень пройден! +{points} очков",
+    "💰 Получено {coins} монет",
+    "🏆 Получено достижение: Исследователь 10",
+    "🔥 Отличная серия! 3 дня подряд!",
+    "🎁 Задание выполнено: Пройди уровни",
+    "📈 Вы поднялись в рейтинге",
+)
+
+
+class Writer:
+    """Копит объекты по моделям и пишет их bulk_create пачками не больше chunk_size"""
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.pending = {}
+        self.written = Counter()
+
+    def add(self, obj):
+        model = type(obj)
+        batch = self.pending.setdefault(model, [])
+        batch.append(obj)
+        if len(batch) >= self.chunk_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        models = [model] if model is not None else list(self.pending)
+        for model in models:
+            batch = self.pending.pop(model, [])
+            if batch:
+                model.objects.bulk_create(batch, batch_size=self.chunk_size)
+                self.written[model.__name__] += len(batch)
+
+
+def user_rng(seed, index):
+    # Свой генератор на пользователя: результат не зависит от разбиения на блоки и процессы
+    return random.Random(seed * 1_000_003 + index)
+
+
+def generate_block(task):
+    """Создает пользователей [start, start + count) и все их данные; возвращает счетчики строк"""
+    start, count, options, levels, quests = task
+    writer = Writer(options['chunk_size'])
+    today = date.today()
+    now = timezone.now()
+    quiz_levels = [level for level in levels if level[1] == 'quiz' and level[2]]
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=f"{options['prefix']}{index}", password='!')
+            for index in range(start, start + count)
+        ], batch_size=options['chunk_size'])
+        writer.written['User'] += len(users)
+
+        changed = []
+        for index, user in zip(range(start, start + count), users):
+            rng = user_rng(options['seed'], index)
+            activity = min(rng.paretovariate(PARETO_ALPHA), ACTIVITY_CAP)
+
+            # Прохождения: число уровней растет с активностью, часть попыток неудачна
+            touched = min(len(levels), int(activity * 3.5))
+            completed = 0
+            for level_id, _, _, reward_points, reward_coins in rng.sample(levels, touched):
+                score = rng.choices(SCORES, SCORE_WEIGHTS)[0]
+                passed = score >= 60 or rng.random() < 0.3
+                attempts = 1 + int(rng.expovariate(1.5))
+                seconds = rng.randint(20, 900)
+                writer.add(UserLevelProgress(
+                    user_id=user.pk, level_id=level_id, completed=passed, score=score, best_score=score,
+                    attempts=attempts, completion_time=seconds, best_time=seconds,
+                ))
+                if passed:
+                    completed += 1
+                    user.points += reward_points
+                    user.coins += reward_coins
+            user.level_number = user.get_level_number()
+            changed.append(user)
+
+            # Серия: у активных длиннее и чаще не прервана
+            streak_days = int(rng.expovariate(1 / activity)) if rng.random() < 0.6 else 0
+            last_activity = today - timedelta(days=0 if rng.random() < min(0.9, activity / 10) else rng.randint(1, 60))
+            writer.add(Streak(user_id=user.pk, current_streak=streak_days, last_activity=last_activity))
+
+            # Незаконченные викторины
+            if quiz_levels and rng.random() < min(0.8, 0.1 * activity):
+                level_id, _, question_count, _, _ = rng.choice(quiz_levels)
+                answered = rng.randint(0, question_count - 1)
+                results = [[rng.choice((0, 100)), rng.randrange(4)] for _ in range(answered)]
+                writer.add(QuizAttempt(
+                    user_id=user.pk, level_id=level_id, results=results + [None] * (question_count - answered)
+                ))
+
+            # Прогресс ежедневных заданий — у тех, кто заходил сегодня
+            if last_activity == today:
+                for quest_id, target in quests:
+                    progress = rng.randint(0, target)
+                    writer.add(UserDailyProgress(
+                        user_id=user.pk, quest_id=quest_id, current_progress=progress,
+                        completed_at=now if progress >= target else None,
+                    ))
+
+            # Уведомления: пропорционально активности, старые чаще прочитаны
+            notification_count = int(options['notifications'] * activity / ACTIVITY_MEAN * rng.uniform(0.5, 1.5))
+            for n in range(notification_count):
+                text = rng.choice(NOTIFICATION_TEXTS).format(points=rng.randint(5, 30), coins=rng.randint(1, 10))
+                writer.add(Notification(
+                    user_id=user.pk, text=text, is_read=n < notification_count - 5 and rng.random() < 0.9
+                ))
+
+            writer.add(Leaderboard(
+                user_id=user.pk, total_points=user.points, total_coins=user.coins,
+                levels_completed=completed, streak_days=streak_days,
+            ))
+
+        User.objects.bulk_update(changed, ['points', 'coins', 'level_number'], batch_size=options['chunk_size'])
+        writer.flush()
+    return writer.written
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует большой синтетический набор данных (пользователи, прохождения, уведомления, '
+        'рейтинг, серии, попытки викторин, задания) для нагрузочных замеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000, help='Количество пользователей')
+        parser.add_argument('--notifications', type=int, default=50, help='Уведомлений на пользователя в среднем')
+        parser.add_argument('--seed', type=int, default=1, help='Seed (одинаковый seed — одинаковые данные)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--block-size', type=int, default=2000, help='Пользователей в одной транзакции')
+        parser.add_argument('--workers', type=int, default=1, help='Процессов (для PostgreSQL; SQLite пишет последовательно)')
+        parser.add_argument('--prefix', default='gen_', help='Префикс имен пользователей')
+        parser.add_argument('--skip-rebuild', action='store_true', help='Не пересчитывать счетчики тем и гистограмму рейтинга')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Пользователи с префиксом {options['prefix']!r} уже есть, укажите другой --prefix")
+
+        levels = [
+            (level.id, level.type, len(level.content.get('questions', [])) if isinstance(level.content, dict) else 0,
+             level.reward_points, level.reward_coins)
+            for level in Level.objects.order_by('id')
+        ]
+        if not levels:
+            raise CommandError('Каталог пуст: сначала выполните create_new_structure')
+        quests = list(DailyQuest.objects.filter(is_active=True).values_list('id', 'target_value'))
+
+        tasks = [
+            (start, min(options['block_size'], options['users'] - start), options, levels, quests)
+            for start in range(0, options['users'], options['block_size'])
+        ]
+        totals = Counter()
+        started = time.perf_counter()
+        if options['workers'] > 1:
+            # Дочерние процессы открывают свои соединения
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+                for written in pool.imap_unordered(generate_block, tasks):
+                    totals.update(written)
+                    self.report(totals, started)
+        else:
+            for task in tasks:
+                totals.update(generate_block(task))
+                self.report(totals, started)
+
+        if not options['skip_rebuild']:
+            self.stdout.write('Пересчет счетчиков тем и гистограммы рейтинга...')
+            rebuild_topic_progress()
+            rebuild_rank_index()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Готово за {:.0f} с: {}'.format(
+                time.perf_counter() - started, ', '.join(f'{name} {count}' for name, count in sorted(totals.items()))
+            )
+        ))
+
+    def report(self, totals, started):
+        self.stdout.write(
+            f"  пользователей {totals['User']}, прохождений {totals['UserLevelProgress']}, "
+            f"уведомлений {totals['Notification']} ({time.perf_counter() - started:.0f} с)"
+        )
@@ -1,10 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
 import os
+import time
+
 from django.core.management.base import BaseCommand
-from django.conf import settings
+from django.db.models import Count
+
+from game.article_import import import_articles
 from game.models import Article, Topic
+from game.related_articles import rebuild_related_articles
+
 
 class Command(BaseCommand):
     help = 'Загружает статьи из JSON файла в базу данных'
@@ -21,6 +26,18 @@ class Command(BaseCommand):
             action='store_true',
             help='Очистить существующие статьи перед загрузкой'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Статей в одной пачке записи'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Процессов для очистки и сборки HTML статей'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file']
@@ -38,76 +55,43 @@ class Command(BaseCommand):
                 self.style.WARNING('Существующие статьи удалены')
             )
 
-        # Загрузка данных из JSON
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        articles_data = data['articles']
-        total_articles = 0
+        # Файл читается потоково, статьи пишутся пачками
+        started = time.perf_counter()
 
-        for category_key, category_data in articles_data.items():
-            self.stdout.write(f'Обрабатываем категорию: {category_data["name"]}')
-            
-            for subcategory_key, subcategory_data in category_data['subcategories'].items():
-                self.stdout.write(f'  Подкатегория: {subcategory_data["name"]}')
-                
-                # Находим тему по названию
-                try:
-                    topic = Topic.objects.get(name=subcategory_data['name'])
-                except Topic.DoesNotExist:
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'Тема "{subcategory_data["name"]}" не найдена, пропускаем'
-                        )
-                    )
-                    continue
-
-                # Создаем статьи
-                for article_data in subcategory_data['articles']:
-                    # Формируем контент статьи с дополнительной информацией
-                    full_content = f"""
-{article_data['summary']}
+        def progress(stats):
+            self.stdout.write(
+                f'  обработано {stats.processed}: создано {stats.created}, обновлено {stats.updated}, '
+                f'без изменений {stats.unchanged}, пропущено {stats.skipped} '
+                f'({time.perf_counter() - started:.1f} с)'
+            )
 
-{article_data['content']}
+        with open(file_path, 'r', encoding='utf-8') as f:
+            stats = import_articles(
+                f, chunk_size=options['chunk_size'], workers=options['workers'], progress=progress
+            )
 
----
-Теги: {', '.join(article_data['tags'])}
-Сложность: {article_data['difficulty']}
-Время чтения: {article_data['reading_time']}
-Автор: {article_data['author']}
-"""
-                    
-                    article, created = Article.objects.get_or_create(
-                        title=article_data['title'],
-                        defaults={
-                            'topic': topic,
-                            'content': full_content.strip(),
-                        }
-                    )
-                    
-                    if created:
-                        total_articles += 1
-                        self.stdout.write(
-                            f'    [СОЗДАНА] {article.title}'
-                        )
-                    else:
-                        self.stdout.write(
-                            f'    [СУЩЕСТВУЕТ] {article.title}'
-                        )
+        for name in stats.missing_topics:
+            self.stdout.write(
+                self.style.WARNING(f'Тема "{name}" не найдена, ее статьи пропущены')
+            )
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Загрузка завершена! Создано/обновлено статей: {total_articles}'
+                f'Загрузка завершена! Создано статей: {stats.created}, обновлено: {stats.updated}'
             )
         )
 
+        # Похожие статьи зависят от всего корпуса — пересчитываем, если он поменялся
+        if stats.created or stats.updated or options['clear']:
+            links = rebuild_related_articles()
+            self.stdout.write(f'Похожие статьи пересчитаны: {links} связей')
+
         # Статистика
         total_in_db = Article.objects.count()
         self.stdout.write(f'Всего статей в базе: {total_in_db}')
         
         # Статистика по темам
         self.stdout.write('\nСтатистика по темам:')
-        for topic in Topic.objects.all():
-            count = Article.objects.filter(topic=topic).count()
-            if count > 0:
-                self.stdout.write(f'  {topic.name}: {count} статей')
+        topics = Topic.objects.annotate(article_count=Count('article')).filter(article_count__gt=0)
+        for topic in topics.order_by('id'):
+            self.stdout.write(f'  {topic.name}: {topic.article_count} статей')
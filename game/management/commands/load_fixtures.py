@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import os
-from django.core.management.base import BaseCommand
-from django.core.management import call_command
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+
+from game.fixture_loader import FixtureError, load_fixture_files
 
 class Command(BaseCommand):
     help = 'Загружает все фикстуры в правильном порядке'
@@ -19,34 +22,42 @@ class Command(BaseCommand):
             default='game/fixtures',
             help='Директория с фикстурами'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Объектов в одной пачке записи'
+        )
 
     def handle(self, *args, **options):
-        fixtures_dir = options['fixtures_dir']
-        
+        started = time.perf_counter()
+
+        def progress(stats):
+            self.stdout.write(
+                f'  {stats.model}: создано {stats.created}, обновлено {stats.updated} '
+                f'({time.perf_counter() - started:.1f} с)'
+            )
+
+        # Все файлы грузятся одной транзакцией: при ошибке база не меняется
+        try:
+            stats, missing = load_fixture_files(
+                options['fixtures_dir'], clear=options['clear'], batch_size=options['batch_size'],
+                progress=progress,
+            )
+        except (FixtureError, DeserializationError) as e:
+            raise CommandError(f'Фикстуры не загружены: {e}')
+
         if options['clear']:
-            self.stdout.write('Очистка существующих данных...')
-            # Очищаем в обратном порядке зависимостей
-            call_command('shell', command='from game.models import *; LevelOption.objects.all().delete(); Level.objects.all().delete(); Topic.objects.all().delete()')
             self.stdout.write(self.style.WARNING('Данные очищены'))
-
-        # Загружаем фикстуры в правильном порядке
-        fixtures = [
-            'topics.json',
-            'levels.json', 
-            'level_options.json'
-        ]
-
-        for fixture in fixtures:
-            fixture_path = os.path.join(fixtures_dir, fixture)
-            if os.path.exists(fixture_path):
-                self.stdout.write(f'Загружаем {fixture}...')
-                call_command('loaddata', fixture_path)
-                self.stdout.write(self.style.SUCCESS(f'{fixture} загружен'))
-            else:
-                self.stdout.write(
-                    self.style.ERROR(f'Файл {fixture_path} не найден!')
-                )
+        for path in missing:
+            self.stdout.write(
+                self.style.ERROR(f'Файл {path} не найден!')
+            )
+        for item in stats:
+            self.stdout.write(self.style.SUCCESS(
+                f'{item.model}: создано {item.created}, обновлено {item.updated}'
+            ))
 
         self.stdout.write(
-            self.style.SUCCESS('Загрузка всех фикстур завершена!')
+            self.style.SUCCESS(f'Загрузка всех фикстур завершена за {time.perf_counter() - started:.1f} с!')
         )
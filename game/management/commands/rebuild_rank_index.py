@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from game.ranking import rebuild_rank_index, BUCKET_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает гистограмму очков рейтинга (LeaderboardScoreBucket) с нуля'
+
+    def handle(self, *args, **options):
+        players = rebuild_rank_index()
+        self.stdout.write(
+            self.style.SUCCESS(f'Гистограмма пересобрана: {players} игроков, шаг корзины {BUCKET_SIZE} очков')
+        )
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.related_articles import TOP_K, rebuild_related_articles
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие статьи (TF-IDF, top-K соседей на статью)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Соседей на статью')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        links = rebuild_related_articles(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие статьи пересчитаны: {links} связей за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс (статьи, темы, уровни) с нуля'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            documents = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Поисковый индекс пересобран: {documents} объектов'))
@@ -1,12 +1,22 @@
 """
 Middleware для безопасности и производительности
 """
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
 from django.http import HttpResponseForbidden
 from django.contrib.auth.signals import user_login_failed
 from django.dispatch import receiver
+import logging
 import time
 
+from .db_optimization import QueryBudget, QueryCounter
+from .leaderboard_sync import deferred_leaderboard_updates
+from .notifications import notification_outbox
+from .quests import deferred_quest_updates
+
+budget_logger = logging.getLogger('game.query_budget')
+
 
 class RateLimitMiddleware:
     """
@@ -79,6 +89,91 @@ class SecurityHeadersMiddleware:
         return response
 
 
+class DeferredUpdatesMiddleware:
+    """
+    Middleware для отложенных пакетных записей в конце запроса
+    
+    Пока обрабатывается запрос, прогресс ежедневных заданий и изменения
+    рейтинга только накапливаются и записываются пачками после ответа view.
+    Задания сбрасываются первыми: награды за них тоже меняют рейтинг.
+    Уведомления, созданные за запрос (в том числе при сбросе заданий),
+    записываются последними одной пачкой; уведомления из откаченных
+    транзакций отбрасываются (см. game/notifications.py).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with notification_outbox():
+            with deferred_leaderboard_updates():
+                with deferred_quest_updates():
+                    response = self.get_response(request)
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Middleware для учета запросов к БД в production
+    
+    Считает запросы и время БД за весь запрос через connection.execute_wrapper
+    (connection.queries заполняется только при DEBUG = True) и сравнивает
+    их с бюджетом view (декоратор db_optimization.query_budget, иначе
+    settings.QUERY_BUDGET_DEFAULT). При превышении пишет структурированную
+    строку в лог game.query_budget. При QUERY_BUDGET_SERVER_TIMING = True
+    добавляет заголовок Server-Timing с временем БД.
+    
+    Ставится раньше остальных middleware, чтобы учитывать и их запросы
+    (сессия, пакетные записи DeferredUpdatesMiddleware).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.default_budget = QueryBudget(**getattr(settings, 'QUERY_BUDGET_DEFAULT', {}))
+        self.server_timing = getattr(settings, 'QUERY_BUDGET_SERVER_TIMING', False)
+    
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        
+        db_ms = counter.duration * 1000
+        budget = getattr(request, 'query_budget', self.default_budget)
+        over_queries = budget.queries is not None and counter.count > budget.queries
+        over_time = budget.db_ms is not None and db_ms > budget.db_ms
+        if over_queries or over_time:
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match else request.path
+            budget_logger.warning(
+                "query budget exceeded view=%s method=%s status=%s queries=%d budget_queries=%s "
+                "db_ms=%.1f budget_db_ms=%s",
+                view, request.method, response.status_code, counter.count, budget.queries,
+                db_ms, budget.db_ms,
+                extra={
+                    'view': view,
+                    'method': request.method,
+                    'status': response.status_code,
+                    'queries': counter.count,
+                    'budget_queries': budget.queries,
+                    'db_ms': round(db_ms, 1),
+                    'budget_db_ms': budget.db_ms,
+                },
+            )
+        
+        if self.server_timing:
+            timing = f'db;dur={db_ms:.1f};desc="{counter.count} queries"'
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = getattr(view_func, 'query_budget', None)
+        if budget is not None:
+            request.query_budget = budget
+        return None
+
+
 @receiver(user_login_failed)
 def handle_failed_login(sender, credentials, request, **kwargs):
     """
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_topic_progress(apps, schema_editor):
+    UserLevelProgress = apps.get_model('game', 'UserLevelProgress')
+    UserTopicProgress = apps.get_model('game', 'UserTopicProgress')
+    rows = UserLevelProgress.objects.filter(completed=True).values('user_id', 'level__topic_id').annotate(
+        completed=Count('id'),
+        high_score=Count('id', filter=Q(score__gte=80)),
+        best_sum=Coalesce(Sum('best_score'), 0),
+    ).order_by()
+    UserTopicProgress.objects.bulk_create([
+        UserTopicProgress(
+            user_id=row['user_id'],
+            topic_id=row['level__topic_id'],
+            completed_count=row['completed'],
+            high_score_count=row['high_score'],
+            best_score_sum=row['best_sum'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0017_topic_is_subcategory_topic_parent_category'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTopicProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_count', models.IntegerField(default=0)),
+                ('high_score_count', models.IntegerField(default=0)),
+                ('best_score_sum', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.topic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Прогресс по теме',
+                'verbose_name_plural': 'Прогресс по темам',
+                'unique_together': {('user', 'topic')},
+            },
+        ),
+        migrations.RunPython(backfill_topic_progress, migrations.RunPython.noop),
+    ]
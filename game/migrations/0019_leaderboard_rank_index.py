@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rank_index(apps, schema_editor):
+    bucket_size = getattr(settings, 'LEADERBOARD_BUCKET_SIZE', 10)
+    Leaderboard = apps.get_model('game', 'Leaderboard')
+    LeaderboardScoreBucket = apps.get_model('game', 'LeaderboardScoreBucket')
+    counts = {}
+    for points in Leaderboard.objects.values_list('total_points', flat=True).iterator():
+        bucket = points // bucket_size
+        counts[bucket] = counts.get(bucket, 0) + 1
+    LeaderboardScoreBucket.objects.bulk_create([
+        LeaderboardScoreBucket(bucket=bucket, player_count=count)
+        for bucket, count in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0018_user_topic_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardScoreBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.IntegerField(unique=True)),
+                ('player_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Корзина гистограммы рейтинга',
+                'verbose_name_plural': 'Гистограмма рейтинга',
+                'ordering': ['bucket'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['total_points'], name='leaderboard_points_idx'),
+        ),
+        migrations.RunPython(build_rank_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+def create_index(apps, schema_editor):
+    from game.search import create_index_structures, rebuild_index
+    create_index_structures(schema_editor)
+    rebuild_index(apps)
+
+
+def drop_index(apps, schema_editor):
+    from game.search import drop_index_structures
+    drop_index_structures(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0020_quiz_attempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('article', 'Статья'), ('topic', 'Тема'), ('level', 'Уровень')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Документ поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
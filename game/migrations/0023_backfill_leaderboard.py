@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def backfill_leaderboard(apps, schema_editor):
+    """Записи рейтинга для пользователей без событий после 0019 и пересобранная гистограмма"""
+    bucket_size = getattr(settings, 'LEADERBOARD_BUCKET_SIZE', 10)
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Leaderboard = apps.get_model('game', 'Leaderboard')
+    LeaderboardScoreBucket = apps.get_model('game', 'LeaderboardScoreBucket')
+    UserTopicProgress = apps.get_model('game', 'UserTopicProgress')
+    UserAchievement = apps.get_model('game', 'UserAchievement')
+    Streak = apps.get_model('game', 'Streak')
+
+    users = User.objects.exclude(pk__in=Leaderboard.objects.values('user_id')).values_list('pk', 'points', 'coins')
+    entries = {
+        user_id: Leaderboard(user_id=user_id, total_points=points, total_coins=coins)
+        for user_id, points, coins in users
+    }
+    if not entries:
+        return
+    levels = UserTopicProgress.objects.filter(user_id__in=entries).values('user_id').annotate(
+        total=Sum('completed_count')
+    ).order_by()
+    for row in levels:
+        entries[row['user_id']].levels_completed = row['total'] or 0
+    achievements = UserAchievement.objects.filter(user_id__in=entries).values('user_id').annotate(
+        total=Count('id')
+    ).order_by()
+    for row in achievements:
+        entries[row['user_id']].achievements_count = row['total']
+    for user_id, streak in Streak.objects.filter(user_id__in=entries).values_list('user_id', 'current_streak'):
+        entries[user_id].streak_days = streak
+    Leaderboard.objects.bulk_create(entries.values(), batch_size=1000)
+
+    counts = {}
+    for points in Leaderboard.objects.values_list('total_points', flat=True).iterator():
+        bucket = max(points, 0) // bucket_size
+        counts[bucket] = counts.get(bucket, 0) + 1
+    LeaderboardScoreBucket.objects.all().delete()
+    LeaderboardScoreBucket.objects.bulk_create([
+        LeaderboardScoreBucket(bucket=bucket, player_count=count)
+        for bucket, count in counts.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0022_related_article'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -27,6 +27,16 @@ class Topic(models.Model):
     class Meta:
         ordering = ['main_category', 'order_in_category']
 
+class LevelQuerySet(models.QuerySet):
+    def summaries(self):
+        """
+        Уровни без content: для списков, где нужны только название,
+        порядок, сложность и награды. content подгружается лишь при
+        прохождении уровня (level_play).
+        """
+        return self.defer('content')
+
+
 class Level(models.Model):
     TOPIC_CHOICES = [
         ('savings', 'Накопления'),
@@ -57,6 +67,8 @@ class Level(models.Model):
     reward_coins = models.IntegerField(default=5)
     content = models.JSONField(default=dict, blank=True)  # Для хранения данных уровня
 
+    objects = LevelQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.topic.name} — {self.title}"
 
@@ -91,6 +103,49 @@ class UserLevelProgress(models.Model):
     def __str__(self):
         return f"{self.user.username} — {self.level.title} ({'✓' if self.completed else '✗'})"
 
+class QuizAttempt(models.Model):
+    """Текущая попытка прохождения викторины (см. game/quiz_attempts.py)"""
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE)
+    level = models.ForeignKey(Level, on_delete=models.CASCADE)
+    # Результат по каждому вопросу: [процент, ответ] или None, если вопрос еще без ответа
+    results = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'level')
+        verbose_name = "Попытка викторины"
+        verbose_name_plural = "Попытки викторин"
+
+    def __str__(self):
+        return f"{self.user.username} — {self.level.title} ({self.answered_count}/{len(self.results)})"
+
+    @property
+    def answered_count(self):
+        return sum(1 for result in self.results if result is not None)
+
+    @property
+    def is_complete(self):
+        return bool(self.results) and self.answered_count == len(self.results)
+
+class UserTopicProgress(models.Model):
+    """Денормализованные счетчики прогресса пользователя по теме (см. game/progress.py)"""
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE)
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
+    completed_count = models.IntegerField(default=0)  # пройденные уровни
+    high_score_count = models.IntegerField(default=0)  # пройденные с результатом ≥ 80%
+    best_score_sum = models.IntegerField(default=0)  # сумма лучших результатов пройденных уровней
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'topic')
+        verbose_name = "Прогресс по теме"
+        verbose_name_plural = "Прогресс по темам"
+
+    def __str__(self):
+        return f"{self.user.username} — {self.topic.name}: {self.completed_count}"
+
 class Achievement(models.Model):
     RARITY_CHOICES = [
         ('common', 'Обычная'),
@@ -184,6 +239,47 @@ class Article(models.Model):
     def __str__(self):
         return self.title
 
+class RelatedArticle(models.Model):
+    """Похожая статья: top-K соседей по TF-IDF, считаются заранее (см. game/related_articles.py)"""
+    article = models.ForeignKey(Article, related_name='related_links', on_delete=models.CASCADE)
+    related = models.ForeignKey(Article, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()  # 0 — самая похожая
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('article', 'rank')
+        ordering = ['article', 'rank']
+        verbose_name = "Похожая статья"
+        verbose_name_plural = "Похожие статьи"
+
+    def __str__(self):
+        return f"{self.article_id} → {self.related_id} ({self.score:.2f})"
+
+class SearchEntry(models.Model):
+    """
+    Документ поискового индекса (см. game/search.py): статья, тема или уровень.
+    Полнотекстовый индекс строится по этой таблице: FTS5 на SQLite,
+    столбец tsvector с GIN-индексом на PostgreSQL.
+    """
+    KIND_CHOICES = [
+        ('article', 'Статья'),
+        ('topic', 'Тема'),
+        ('level', 'Уровень'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+        verbose_name = "Документ поискового индекса"
+        verbose_name_plural = "Поисковый индекс"
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.title}"
+
 class AvatarItem(models.Model):
     name = models.CharField(max_length=50)
     image = models.ImageField(upload_to='avatars/items/')
@@ -201,13 +297,36 @@ class Leaderboard(models.Model):
     
     class Meta:
         ordering = ['-total_points', '-levels_completed', '-achievements_count']
+        indexes = [
+            models.Index(fields=['total_points'], name='leaderboard_points_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.total_points} очков"
     
     def get_rank(self):
-        """Возвращает текущий ранг пользователя"""
-        return Leaderboard.objects.filter(total_points__gt=self.total_points).count() + 1
+        """Возвращает текущий ранг пользователя (через гистограмму очков, см. game/ranking.py)"""
+        from .ranking import get_rank
+        return get_rank(self.total_points)
+    
+    def get_percentile(self):
+        """Возвращает, в какой верхний процент игроков входит пользователь"""
+        from .ranking import get_percentile
+        return get_percentile(self.total_points)
+
+
+class LeaderboardScoreBucket(models.Model):
+    """Гистограмма очков рейтинга: сколько игроков попадает в каждый диапазон"""
+    bucket = models.IntegerField(unique=True)  # total_points // LEADERBOARD_BUCKET_SIZE
+    player_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['bucket']
+        verbose_name = "Корзина гистограммы рейтинга"
+        verbose_name_plural = "Гистограмма рейтинга"
+
+    def __str__(self):
+        return f"Корзина {self.bucket}: {self.player_count}"
 
 
 class DailyQuest(models.Model):
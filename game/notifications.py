@@ -0,0 +1,122 @@
+"""
+Буфер уведомлений (outbox)
+
+Код игры не создает Notification напрямую, а вызывает notify(user, text).
+Внутри запроса или задания (см. DeferredUpdatesMiddleware и
+notification_outbox) уведомления копятся и в конце записываются одним
+bulk_create. Уведомление попадает в буфер только при фиксации транзакции,
+в которой оно создано (transaction.on_commit): при откате атомарного
+блока, например прохождения уровня, его уведомления отбрасываются.
+Настройка notifications_enabled проверяется один раз на пользователя,
+а не при каждом вызове.
+
+Число непрочитанных уведомлений хранится в кеше и поддерживается
+инкрементально: write_notifications увеличивает счетчик, «прочитать все»
+и «удалить все» обнуляют его. При промахе кеша счетчик пересчитывается
+из БД.
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Notification
+
+UNREAD_CACHE_TIMEOUT = 60 * 60 * 24
+
+_local = threading.local()
+
+
+class Outbox:
+    """Уведомления, накопленные за запрос или задание"""
+
+    def __init__(self):
+        self.enabled = {}
+        self.pending = []
+
+    def is_enabled(self, user):
+        if user.pk not in self.enabled:
+            self.enabled[user.pk] = getattr(user, 'notifications_enabled', True)
+        return self.enabled[user.pk]
+
+    def add(self, user, text):
+        if self.is_enabled(user):
+            # Вне транзакции on_commit срабатывает сразу
+            transaction.on_commit(partial(self.pending.append, Notification(user_id=user.pk, text=text)))
+
+    def flush(self):
+        # Регистрируется после add(), поэтому видит все зафиксированные уведомления
+        transaction.on_commit(self.write)
+
+    def write(self):
+        pending, self.pending = self.pending, []
+        if pending:
+            write_notifications(pending)
+
+
+def _outbox_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def notify(user, *texts):
+    """Ставит уведомления пользователю в очередь на запись"""
+    stack = _outbox_stack()
+    outbox = stack[-1] if stack else Outbox()
+    for text in texts:
+        outbox.add(user, text)
+    if not stack:
+        outbox.flush()
+
+
+@contextmanager
+def notification_outbox():
+    """Собирает уведомления внутри блока и записывает их одной пачкой"""
+    stack = _outbox_stack()
+    # Вложенный блок пишет в буфер внешнего
+    stack.append(stack[-1] if stack else Outbox())
+    try:
+        yield
+    finally:
+        outbox = stack.pop()
+        if not stack:
+            outbox.flush()
+
+
+def write_notifications(notifications):
+    Notification.objects.bulk_create(notifications)
+    added = {}
+    for notification in notifications:
+        added[notification.user_id] = added.get(notification.user_id, 0) + 1
+    for user_id, count in added.items():
+        try:
+            cache.incr(_unread_cache_key(user_id), count)
+        except ValueError:
+            # Счетчика нет в кеше — он будет пересчитан при чтении
+            pass
+
+
+def _unread_cache_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def get_unread_count(user):
+    """Количество непрочитанных уведомлений (без запросов, если счетчик в кеше)"""
+    key = _unread_cache_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user=user, is_read=False).count()
+        cache.add(key, count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+def reset_unread_count(user):
+    """Все уведомления пользователя прочитаны или удалены"""
+    cache.set(_unread_cache_key(user.pk), 0, UNREAD_CACHE_TIMEOUT)
+
+
+def forget_unread_count(user_id):
+    cache.delete(_unread_cache_key(user_id))
@@ -0,0 +1,83 @@
+"""
+Кеш целых страниц для анонимных посетителей
+
+Лендинг (dashboard без входа) одинаков для всех анонимных посетителей и
+отличается только вариантом верстки (мобильная/десктопная) и языком.
+Готовый ответ хранится в кеше под ключом из версии деплоя, языка и
+варианта, так что повторные запросы не трогают ни БД, ни шаблонизатор.
+
+Ответ отдается с ETag и Last-Modified; условный GET (If-None-Match /
+If-Modified-Since) получает 304 без тела. Версия деплоя
+(settings.DEPLOY_VERSION, иначе время запуска процесса) входит в ключ,
+поэтому после выкладки страница рендерится заново.
+"""
+import hashlib
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.translation import get_language
+
+from .context_processors import is_mobile_request
+
+PAGE_CACHE_TIMEOUT = 60 * 15
+
+CachedPage = namedtuple('CachedPage', ['content', 'content_type', 'etag', 'last_modified'])
+
+_started = str(int(time.time()))
+
+
+def deploy_version():
+    return getattr(settings, 'DEPLOY_VERSION', '') or _started
+
+
+def page_cache_key(request, name):
+    variant = 'mobile' if is_mobile_request(request) else 'desktop'
+    return f'page:{name}:{deploy_version()}:{get_language()}:{variant}'
+
+
+def _store(key, response, timeout):
+    content = response.content
+    page = CachedPage(
+        content=content,
+        content_type=response['Content-Type'],
+        etag='"%s"' % hashlib.md5(content, usedforsecurity=False).hexdigest(),
+        last_modified=int(time.time()),
+    )
+    cache.set(key, page, timeout)
+    return page
+
+
+def anonymous_page_cache(name, timeout=PAGE_CACHE_TIMEOUT):
+    """
+    Кеширует ответ view для анонимных GET/HEAD-запросов.
+    Авторизованные пользователи всегда получают свежую страницу.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            key = page_cache_key(request, name)
+            page = cache.get(key)
+            if page is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                page = _store(key, response, timeout)
+
+            response = HttpResponse(page.content, content_type=page.content_type)
+            response['ETag'] = page.etag
+            response['Last-Modified'] = http_date(page.last_modified)
+            patch_vary_headers(response, ('Cookie', 'User-Agent'))
+            return get_conditional_response(
+                request, etag=page.etag, last_modified=page.last_modified, response=response
+            )
+        return wrapper
+    return decorator
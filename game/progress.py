@@ -0,0 +1,169 @@
+"""
+Денормализованные счетчики прогресса по темам
+
+UserTopicProgress хранит для пары (пользователь, тема) количество
+пройденных уровней, количество пройденных с результатом ≥ 80% и сумму
+лучших результатов. Счетчики меняются в той же транзакции, что и
+UserLevelProgress, поэтому прогресс-бары строятся за O(тем) без
+сканирования всей истории пользователя.
+
+Каждое изменение счетчиков пользователя увеличивает его «поколение»
+прогресса (хранится в кеше). Поколение вместе с версией каталога входит
+в ключи закешированных фрагментов шаблонов (карточки категорий), так что
+фрагмент перерисовывается только после прохождения уровня или правки
+контента.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .catalog import get_catalog_version
+from .models import UserLevelProgress, UserTopicProgress
+
+HIGH_SCORE_THRESHOLD = 80
+
+
+def _generation_key(user_id):
+    return f'progress:generation:{user_id}'
+
+
+def get_progress_generation(user_id):
+    """Поколение прогресса пользователя (user_id=None — общее для всех)"""
+    key = _generation_key(user_id if user_id is not None else 'all')
+    generation = cache.get(key)
+    if generation is None:
+        generation = time.time_ns()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def bump_progress_generation(user_id=None):
+    """Помечает фрагменты с прогрессом пользователя (или всех) устаревшими после фиксации"""
+    key = _generation_key(user_id if user_id is not None else 'all')
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def progress_fragment_key(user):
+    """Ключ для {% cache %} фрагментов, зависящих от прогресса пользователя и каталога"""
+    return (
+        f'{user.pk}:{get_progress_generation(user.pk)}:'
+        f'{get_progress_generation(None)}:{get_catalog_version()}'
+    )
+
+
+def progress_state(progress):
+    """Снимок полей UserLevelProgress, от которых зависят счетчики"""
+    return (progress.completed, progress.score, progress.best_score)
+
+
+def _counters(state):
+    completed, score, best_score = state
+    if not completed:
+        return 0, 0, 0
+    high_score = 1 if score is not None and score >= HIGH_SCORE_THRESHOLD else 0
+    return 1, high_score, best_score or 0
+
+
+def save_level_progress(progress, level, before):
+    """
+    Сохраняет прогресс уровня и обновляет счетчики темы одной транзакцией.
+
+    before — результат progress_state() до изменения прогресса; если
+    счетчики от изменения не зависят, строка темы не трогается. Иначе она
+    пересчитывается агрегатом по уровням темы, а не прибавлением разницы:
+    две параллельные попытки с одним и тем же before не засчитают уровень
+    дважды.
+    """
+    if _counters(before) == _counters(progress_state(progress)):
+        progress.save()
+        return
+
+    with transaction.atomic():
+        progress.save()
+        topic_id = level.topic_id
+        totals = UserLevelProgress.objects.filter(
+            user_id=progress.user_id, level__topic_id=topic_id, completed=True
+        ).aggregate(
+            completed=Count('id'),
+            high_score=Count('id', filter=Q(score__gte=HIGH_SCORE_THRESHOLD)),
+            best_sum=Coalesce(Sum('best_score'), 0),
+        )
+        UserTopicProgress.objects.update_or_create(
+            user_id=progress.user_id, topic_id=topic_id,
+            defaults={
+                'completed_count': totals['completed'],
+                'high_score_count': totals['high_score'],
+                'best_score_sum': totals['best_sum'],
+            },
+        )
+        bump_progress_generation(progress.user_id)
+
+
+def get_topic_progress(user):
+    """Возвращает {topic_id: UserTopicProgress} одним запросом"""
+    return {
+        row.topic_id: row
+        for row in UserTopicProgress.objects.filter(user=user)
+    }
+
+
+def get_completed_counts(user):
+    """Возвращает {topic_id: количество пройденных уровней}"""
+    return dict(
+        UserTopicProgress.objects.filter(user=user).values_list('topic_id', 'completed_count')
+    )
+
+
+def reset_topic_progress(user):
+    UserTopicProgress.objects.filter(user=user).delete()
+    bump_progress_generation(user.pk)
+
+
+def rebuild_topic_progress(user_ids=None, batch_size=1000):
+    """
+    Пересчитывает счетчики из UserLevelProgress.
+
+    Нужна после массовых изменений в обход level_play (импорт, удаление
+    уровней, перенос уровней между темами). Возвращает число строк.
+    """
+    progress = UserLevelProgress.objects.filter(completed=True)
+    counters = UserTopicProgress.objects.all()
+    if user_ids is not None:
+        progress = progress.filter(user_id__in=user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+
+    rows = progress.values('user_id', 'level__topic_id').annotate(
+        completed=Count('id'),
+        high_score=Count('id', filter=Q(score__gte=HIGH_SCORE_THRESHOLD)),
+        best_sum=Coalesce(Sum('best_score'), 0),
+    ).order_by()
+
+    created = 0
+    with transaction.atomic():
+        counters.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(UserTopicProgress(
+                user_id=row['user_id'],
+                topic_id=row['level__topic_id'],
+                completed_count=row['completed'],
+                high_score_count=row['high_score'],
+                best_score_sum=row['best_sum'],
+            ))
+            if len(batch) >= batch_size:
+                UserTopicProgress.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            UserTopicProgress.objects.bulk_create(batch)
+            created += len(batch)
+        if user_ids is None:
+            bump_progress_generation()
+        else:
+            for user_id in user_ids:
+                bump_progress_generation(user_id)
+    return created
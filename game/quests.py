@@ -0,0 +1,210 @@
+"""
+Пакетный учет прогресса ежедневных заданий
+
+update_daily_quest_progress(user, quest_type, value) только накапливает
+приращения. Внутри запроса (см. DeferredUpdatesMiddleware) все приращения
+пользователя за запрос сливаются и в конце записываются одним upsert на
+задание (bulk_create(update_conflicts=True)); награды за выполненные
+задания начисляются одним атомарным UPDATE пользователя. Приращение
+попадает в пачку только при фиксации транзакции, в которой оно сделано
+(transaction.on_commit): откаченное прохождение уровня прогресс не
+двигает. Вне запроса (команды, shell) запись выполняется сразу.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .leaderboard_sync import mark_leaderboard_dirty
+from .models import DailyQuest, UserDailyProgress
+from .notifications import notify
+
+ACTIVE_QUESTS_CACHE_KEY = 'game:active_quests'
+
+_local = threading.local()
+
+
+class QuestBatch:
+    """Приращения прогресса заданий, накопленные за запрос"""
+
+    def __init__(self):
+        self.users = {}
+        self.increments = defaultdict(lambda: defaultdict(int))
+
+    def add(self, user, quest_type, value):
+        # Вне транзакции on_commit срабатывает сразу
+        transaction.on_commit(partial(self._record, user, quest_type, value))
+
+    def _record(self, user, quest_type, value):
+        self.users.setdefault(user.pk, user)
+        self.increments[user.pk][quest_type] += value
+
+    def flush(self):
+        # Регистрируется после add(), поэтому видит все зафиксированные приращения
+        transaction.on_commit(self.apply)
+
+    def apply(self):
+        increments, self.increments = self.increments, defaultdict(lambda: defaultdict(int))
+        for user_id, user_increments in increments.items():
+            apply_quest_progress(self.users[user_id], user_increments)
+
+
+def _batch_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def update_daily_quest_progress(user, quest_type, progress_value=1):
+    """Добавляет прогресс по ежедневным заданиям указанного типа"""
+    if not progress_value:
+        return
+    stack = _batch_stack()
+    if stack:
+        stack[-1].add(user, quest_type, progress_value)
+    else:
+        apply_quest_progress(user, {quest_type: progress_value})
+
+
+@contextmanager
+def deferred_quest_updates():
+    """Откладывает запись прогресса заданий до выхода из блока"""
+    stack = _batch_stack()
+    # Вложенный блок пишет в пачку внешнего
+    stack.append(stack[-1] if stack else QuestBatch())
+    try:
+        yield
+    finally:
+        batch = stack.pop()
+        if not stack:
+            batch.flush()
+
+
+def get_active_quests(quest_types=None):
+    """
+    Активные ежедневные задания (опционально только заданных типов).
+
+    Список кешируется и сбрасывается сигналами при изменении DailyQuest.
+    """
+    quests = cache.get(ACTIVE_QUESTS_CACHE_KEY)
+    if quests is None:
+        quests = list(DailyQuest.objects.filter(is_active=True).order_by('pk'))
+        cache.set(ACTIVE_QUESTS_CACHE_KEY, quests, None)
+    if quest_types is not None:
+        quests = [quest for quest in quests if quest.quest_type in quest_types]
+    return quests
+
+
+def invalidate_active_quests():
+    cache.delete(ACTIVE_QUESTS_CACHE_KEY)
+
+
+def get_daily_quests_for_user(user):
+    """Возвращает ежедневные задания с прогрессом пользователя за сегодня (один запрос)"""
+    quests = get_active_quests()
+    if not quests:
+        return []
+    progress_by_quest = {
+        progress.quest_id: progress
+        for progress in UserDailyProgress.objects.filter(
+            user=user, date=date.today(), quest_id__in=[quest.pk for quest in quests]
+        )
+    }
+
+    user_quests = []
+    for quest in quests:
+        user_progress = progress_by_quest.get(quest.pk)
+        if user_progress is not None:
+            progress_percent = min(100, int((user_progress.current_progress / quest.target_value) * 100))
+            is_completed = user_progress.completed_at is not None
+        else:
+            progress_percent = 0
+            is_completed = False
+        user_quests.append({
+            'quest': quest,
+            'progress': user_progress,
+            'progress_percent': progress_percent,
+            'is_completed': is_completed
+        })
+    return user_quests
+
+
+def apply_quest_progress(user, increments):
+    """
+    Записывает приращения прогресса {тип задания: значение} для пользователя.
+
+    Возвращает список заданий, выполненных в результате.
+    """
+    increments = {quest_type: value for quest_type, value in increments.items() if value}
+    quests = get_active_quests(list(increments))
+    if not quests:
+        return []
+
+    today = date.today()
+    now = timezone.now()
+    with transaction.atomic():
+        # Строки на сегодня создаем заранее, чтобы параллельные запросы
+        # не падали на unique_together и блокировали одни и те же строки
+        UserDailyProgress.objects.bulk_create(
+            [UserDailyProgress(user=user, quest=quest, date=today) for quest in quests],
+            ignore_conflicts=True
+        )
+        existing = {
+            row.quest_id: row
+            for row in UserDailyProgress.objects.select_for_update().filter(
+                user=user, quest__in=quests, date=today
+            )
+        }
+
+        rows = []
+        completed = []
+        for quest in quests:
+            row = existing[quest.pk]
+            if row.completed_at:
+                continue
+            current_progress = row.current_progress + increments[quest.quest_type]
+            completed_at = None
+            if current_progress >= quest.target_value:
+                completed_at = now
+                completed.append(quest)
+            rows.append(UserDailyProgress(
+                user=user, quest=quest, date=today,
+                current_progress=current_progress, completed_at=completed_at
+            ))
+
+        if rows:
+            UserDailyProgress.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'quest', 'date'],
+                update_fields=['current_progress', 'completed_at']
+            )
+        if completed:
+            _reward(user, completed)
+    return completed
+
+
+def _reward(user, quests):
+    """Начисляет награды за выполненные задания одним UPDATE"""
+    coins = sum(quest.reward_coins for quest in quests)
+    points = sum(quest.reward_points for quest in quests)
+    user.coins += coins
+    user.points += points
+    user.level_number = max(user.level_number, user.get_level_number())
+    user._meta.model.objects.filter(pk=user.pk).update(
+        coins=F('coins') + coins,
+        points=F('points') + points,
+        level_number=user.level_number
+    )
+    mark_leaderboard_dirty(user)
+
+    notify(user, *(
+        f"🎁 Задание выполнено! Получено {quest.reward_coins} монет и {quest.reward_points} очков!"
+        for quest in quests
+    ))
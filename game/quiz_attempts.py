@@ -0,0 +1,140 @@
+"""
+Хранилище попыток викторин
+
+Ответы на вопросы викторины больше не копятся в сессии: у пользователя
+есть одна строка QuizAttempt на уровень с компактным вектором результатов
+([процент, ответ] или None на каждый вопрос). Строка лежит в БД, поэтому
+попытку можно продолжить с другого устройства или worker'а.
+
+Попытка читается из БД одним запросом по уникальному индексу (user, level):
+кеш в памяти worker'а показывал бы устаревший вопрос после ответа на
+другом устройстве, а проверка его актуальности стоила бы того же запроса.
+Запись ответа перечитывает строку под блокировкой, так что повторная
+отправка формы не затирает чужие ответы. Просмотр страницы ничего не
+пишет: новая попытка создается первым ответом.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .grading import is_question_correct
+from .models import QuizAttempt
+
+
+def load_attempt(user, level):
+    """Последняя попытка пользователя по уровню (или None)"""
+    return QuizAttempt.objects.filter(user=user, level=level).first()
+
+
+def start_attempt(user, level, question_count):
+    """Начинает попытку заново"""
+    attempt, _ = QuizAttempt.objects.update_or_create(
+        user=user, level=level,
+        defaults={'results': [None] * question_count, 'finished_at': None, 'started_at': timezone.now()}
+    )
+    return attempt
+
+
+def get_active_attempt(user, level, question_count):
+    """
+    Незавершенная попытка по уровню для показа вопроса. Вместо завершенной
+    или устаревшей возвращается новая несохраненная попытка: завершенная
+    остается для страницы результата, пока не придет первый ответ.
+    """
+    attempt = load_attempt(user, level)
+    if attempt is None or attempt.finished_at or len(attempt.results) != question_count:
+        attempt = QuizAttempt(user_id=user.pk, level=level, results=[None] * question_count)
+    return attempt
+
+
+def record_answer(user, level, question_count, question_index, percentage, answer):
+    """
+    Сохраняет результат ответа на вопрос и возвращает обновленную попытку.
+    Когда отвечены все вопросы, попытка помечается завершенной.
+    """
+    with transaction.atomic():
+        attempt = QuizAttempt.objects.select_for_update().filter(user=user, level=level).first()
+        if attempt is None or attempt.finished_at or len(attempt.results) != question_count:
+            attempt = start_attempt(user, level, question_count)
+        attempt.results[question_index] = [percentage, answer]
+        if attempt.is_complete:
+            attempt.finished_at = timezone.now()
+        attempt.updated_at = timezone.now()
+        QuizAttempt.objects.filter(pk=attempt.pk).update(
+            results=attempt.results, finished_at=attempt.finished_at, updated_at=attempt.updated_at
+        )
+    return attempt
+
+
+def save_finished_attempt(user, level, results):
+    """Сохраняет попытку, отвеченную целиком за один раз (пакетная отправка)"""
+    attempt, _ = QuizAttempt.objects.update_or_create(
+        user=user, level=level,
+        defaults={'results': results, 'started_at': timezone.now(), 'finished_at': timezone.now()}
+    )
+    return attempt
+
+
+def get_finished_attempt(user, level):
+    """Завершенная попытка для страницы результата (или None)"""
+    attempt = load_attempt(user, level)
+    if attempt is not None and attempt.finished_at:
+        return attempt
+    return None
+
+
+def next_question_index(attempt):
+    """Первый вопрос без ответа"""
+    for index, result in enumerate(attempt.results):
+        if result is None:
+            return index
+    return len(attempt.results)
+
+
+def attempt_percentage(attempt):
+    """Общий процент попытки: среднее по вопросам"""
+    if not attempt.results:
+        return 0
+    return int(sum(result[0] for result in attempt.results if result is not None) / len(attempt.results))
+
+
+def describe_answer(question, answer):
+    """Текст ответа пользователя для страницы результата"""
+    question_type = question.get('type')
+    if question_type == 'matching':
+        return f"Сопоставлений: {len(answer)}"
+    if question_type == 'sorting':
+        return f"Порядок: {answer}"
+    if question_type == 'multiple':
+        return f"Выбрано: {len(answer)} из {len(question.get('options', []))} вариантов"
+    options = question.get('options', [])
+    if isinstance(answer, int) and 0 <= answer < len(options):
+        return options[answer].get('text', '')
+    return ''
+
+
+def build_quiz_results(level, attempt):
+    """Данные для шаблона level_result из завершенной попытки"""
+    questions = level.content.get('questions', [])
+    answers = []
+    for index, result in enumerate(attempt.results):
+        if result is None or index >= len(questions):
+            continue
+        percentage, answer = result
+        question = questions[index]
+        answers.append({
+            'question_index': index,
+            'correct': is_question_correct(question.get('type'), percentage),
+            'text': describe_answer(question, answer),
+            'question_text': question.get('question', ''),
+            'type': question.get('type') or 'single',
+            'percentage': percentage,
+        })
+    percentage = attempt_percentage(attempt)
+    return {
+        'total_questions': len(questions),
+        'correct_answers': sum(1 for answer in answers if answer['correct']),
+        'percentage': percentage,
+        'is_correct': percentage >= 80,
+        'answers': answers,
+        'questions': questions,
+    }
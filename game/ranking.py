@@ -0,0 +1,172 @@
+"""
+Ранг игрока в рейтинге без COUNT(*) по всей таблице
+
+Рейтинг поддерживает гистограмму очков (LeaderboardScoreBucket): сколько
+игроков попадает в каждый диапазон шириной LEADERBOARD_BUCKET_SIZE очков.
+Из гистограммы строится массив суффиксных сумм, который кешируется, так
+что число игроков выше заданной корзины находится бинарным поиском.
+
+- get_rank(points) — точный ранг: суффиксная сумма плюс подсчет внутри
+  одной корзины (узкий диапазон по индексу total_points);
+- get_rank(points, exact=False) — без запросов к Leaderboard, ошибка не
+  больше числа игроков в корзине (см. get_rank_bounds);
+- get_percentile(points) — «топ N%».
+
+Гистограмма обновляется инкрементально при изменении очков
+(record_score_change) и полностью пересобирается командой
+rebuild_rank_index. Кеш суффиксных сумм сбрасывается только в процессе,
+изменившем гистограмму (при LocMemCache — только в нем), поэтому живет не
+дольше RANK_INDEX_TIMEOUT: другие worker'ы отстают не больше чем на это
+время.
+"""
+import math
+from bisect import bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Leaderboard, LeaderboardScoreBucket
+
+BUCKET_SIZE = getattr(settings, 'LEADERBOARD_BUCKET_SIZE', 10)
+RANK_INDEX_CACHE_KEY = 'game:rank_index'
+RANK_INDEX_TIMEOUT = 60
+
+
+def bucket_for(points):
+    return max(points, 0) // BUCKET_SIZE
+
+
+class RankIndex:
+    """Отсортированные корзины и суффиксные суммы по ним"""
+
+    def __init__(self, rows):
+        self.buckets = []
+        self.counts = []
+        for bucket, count in rows:
+            if count > 0:
+                self.buckets.append(bucket)
+                self.counts.append(count)
+        # above[i] — сколько игроков в корзинах строго выше buckets[i]
+        self.above = [0] * len(self.buckets)
+        running = 0
+        for i in range(len(self.buckets) - 1, -1, -1):
+            self.above[i] = running
+            running += self.counts[i]
+        self.total = running
+
+    def count_above_bucket(self, bucket):
+        """Число игроков в корзинах строго выше заданной"""
+        i = bisect_right(self.buckets, bucket)
+        if i == len(self.buckets):
+            return 0
+        return self.above[i] + self.counts[i]
+
+    def count_in_bucket(self, bucket):
+        i = bisect_right(self.buckets, bucket) - 1
+        if i >= 0 and self.buckets[i] == bucket:
+            return self.counts[i]
+        return 0
+
+
+def get_rank_index():
+    index = cache.get(RANK_INDEX_CACHE_KEY)
+    if index is None:
+        index = RankIndex(LeaderboardScoreBucket.objects.order_by('bucket').values_list('bucket', 'player_count'))
+        cache.set(RANK_INDEX_CACHE_KEY, index, RANK_INDEX_TIMEOUT)
+    return index
+
+
+def get_rank_bounds(points):
+    """Диапазон возможных рангов без обращения к таблице рейтинга"""
+    index = get_rank_index()
+    bucket = bucket_for(points)
+    above = index.count_above_bucket(bucket)
+    return above + 1, above + max(index.count_in_bucket(bucket), 1)
+
+
+def get_rank(points, exact=True):
+    """Ранг игрока с заданным количеством очков (1 — лучший)"""
+    index = get_rank_index()
+    bucket = bucket_for(points)
+    above = index.count_above_bucket(bucket)
+    if exact:
+        # Внутри корзины считаем только узкий диапазон очков
+        above += Leaderboard.objects.filter(
+            total_points__gt=points,
+            total_points__lt=(bucket + 1) * BUCKET_SIZE
+        ).count()
+    return above + 1
+
+
+def get_percentile(points, exact=True):
+    """В какой верхний процент игроков входит результат (1 — топ 1%)"""
+    total = get_rank_index().total
+    if total == 0:
+        return 100
+    return max(1, min(100, math.ceil(get_rank(points, exact=exact) / total * 100)))
+
+
+def _adjust_bucket(bucket, delta):
+    updated = LeaderboardScoreBucket.objects.filter(bucket=bucket).update(
+        player_count=F('player_count') + delta
+    )
+    if not updated:
+        LeaderboardScoreBucket.objects.get_or_create(bucket=bucket)
+        LeaderboardScoreBucket.objects.filter(bucket=bucket).update(
+            player_count=F('player_count') + delta
+        )
+
+
+def record_score_changes(changes):
+    """
+    Применяет изменения очков к гистограмме.
+
+    changes — пары (старые очки, новые очки); None означает, что записи
+    в рейтинге не было (новый игрок) или она удалена.
+    """
+    deltas = {}
+    for old_points, new_points in changes:
+        if old_points is not None:
+            bucket = bucket_for(old_points)
+            deltas[bucket] = deltas.get(bucket, 0) - 1
+        if new_points is not None:
+            bucket = bucket_for(new_points)
+            deltas[bucket] = deltas.get(bucket, 0) + 1
+    deltas = {bucket: delta for bucket, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for bucket, delta in sorted(deltas.items()):
+            _adjust_bucket(bucket, delta)
+    forget_rank_index()
+
+
+def forget_rank_index():
+    """
+    Сбрасывает кеш суффиксных сумм сразу и еще раз после фиксации:
+    снимок, построенный до фиксации из старых корзин, не доживает до таймаута
+    """
+    cache.delete(RANK_INDEX_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(RANK_INDEX_CACHE_KEY))
+
+
+def record_score_change(old_points, new_points):
+    record_score_changes([(old_points, new_points)])
+
+
+def rebuild_rank_index():
+    """Полностью пересобирает гистограмму из таблицы рейтинга"""
+    counts = {}
+    for points in Leaderboard.objects.values_list('total_points', flat=True).iterator(chunk_size=5000):
+        bucket = bucket_for(points)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    with transaction.atomic():
+        LeaderboardScoreBucket.objects.all().delete()
+        LeaderboardScoreBucket.objects.bulk_create([
+            LeaderboardScoreBucket(bucket=bucket, player_count=count)
+            for bucket, count in counts.items()
+        ], batch_size=1000)
+    forget_rank_index()
+    return sum(counts.values())
@@ -0,0 +1,137 @@
+"""
+Похожие статьи по содержанию
+
+Вместо ORDER BY RANDOM() по всей теме на каждый просмотр похожие статьи
+считаются заранее (manage.py rebuild_related_articles, после импорта
+статей) и хранятся в RelatedArticle: top-K соседей на статью. Страница
+статьи читает их одним запросом по индексу, а случайность дает сдвиг
+по этому списку.
+
+Сходство — косинус между TF-IDF векторами (основы слов названия и текста,
+game/stemmer.py). Векторы разреженные, скалярные произведения
+накапливаются через инвертированный индекс «термин → статьи», поэтому
+сравниваются только статьи с общими терминами. Чтобы число пар не росло
+квадратично, косинус считается приближенно: слишком частые термины
+(MAX_DF) отбрасываются, соседей ищут по QUERY_TERMS самым весомым
+терминам статьи, а в списке каждого термина остаются POSTINGS_LIMIT
+статей с наибольшим весом. Статьи той же темы получают надбавку.
+"""
+import heapq
+import html
+import math
+import random
+from collections import Counter, namedtuple
+
+from django.db import transaction
+
+from .models import Article, RelatedArticle
+from .search import TAG_RE
+from .stemmer import stem, tokenize
+
+TOP_K = 12
+SHOW = 4
+MAX_DF = 0.5  # доля статей, выше которой термин считается стоп-словом
+MIN_STOPWORD_DF = 100  # на маленьком корпусе стоп-слова не отбрасываются
+QUERY_TERMS = 20  # сколько самых весомых терминов статьи ищут ей соседей
+POSTINGS_LIMIT = 100  # статей на термин в инвертированном индексе
+TITLE_WEIGHT = 2
+TOPIC_BONUS = 0.2  # статьи той же темы немного ближе
+
+Neighbour = namedtuple('Neighbour', ['article_id', 'score'])
+
+
+def article_terms(title, content):
+    """Частоты основ слов статьи; слова названия весят больше"""
+    terms = Counter()
+    for weight, text in ((TITLE_WEIGHT, title), (1, html.unescape(TAG_RE.sub(' ', content or '')))):
+        for word in tokenize(text):
+            if len(word) > 2 and not word.isdigit():
+                terms[stem(word)] += weight
+    return terms
+
+
+def compute_related(documents, top_k=TOP_K):
+    """
+    documents: [(id, topic_id, Counter терминов)].
+    Возвращает {id: [Neighbour, ...]} — до top_k соседей по убыванию сходства.
+    """
+    total = len(documents)
+    df = Counter()
+    for _, _, terms in documents:
+        df.update(terms.keys())
+    max_df = max(MIN_STOPWORD_DF, MAX_DF * total)
+
+    # Векторы: сублинейный tf * idf, нормированные по L2
+    vectors = []
+    postings = {}
+    for index, (_, _, terms) in enumerate(documents):
+        vector = {term: (1 + math.log(count)) * math.log(total / df[term]) for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        # Термины одной статьи не дают пар, стоп-слова дают слишком много — в индекс не идут
+        vector = {term: weight / norm for term, weight in vector.items() if 1 < df[term] <= max_df}
+        vectors.append(vector)
+        for term, weight in vector.items():
+            postings.setdefault(term, []).append((weight, index))
+
+    # В списке статьи термина остаются только те, для которых он важнее всего
+    for term, items in postings.items():
+        if len(items) > POSTINGS_LIMIT:
+            postings[term] = heapq.nlargest(POSTINGS_LIMIT, items)
+
+    related = {}
+    for index, vector in enumerate(vectors):
+        topic_id = documents[index][1]
+        scores = {}
+        get = scores.get
+        for term in heapq.nlargest(QUERY_TERMS, vector, key=vector.get):
+            weight = vector[term]
+            for other_weight, other in postings[term]:
+                scores[other] = get(other, 0.0) + weight * other_weight
+        scores.pop(index, None)
+        for other in scores:
+            if documents[other][1] == topic_id:
+                scores[other] *= 1 + TOPIC_BONUS
+        best = heapq.nlargest(top_k, scores, key=scores.get)
+        related[documents[index][0]] = [Neighbour(documents[other][0], scores[other]) for other in best]
+    return related
+
+
+def rebuild_related_articles(top_k=TOP_K, batch_size=2000):
+    """Пересчитывает таблицу похожих статей целиком; возвращает число связей"""
+    documents = [
+        (article_id, topic_id, article_terms(title, content))
+        for article_id, topic_id, title, content in Article.objects.order_by('id').values_list(
+            'id', 'topic_id', 'title', 'content'
+        ).iterator(chunk_size=batch_size)
+    ]
+    related = compute_related(documents, top_k)
+    links = [
+        RelatedArticle(article_id=article_id, related_id=neighbour.article_id, rank=rank, score=neighbour.score)
+        for article_id, neighbours in related.items()
+        for rank, neighbour in enumerate(neighbours)
+    ]
+    with transaction.atomic():
+        RelatedArticle.objects.all().delete()
+        RelatedArticle.objects.bulk_create(links, batch_size=batch_size)
+    return len(links)
+
+
+def get_related_articles(article, count=SHOW, rng=random):
+    """
+    count похожих статей: один запрос по индексу (article, rank) и случайный
+    сдвиг по списку соседей, чтобы подборка менялась между просмотрами.
+    Для статей, добавленных после пересчета, — последние статьи той же темы.
+    """
+    links = list(
+        RelatedArticle.objects.filter(article=article).select_related('related').only(
+            'rank', 'related__id', 'related__title'
+        )
+    )
+    if not links:
+        return list(
+            Article.objects.filter(topic_id=article.topic_id).exclude(pk=article.pk).only('id', 'title')
+            .order_by('-id')[:count]
+        )
+    offset = rng.randrange(len(links))
+    rotated = links[offset:] + links[:offset]
+    return [link.related for link in rotated[:count]]
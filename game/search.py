@@ -0,0 +1,235 @@
+"""
+Полнотекстовый поиск по статьям, темам и уровням
+
+Каждый объект представлен строкой SearchEntry (kind, object_id, title, body).
+Инвертированный индекс зависит от СУБД:
+- SQLite: виртуальная таблица FTS5 (rowid = SearchEntry.id). В FTS5 нет
+  русской морфологии, поэтому в нее пишутся основы слов (game/stemmer.py),
+  и запрос стеммится тем же алгоритмом;
+- PostgreSQL: столбец search_vector (tsvector, вычисляется из title/body
+  с конфигурацией russian) и GIN-индекс по нему;
+- остальные СУБД: поиск по icontains без индекса.
+
+Индекс обновляется инкрементально: сигналы post_save / post_delete для
+поштучных изменений, index_objects() — в массовых загрузках (импорт
+статей, фикстуры, синхронизация каталога). rebuild_index() строит индекс
+заново (manage.py rebuild_search_index).
+
+Результаты ранжируются по всему индексу: BM25 в FTS5 (совпадение в
+названии весит TITLE_WEIGHT) или ts_rank_cd по GIN-индексу. Сортировка с
+LIMIT выполняется внутри индекса, к таблице SearchEntry присоединяется
+только одна страница. Время запроса растет с числом совпадений, а не с
+размером корпуса; дороже всего слова, встречающиеся почти в каждой статье.
+"""
+import html
+import re
+from collections import namedtuple
+from itertools import islice
+
+from django.apps import apps as global_apps
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+
+from .stemmer import stem, stem_text, tokenize
+
+FTS_TABLE = 'game_searchentry_fts'
+VECTOR_INDEX = 'game_searchentry_vector_idx'
+PER_PAGE = 20
+SNIPPET_LENGTH = 200
+TITLE_WEIGHT = 5.0  # вес совпадения в названии относительно текста (bm25)
+TAG_RE = re.compile(r'<[^>]*>')
+
+# Вид документа (model_name индексируемой модели) → url страницы объекта
+KINDS = {
+    'article': 'article_detail',
+    'topic': 'topic_levels',
+    'level': 'level_play',
+}
+
+SearchResult = namedtuple('SearchResult', ['kind', 'object_id', 'title', 'snippet', 'url'])
+SearchPage = namedtuple('SearchPage', ['query', 'results', 'number', 'has_next'])
+
+
+def create_index_structures(schema_editor):
+    """Создает FTS5-таблицу или столбец tsvector с GIN-индексом (вызывается из миграции)"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, body, tokenize='unicode61 remove_diacritics 0')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "ALTER TABLE game_searchentry ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('russian', title), 'A') || "
+            "setweight(to_tsvector('russian', body), 'B')) STORED"
+        )
+        schema_editor.execute(f"CREATE INDEX {VECTOR_INDEX} ON game_searchentry USING GIN (search_vector)")
+
+
+def drop_index_structures(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX}")
+        schema_editor.execute("ALTER TABLE game_searchentry DROP COLUMN IF EXISTS search_vector")
+
+
+def _document(obj):
+    """(title, body) объекта для индекса или None, если объект не должен находиться"""
+    kind = obj._meta.model_name
+    if kind == 'article':
+        # Теги заменяем пробелами: соседние ячейки таблицы не должны слипаться в одно слово
+        return obj.title, html.unescape(TAG_RE.sub(' ', obj.content))
+    if kind == 'topic':
+        return (obj.name, obj.description) if obj.is_active else None
+    return obj.title, obj.description
+
+
+def _update_fts(removed, entries):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if removed:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in removed])
+        if entries:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+                [(entry.pk, stem_text(entry.title), stem_text(entry.body)) for entry in entries],
+            )
+
+
+def _sync_entries(entry_model, kind, documents):
+    """documents: {object_id: (title, body) или None}; приводит индекс в соответствие"""
+    existing = {
+        entry.object_id: entry
+        for entry in entry_model.objects.filter(kind=kind, object_id__in=list(documents))
+    }
+    create, update, delete = [], [], []
+    for object_id, document in documents.items():
+        entry = existing.get(object_id)
+        if document is None:
+            if entry is not None:
+                delete.append(entry.pk)
+            continue
+        title, body = document[0][:200], ' '.join((document[1] or '').split())
+        if entry is None:
+            create.append(entry_model(kind=kind, object_id=object_id, title=title, body=body))
+        elif (entry.title, entry.body) != (title, body):
+            entry.title, entry.body = title, body
+            update.append(entry)
+
+    entry_model.objects.bulk_create(create)
+    if create and create[0].pk is None:
+        # СУБД без RETURNING в bulk_create: id новых строк читаем отдельно
+        create = list(entry_model.objects.filter(kind=kind, object_id__in=[e.object_id for e in create]))
+    if update:
+        entry_model.objects.bulk_update(update, ['title', 'body'])
+    if delete:
+        entry_model.objects.filter(pk__in=delete).delete()
+    _update_fts(delete + [entry.pk for entry in update], create + update)
+
+
+def index_objects(objects):
+    """Добавляет или обновляет в индексе статьи, темы и уровни"""
+    from .models import SearchEntry
+    by_kind = {}
+    for obj in objects:
+        by_kind.setdefault(obj._meta.model_name, {})[obj.pk] = _document(obj)
+    for kind, documents in by_kind.items():
+        _sync_entries(SearchEntry, kind, documents)
+
+
+def remove_objects(objects):
+    """Убирает объекты из индекса"""
+    from .models import SearchEntry
+    by_kind = {}
+    for obj in objects:
+        by_kind.setdefault(obj._meta.model_name, {})[obj.pk] = None
+    for kind, documents in by_kind.items():
+        _sync_entries(SearchEntry, kind, documents)
+
+
+def rebuild_index(apps=global_apps, batch_size=1000):
+    """Строит индекс заново; apps — реестр моделей (в миграции — исторический)"""
+    entry_model = apps.get_model('game', 'SearchEntry')
+    entry_model.objects.all().delete()
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    total = 0
+    for kind in KINDS:
+        model = apps.get_model('game', kind)
+        objects = model.objects.order_by('pk').iterator(chunk_size=batch_size)
+        while batch := list(islice(objects, batch_size)):
+            _sync_entries(entry_model, kind, {obj.pk: _document(obj) for obj in batch})
+            total += len(batch)
+    return total
+
+
+def _snippet(body, stems):
+    lowered = body.lower().replace('ё', 'е')
+    positions = [
+        match.start() for match in (re.search(r'\b' + re.escape(term), lowered) for term in stems) if match
+    ]
+    start = max(0, min(positions) - SNIPPET_LENGTH // 4) if positions else 0
+    if start:
+        # Не режем слово пополам
+        space = body.find(' ', start)
+        start = space + 1 if 0 <= space < start + 20 else start
+    end = start + SNIPPET_LENGTH
+    return ('…' if start else '') + body[start:end].strip() + ('…' if end < len(body) else '')
+
+
+def _rows(query, stems, limit, offset):
+    """(id, kind, object_id, title, body) найденных документов по убыванию релевантности"""
+    if connection.vendor == 'sqlite':
+        # Страница выбирается по bm25 внутри FTS5 (bm25 < 0, лучшие — первые),
+        # текст документов читается только для нее
+        match = ' AND '.join(f'"{term}"*' for term in stems)
+        sql = (
+            f'SELECT e.id, e.kind, e.object_id, e.title, e.body FROM ('
+            f'SELECT rowid, bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s ORDER BY score, rowid LIMIT %s OFFSET %s'
+            f') page JOIN game_searchentry e ON e.id = page.rowid '
+            f'ORDER BY page.score, e.id'
+        )
+        params = [match, limit, offset]
+    elif connection.vendor == 'postgresql':
+        sql = (
+            "SELECT id, kind, object_id, title, body FROM game_searchentry, "
+            "websearch_to_tsquery('russian', %s) query WHERE search_vector @@ query "
+            "ORDER BY ts_rank_cd(search_vector, query) DESC, id LIMIT %s OFFSET %s"
+        )
+        params = [query, limit, offset]
+    else:
+        from .models import SearchEntry
+        condition = Q()
+        for word in tokenize(query):
+            condition &= Q(title__icontains=word) | Q(body__icontains=word)
+        return SearchEntry.objects.filter(condition).order_by('-id').values_list(
+            'id', 'kind', 'object_id', 'title', 'body'
+        )[offset:offset + limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search(query, page=1, per_page=PER_PAGE):
+    """
+    Страница результатов поиска. Общее число совпадений не считается:
+    стоимость подсчета, как и ранжирования, росла бы вместе с корпусом.
+    """
+    stems = [stem(word) for word in tokenize(query)]
+    page = max(page, 1)
+    if not stems:
+        return SearchPage(query, [], page, False)
+
+    rows = list(_rows(query, stems, per_page + 1, (page - 1) * per_page))
+    results = [
+        SearchResult(kind, object_id, title, _snippet(body, stems), reverse(KINDS[kind], args=[object_id]))
+        for _, kind, object_id, title, body in rows[:per_page]
+    ]
+    return SearchPage(query, results, page, len(rows) > per_page)
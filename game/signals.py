@@ -0,0 +1,68 @@
+"""
+Сигналы приложения game
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .catalog import bump_catalog_version
+from .models import Topic, Level, LevelOption, Hint, Achievement, Leaderboard, DailyQuest, Notification, Article
+from .notifications import forget_unread_count
+from .quests import invalidate_active_quests
+from .ranking import record_score_change
+from .search import index_objects, remove_objects
+
+CATALOG_MODELS = (Topic, Level, LevelOption, Hint, Achievement)
+
+
+def invalidate_catalog_on_change(sender, **kwargs):
+    """
+    Любое изменение контента делает снимок каталога устаревшим.
+    Версия поднимается после фиксации: иначе другой worker успел бы
+    перестроить снимок из старых данных под новой версией.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog_on_change, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog_on_change, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+
+
+def remove_from_rank_index(sender, instance, **kwargs):
+    """Удаленная запись рейтинга (например, вместе с пользователем) уходит из гистограммы"""
+    record_score_change(instance.total_points, None)
+
+
+post_delete.connect(remove_from_rank_index, sender=Leaderboard, dispatch_uid='rank_index_delete')
+
+
+def invalidate_active_quests_on_change(sender, **kwargs):
+    """Список активных заданий кешируется — сбрасываем при любом изменении"""
+    invalidate_active_quests()
+
+
+post_save.connect(invalidate_active_quests_on_change, sender=DailyQuest, dispatch_uid='active_quests_save')
+post_delete.connect(invalidate_active_quests_on_change, sender=DailyQuest, dispatch_uid='active_quests_delete')
+
+
+def forget_unread_count_on_change(sender, instance, **kwargs):
+    """Поштучные изменения (админка) сбрасывают счетчик непрочитанных — он пересчитается"""
+    forget_unread_count(instance.user_id)
+
+
+post_save.connect(forget_unread_count_on_change, sender=Notification, dispatch_uid='unread_count_save')
+post_delete.connect(forget_unread_count_on_change, sender=Notification, dispatch_uid='unread_count_delete')
+
+
+def index_on_save(sender, instance, **kwargs):
+    """Поисковый индекс обновляется вместе с объектом (в той же транзакции)"""
+    index_objects([instance])
+
+
+def remove_from_index(sender, instance, **kwargs):
+    remove_objects([instance])
+
+
+for model in (Article, Topic, Level):
+    post_save.connect(index_on_save, sender=model, dispatch_uid=f'search_save_{model.__name__}')
+    post_delete.connect(remove_from_index, sender=model, dispatch_uid=f'search_delete_{model.__name__}')
@@ -0,0 +1,106 @@
+"""
+Стеммер русского языка (алгоритм Snowball)
+
+Нужен поисковому индексу на SQLite: в FTS5 нет русской морфологии,
+поэтому в индекс и в запрос попадают основы слов, посчитанные здесь.
+На PostgreSQL то же делает to_tsvector('russian', ...).
+"""
+import re
+from functools import lru_cache
+
+VOWELS = 'аеиоуыэюя'
+
+# Окончания первой группы допустимы только после «а» или «я»
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+ADJECTIVE = ((), (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого',
+    'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+     'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = ((), (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+DERIVATIONAL = ((), ('ост', 'ость'))
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _ending(word, endings):
+    """Самое длинное подходящее окончание из (группа после а/я, обычная группа) или ''"""
+    after_a, plain = endings
+    best = ''
+    for ending in plain:
+        if len(ending) > len(best) and word.endswith(ending):
+            best = ending
+    for ending in after_a:
+        if len(ending) > len(best) and word.endswith(ending) and word[:-len(ending)].endswith(('а', 'я')):
+            best = ending
+    return best
+
+
+def _cut(word, endings):
+    ending = _ending(word, endings)
+    return (word[:-len(ending)], True) if ending else (word, False)
+
+
+def _region(word, start=0):
+    """Начало области после первой пары «гласная + согласная», начиная с start"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+# Словарь текстов ограничен, а стемминг — основная работа индексации
+@lru_cache(maxsize=100_000)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    match = re.search(f'[{VOWELS}]', word)
+    if match is None:
+        return word
+    # Все окончания ищутся в RV — части слова после первой гласной
+    head, rv = word[:match.end()], word[match.end():]
+    r2 = _region(word, _region(word))
+
+    rv, removed = _cut(rv, PERFECTIVE_GERUND)
+    if not removed:
+        rv, _ = _cut(rv, REFLEXIVE)
+        rv, removed = _cut(rv, ADJECTIVE)
+        if removed:
+            rv, _ = _cut(rv, PARTICIPLE)
+        else:
+            rv, removed = _cut(rv, VERB)
+            if not removed:
+                rv, _ = _cut(rv, NOUN)
+
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    ending = _ending(rv, DERIVATIONAL)
+    if ending and len(head) + len(rv) - len(ending) >= r2:
+        rv = rv[:-len(ending)]
+
+    rv, removed = _cut(rv, SUPERLATIVE)
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif not removed and rv.endswith('ь'):
+        rv = rv[:-1]
+    return head + rv
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+def stem_text(text):
+    """Текст → строка основ слов через пробел"""
+    return ' '.join(stem(word) for word in tokenize(text))
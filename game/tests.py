@@ -1,9 +1,35 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from game.models import Topic, Level, UserLevelProgress, Achievement, UserAchievement
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from game.models import (
+    Topic, Level, UserLevelProgress, UserTopicProgress, Achievement, UserAchievement, Leaderboard,
+    DailyQuest, UserDailyProgress, Notification, QuizAttempt, LevelOption, Article
+)
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from game.achievements import (
+    get_recent_achievements, dispatch, ANSWER_RECORDED, LEVEL_COMPLETED, POINTS_CHANGED, STREAK_CHANGED
+)
+from game.context_processors import achievements_context
+from game.answer_keys import clear_answer_keys, get_answer_key
+from game.catalog import get_catalog, invalidate_catalog
+from game.notifications import get_unread_count, notification_outbox, notify
+from game.quests import deferred_quest_updates, get_daily_quests_for_user, update_daily_quest_progress
+from game.progress import progress_state, save_level_progress
+from game.leaderboard_sync import deferred_leaderboard_updates, mark_leaderboard_dirty
+from game.ranking import get_percentile, get_rank, get_rank_bounds, get_rank_index, record_score_change
 from accounts.models import User
 import json
+import os
+import random
+import shutil
+import tempfile
+from unittest.mock import patch
 
 class UserModelTest(TestCase):
     """Тесты для модели User"""
@@ -337,4 +363,1675 @@ class AchievementTest(TestCase):
         self.assertEqual(self.user.get_achievements_count(), 1)
 
 
+
+class CatalogCacheTest(TestCase):
+    """Тесты для кеша каталога контента"""
+    
+    def setUp(self):
+        invalidate_catalog()
+        self.category = Topic.objects.create(name='Основы', main_category='basics')
+        self.topic = Topic.objects.create(
+            name='Бюджет',
+            main_category='basics',
+            is_subcategory=True,
+            parent_category=self.category
+        )
+        self.level = Level.objects.create(
+            topic=self.topic,
+            title='Первый',
+            description='Описание',
+            order_in_topic=1,
+            content={'questions': []}
+        )
+    
+    def test_catalog_holds_hierarchy_and_counts(self):
+        """Каталог содержит иерархию тем и количество уровней"""
+        catalog = get_catalog()
+        self.assertEqual(catalog.get_level_count(self.topic.id), 1)
+        self.assertEqual([t.id for t in catalog.get_subtopics(self.category.id)], [self.topic.id])
+        self.assertEqual(catalog.get_main_category('basics').id, self.category.id)
+        self.assertEqual(catalog.get_levels(self.topic.id)[0].title, 'Первый')
+    
+    def test_catalog_is_reused_without_queries(self):
+        """Повторное обращение к каталогу не ходит в БД"""
+        catalog = get_catalog()
+        with self.assertNumQueries(0):
+            self.assertIs(get_catalog(), catalog)
+    
+    def test_catalog_rebuilt_on_content_change(self):
+        """Сохранение контента сбрасывает версию каталога"""
+        catalog = get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            Level.objects.create(
+                topic=self.topic,
+                title='Второй',
+                description='Описание',
+                order_in_topic=2
+            )
+        new_catalog = get_catalog()
+        self.assertIsNot(new_catalog, catalog)
+        self.assertEqual(new_catalog.get_level_count(self.topic.id), 2)
+        self.assertEqual(new_catalog.get_next_level(self.level).title, 'Второй')
+    
+    def test_version_bumped_after_commit(self):
+        """До фиксации транзакции другие worker'ы видят прежнюю версию"""
+        from game.catalog import get_catalog_version
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.level.title = 'Переименован'
+            self.level.save()
+            self.assertEqual(get_catalog_version(), version)
+        self.assertNotEqual(get_catalog_version(), version)
+    
+    def test_topics_are_copies(self):
+        """Атрибуты, навешанные во view, не попадают в общий снимок"""
+        topic = get_catalog().get_topics()[0]
+        topic.progress = {'percent': 50}
+        self.assertFalse(hasattr(get_catalog().get_topics()[0], 'progress'))
+
+
+
+class UserTopicProgressTest(TestCase):
+    """Тесты для счетчиков прогресса по темам"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='progressuser', password='testpass123')
+        self.topic = Topic.objects.create(name='Сбережения', main_category='basics')
+        self.level = Level.objects.create(
+            topic=self.topic,
+            title='Квиз',
+            description='Описание',
+            order_in_topic=1,
+            type='quiz',
+            content={
+                'questions': [
+                    {
+                        'question': 'Вопрос?',
+                        'type': 'single',
+                        'options': [
+                            {'text': 'Верно', 'correct': True},
+                            {'text': 'Неверно', 'correct': False}
+                        ]
+                    }
+                ]
+            }
+        )
+        self.client.force_login(self.user)
+    
+    def complete_level(self, answer=0):
+        self.client.get(reverse('level_play', args=[self.level.id]))
+        return self.client.post(reverse('level_play', args=[self.level.id]), {
+            'question_index': 0,
+            'answer': answer,
+        })
+    
+    def test_counters_updated_on_completion(self):
+        """Прохождение уровня увеличивает счетчики темы"""
+        self.complete_level()
+        counters = UserTopicProgress.objects.get(user=self.user, topic=self.topic)
+        self.assertEqual(counters.completed_count, 1)
+        self.assertEqual(counters.high_score_count, 1)
+        self.assertEqual(counters.best_score_sum, 100)
+    
+    def test_failed_attempt_does_not_count(self):
+        """Неудачная попытка не создает счетчиков"""
+        self.complete_level(answer=1)
+        self.assertFalse(UserTopicProgress.objects.filter(user=self.user).exists())
+    
+    def test_repeat_completion_counted_once(self):
+        """Повторное прохождение не увеличивает счетчик"""
+        self.complete_level()
+        self.complete_level()
+        counters = UserTopicProgress.objects.get(user=self.user, topic=self.topic)
+        self.assertEqual(counters.completed_count, 1)
+    
+    def test_concurrent_completion_counted_once(self):
+        """Две попытки с одним и тем же снимком «до» не засчитывают уровень дважды"""
+        first = UserLevelProgress.objects.create(user=self.user, level=self.level)
+        second = UserLevelProgress.objects.get(pk=first.pk)
+        before = progress_state(first)
+        for progress in (first, second):
+            progress.completed = True
+            progress.score = progress.best_score = 100
+            save_level_progress(progress, self.level, before)
+        counters = UserTopicProgress.objects.get(user=self.user, topic=self.topic)
+        self.assertEqual(counters.completed_count, 1)
+        self.assertEqual(counters.best_score_sum, 100)
+    
+    def test_backfill_command(self):
+        """Команда пересчета восстанавливает счетчики из истории"""
+        UserLevelProgress.objects.create(user=self.user, level=self.level, completed=True, score=60, best_score=60)
+        call_command('backfill_topic_progress', stdout=StringIO())
+        counters = UserTopicProgress.objects.get(user=self.user, topic=self.topic)
+        self.assertEqual(counters.completed_count, 1)
+        self.assertEqual(counters.high_score_count, 0)
+        self.assertEqual(counters.best_score_sum, 60)
+
+
+
+class AchievementEngineTest(TestCase):
+    """Тесты для событийного движка достижений"""
+    
+    def setUp(self):
+        cache.clear()
+        invalidate_catalog()
+        self.user = User.objects.create_user(username='engineuser', password='testpass123')
+        self.topic = Topic.objects.create(name='Кредиты', main_category='basics')
+        self.level = Level.objects.create(
+            topic=self.topic,
+            title='Кредит',
+            description='Описание',
+            order_in_topic=1
+        )
+        Achievement.objects.create(name='Первые шаги', description='Первый уровень')
+    
+    def complete_level(self):
+        progress = UserLevelProgress.objects.create(user=self.user, level=self.level)
+        before = progress_state(progress)
+        progress.completed = True
+        progress.score = progress.best_score = 100
+        save_level_progress(progress, self.level, before)
+    
+    def test_level_completion_awards_topic_master(self):
+        """Прохождение всех уровней темы дает «Мастер темы» и «Первые шаги»"""
+        self.complete_level()
+        awarded = {a['name'] for a in dispatch(self.user, LEVEL_COMPLETED)}
+        self.assertEqual(awarded, {'Первые шаги', 'Мастер Кредиты'})
+        self.assertEqual(UserAchievement.objects.filter(user=self.user).count(), 2)
+    
+    def test_awards_are_not_repeated(self):
+        """Повторное событие не выдает достижения заново"""
+        self.complete_level()
+        dispatch(self.user, LEVEL_COMPLETED)
+        self.assertEqual(dispatch(self.user, LEVEL_COMPLETED), [])
+    
+    def test_only_affected_rules_evaluated(self):
+        """Событие серии не трогает правила по уровням"""
+        self.complete_level()
+        self.assertEqual(dispatch(self.user, STREAK_CHANGED), [])
+        self.assertFalse(UserAchievement.objects.filter(user=self.user).exists())
+    
+    def test_points_milestone(self):
+        """Правило по очкам срабатывает на изменение очков"""
+        self.user.points = 600
+        awarded = [a['name'] for a in dispatch(self.user, POINTS_CHANGED)]
+        self.assertEqual(awarded, ['Богач 500'])
+    
+    def test_first_steps_on_first_answer(self):
+        """«Первые шаги» выдаются за первый ответ, даже если уровень не пройден"""
+        UserLevelProgress.objects.create(user=self.user, level=self.level, attempts=1, score=40)
+        awarded = [a['name'] for a in dispatch(self.user, ANSWER_RECORDED)]
+        self.assertEqual(awarded, ['Первые шаги'])
+    
+    def test_concurrent_grant_not_rewarded_twice(self):
+        """Достижение, уже вставленное параллельным запросом, не дает второго уведомления"""
+        self.complete_level()
+        dispatch(self.user, STREAK_CHANGED)  # кеш полученных достижений еще пуст
+        achievement = Achievement.objects.get(name='Первые шаги')
+        UserAchievement.objects.create(user=self.user, achievement=achievement)
+        with self.captureOnCommitCallbacks(execute=True):
+            awarded = {a['name'] for a in dispatch(self.user, LEVEL_COMPLETED)}
+        self.assertEqual(awarded, {'Мастер Кредиты'})
+        self.assertEqual(
+            list(Notification.objects.filter(user=self.user).values_list('text', flat=True)),
+            ['🏆 Получено достижение: Мастер Кредиты']
+        )
+
+
+
+class RankIndexTest(TestCase):
+    """Тесты для ранга по гистограмме очков"""
+    
+    def setUp(self):
+        cache.clear()
+        self.entries = []
+        for i, points in enumerate([0, 5, 12, 12, 18, 40, 95, 250]):
+            user = User.objects.create(username=f'ranked{i}')
+            self.entries.append(Leaderboard.objects.create(user=user, total_points=points))
+        call_command('rebuild_rank_index', stdout=StringIO())
+    
+    def test_exact_rank_matches_count(self):
+        """Точный ранг совпадает с подсчетом COUNT(*)"""
+        for entry in self.entries:
+            expected = Leaderboard.objects.filter(total_points__gt=entry.total_points).count() + 1
+            self.assertEqual(entry.get_rank(), expected)
+    
+    def test_approximate_rank_within_bounds(self):
+        """Приблизительный ранг лежит в пределах одной корзины"""
+        low, high = get_rank_bounds(12)
+        self.assertLessEqual(low, get_rank(12))
+        self.assertGreaterEqual(high, get_rank(12))
+        self.assertEqual(get_rank(12, exact=False), low)
+    
+    def test_percentile(self):
+        """Лучший игрок входит в топ-13% из восьми"""
+        self.assertEqual(get_percentile(250), 13)
+        self.assertEqual(get_percentile(0), 100)
+    
+    def test_incremental_update(self):
+        """Изменение очков сдвигает игрока между корзинами"""
+        entry = self.entries[0]
+        record_score_change(entry.total_points, 300)
+        entry.total_points = 300
+        entry.save()
+        self.assertEqual(entry.get_rank(), 1)
+        entry.delete()
+        self.assertEqual(get_rank_index().total, len(self.entries) - 1)
+    
+    def test_index_expires_in_other_workers(self):
+        """Гистограмма, измененная другим процессом, видна после таймаута кеша"""
+        import time
+        from django.db.models import F
+        from game.models import LeaderboardScoreBucket
+        from game.ranking import RANK_INDEX_TIMEOUT
+        get_rank_index()
+        # Другой worker добавил игрока: локальный кеш он сбросить не может
+        LeaderboardScoreBucket.objects.filter(bucket=0).update(player_count=F('player_count') + 1)
+        self.assertEqual(get_rank_index().total, len(self.entries))
+        later = time.time() + RANK_INDEX_TIMEOUT + 1
+        with patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(get_rank_index().total, len(self.entries) + 1)
+
+
+class LeaderboardSyncTest(TestCase):
+    """Тесты для отложенного обновления рейтинга"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='syncuser', points=120, coins=30)
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def test_dashboard_does_not_write_leaderboard(self):
+        """Просмотр dashboard не пишет в таблицу рейтинга"""
+        self.client.get(reverse('dashboard'))
+        self.assertFalse(Leaderboard.objects.filter(user=self.user).exists())
+    
+    def test_mark_dirty_outside_request_flushes_immediately(self):
+        """Вне запроса запись рейтинга пересчитывается сразу"""
+        mark_leaderboard_dirty(self.user)
+        entry = Leaderboard.objects.get(user=self.user)
+        self.assertEqual(entry.total_points, 120)
+        self.assertEqual(entry.total_coins, 30)
+        self.assertEqual(get_rank_index().total, 1)
+    
+    def test_backfill_creates_missing_entries(self):
+        """Пользователи без событий попадают в рейтинг после backfill_leaderboard"""
+        mark_leaderboard_dirty(self.user)
+        idle = User.objects.create(username='idle', points=40)
+        out = StringIO()
+        call_command('backfill_leaderboard', stdout=out)
+        self.assertIn('1 пользователей', out.getvalue())
+        self.assertEqual(Leaderboard.objects.get(user=idle).total_points, 40)
+        self.assertEqual(get_rank_index().total, 2)
+    
+    def test_concurrent_insert_keeps_histogram_exact(self):
+        """Запись, созданная параллельным запросом, не учитывается в гистограмме дважды"""
+        from game import leaderboard_sync
+        from game.models import LeaderboardScoreBucket
+        other = User.objects.create(username='syncrival', points=10)
+        insert_entries = leaderboard_sync._insert_entries
+        
+        def rival_first(entries):
+            # Параллельный запрос успел создать запись со старыми очками
+            Leaderboard.objects.create(user=self.user, total_points=50)
+            record_score_change(None, 50)
+            return insert_entries(entries)
+        
+        with patch.object(leaderboard_sync, '_insert_entries', side_effect=rival_first):
+            leaderboard_sync.flush_leaderboard([self.user.pk, other.pk])
+        self.assertEqual(Leaderboard.objects.get(user=self.user).total_points, 120)
+        self.assertEqual(Leaderboard.objects.get(user=other).total_points, 10)
+        self.assertEqual(
+            dict(LeaderboardScoreBucket.objects.filter(player_count__gt=0).values_list('bucket', 'player_count')),
+            {12: 1, 1: 1}
+        )
+        self.assertEqual(get_rank(120), 1)
+    
+    def test_deferred_updates_flush_once(self):
+        """Несколько пометок внутри блока дают один пересчет в конце"""
+        other = User.objects.create(username='syncother', points=10)
+        mark_leaderboard_dirty(self.user)
+        with deferred_leaderboard_updates():
+            User.objects.filter(pk=self.user.pk).update(points=200)
+            mark_leaderboard_dirty(self.user)
+            mark_leaderboard_dirty(self.user)
+            mark_leaderboard_dirty(other)
+            self.assertFalse(Leaderboard.objects.filter(user=other).exists())
+            self.assertEqual(Leaderboard.objects.get(user=self.user).total_points, 120)
+        self.assertEqual(Leaderboard.objects.get(user=self.user).total_points, 200)
+        self.assertEqual(Leaderboard.objects.get(user=other).total_points, 10)
+        self.assertEqual(get_rank(200), 1)
+        self.assertEqual(get_rank(10), 2)
+
+
+class DailyQuestProgressTest(TestCase):
+    """Тесты для пакетного учета ежедневных заданий"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='questuser')
+        self.levels_quest = DailyQuest.objects.create(
+            title='Уровни', description='', quest_type='levels_completed',
+            target_value=3, reward_coins=50, reward_points=25
+        )
+        self.points_quest = DailyQuest.objects.create(
+            title='Очки', description='', quest_type='points_earned',
+            target_value=100, reward_coins=40, reward_points=20
+        )
+    
+    def progress(self, quest):
+        return UserDailyProgress.objects.get(user=self.user, quest=quest)
+    
+    def test_increments_merged_within_batch(self):
+        """Приращения за запрос записываются только в конце блока"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_quest_updates():
+                update_daily_quest_progress(self.user, 'levels_completed', 1)
+                update_daily_quest_progress(self.user, 'points_earned', 30)
+                update_daily_quest_progress(self.user, 'points_earned', 30)
+            self.assertFalse(UserDailyProgress.objects.exists())
+        self.assertEqual(self.progress(self.levels_quest).current_progress, 1)
+        self.assertEqual(self.progress(self.points_quest).current_progress, 60)
+    
+    def test_completion_rewards_once(self):
+        """Награда за задание начисляется один раз"""
+        for _ in range(5):
+            update_daily_quest_progress(self.user, 'levels_completed', 1)
+        progress = self.progress(self.levels_quest)
+        self.assertEqual(progress.current_progress, 3)
+        self.assertIsNotNone(progress.completed_at)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 50)
+        self.assertEqual(self.user.points, 25)
+    
+    def test_rewards_for_several_quests_in_one_update(self):
+        """Награды за несколько заданий суммируются"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_quest_updates():
+                update_daily_quest_progress(self.user, 'levels_completed', 3)
+                update_daily_quest_progress(self.user, 'points_earned', 100)
+        self.assertEqual(self.user.coins, 90)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 90)
+        self.assertEqual(self.user.points, 45)
+        self.assertEqual(Leaderboard.objects.get(user=self.user).total_points, 45)
+
+    def test_completion_through_request_rewards(self):
+        """Задание выполняется в запросе: request.user — ленивый объект"""
+        self.levels_quest.target_value = 1
+        self.levels_quest.save()
+        topic = Topic.objects.create(name='Тема заданий')
+        level = Level.objects.create(
+            topic=topic, title='Викторина', description='', order_in_topic=1, type='quiz', content={},
+            reward_points=10, reward_coins=5
+        )
+        option = LevelOption.objects.create(level=level, text='Да', is_correct=True, order=0)
+        client = Client()
+        client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse('level_play', args=[level.id]), {'answer_1': option.id})
+        self.assertRedirects(response, reverse('level_result', args=[level.id]), fetch_redirect_response=False)
+        self.assertIsNotNone(self.progress(self.levels_quest).completed_at)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.coins, 5 + 50)
+        self.assertEqual(self.user.points, 10 + 25)
+    
+    def test_daily_quests_single_query(self):
+        """Прогресс по всем заданиям читается одним запросом"""
+        update_daily_quest_progress(self.user, 'points_earned', 30)
+        get_daily_quests_for_user(self.user)
+        with self.assertNumQueries(1):
+            user_quests = get_daily_quests_for_user(self.user)
+        by_title = {item['quest'].title: item for item in user_quests}
+        self.assertEqual(by_title['Очки']['progress_percent'], 30)
+        self.assertIsNone(by_title['Уровни']['progress'])
+    
+    def test_active_quests_cache_invalidated_on_save(self):
+        """Новое задание сразу появляется в списке"""
+        get_daily_quests_for_user(self.user)
+        DailyQuest.objects.create(
+            title='Статьи', description='', quest_type='articles_read', target_value=2, reward_coins=30
+        )
+        self.assertEqual(len(get_daily_quests_for_user(self.user)), 3)
+        self.levels_quest.is_active = False
+        self.levels_quest.save()
+        self.assertEqual(len(get_daily_quests_for_user(self.user)), 2)
+    
+    def test_daily_quests_page_query_count_constant(self):
+        """Число запросов страницы заданий не растет с числом заданий"""
+        client = Client()
+        client.force_login(self.user)
+        client.get(reverse('daily_quests'))
+        with CaptureQueriesContext(connection) as before:
+            client.get(reverse('daily_quests'))
+        for quest_type in ['articles_read', 'streak_days', 'achievements_earned']:
+            DailyQuest.objects.create(
+                title=quest_type, description='', quest_type=quest_type, target_value=1, reward_coins=1
+            )
+        client.get(reverse('daily_quests'))
+        with CaptureQueriesContext(connection) as after:
+            response = client.get(reverse('daily_quests'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(after), len(before))
+
+
+class NotificationOutboxTest(TestCase):
+    """Тесты для буфера уведомлений"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='notified')
+    
+    def test_outbox_writes_once_on_commit(self):
+        """Уведомления за блок записываются одним запросом после коммита"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            with notification_outbox():
+                notify(self.user, 'Первое')
+                notify(self.user, 'Второе', 'Третье')
+        self.assertFalse(Notification.objects.exists())
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+    
+    def test_outbox_drops_rolled_back_notifications(self):
+        """Уведомления из откаченного атомарного блока не записываются"""
+        with self.captureOnCommitCallbacks(execute=True):
+            with notification_outbox():
+                notify(self.user, 'Останется')
+                try:
+                    with transaction.atomic():
+                        notify(self.user, 'Откатится')
+                        raise DatabaseError
+                except DatabaseError:
+                    pass
+        self.assertEqual(list(Notification.objects.values_list('text', flat=True)), ['Останется'])
+    
+    def test_outbox_respects_notifications_enabled(self):
+        """Отключившим уведомления пользователям ничего не пишется"""
+        muted = User.objects.create(username='muted', notifications_enabled=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            with notification_outbox():
+                notify(muted, 'Не будет записано')
+                notify(self.user, 'Будет записано')
+        self.assertFalse(Notification.objects.filter(user=muted).exists())
+        self.assertTrue(Notification.objects.filter(user=self.user).exists())
+    
+    def test_level_completion_notifications_batched(self):
+        """Прохождение уровня пишет все уведомления одной вставкой"""
+        topic = Topic.objects.create(name='Тема уведомлений')
+        level = Level.objects.create(
+            topic=topic, title='Уровень', description='', order_in_topic=1, type='calculation',
+            content={'questions': [{'question': '2+2', 'correct_answer': 4}]}
+        )
+        UserLevelProgress.objects.create(user=self.user, level=level)
+        client = Client()
+        client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(reverse('level_play', args=[level.id]), {'calculation_answer_1': '4'})
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "game_notification"')]
+        self.assertEqual(len(inserts), 1)
+        # Очки, монеты и «Мастер» единственной темы
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+
+    
+    def test_unread_counter_maintained_incrementally(self):
+        """Счетчик непрочитанных растет вместе с outbox и не требует запросов"""
+        self.assertEqual(get_unread_count(self.user), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify(self.user, 'Первое', 'Второе')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user), 2)
+        self.assertEqual(self.user.get_unread_notifications_count(), 2)
+    
+    def test_unread_counter_reset_on_mark_all_read(self):
+        """«Прочитать все» обнуляет счетчик"""
+        with self.captureOnCommitCallbacks(execute=True):
+            notify(self.user, 'Первое')
+        client = Client()
+        client.force_login(self.user)
+        client.post(reverse('notifications_list'), {'action': 'mark_all_read'})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user), 0)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+    
+    def test_unread_counter_recounted_on_cache_miss(self):
+        """При промахе кеша счетчик берется из БД"""
+        Notification.objects.bulk_create([Notification(user=self.user, text='Старое')])
+        cache.clear()
+        self.assertEqual(get_unread_count(self.user), 1)
+
+
+class RolledBackCompletionTest(TransactionTestCase):
+    """Отложенные записи не переживают откат прохождения уровня"""
+    
+    def setUp(self):
+        cache.clear()
+        invalidate_catalog()
+        self.user = User.objects.create_user(username='rolledback', password='pass')
+        topic = Topic.objects.create(name='Тема отката')
+        self.level = Level.objects.create(
+            topic=topic, title='Уровень', description='', order_in_topic=1, type='calculation',
+            content={'questions': [{'question': '2+2', 'correct_answer': 4}]},
+            reward_points=10, reward_coins=5
+        )
+        UserLevelProgress.objects.create(user=self.user, level=self.level)
+        self.client.force_login(self.user)
+    
+    def tearDown(self):
+        cache.clear()
+        invalidate_catalog()
+    
+    def complete_and_fail(self):
+        with patch('game.views.save_level_progress', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse('level_play', args=[self.level.id]), {'calculation_answer_1': '4'})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.points, 0)
+    
+    def test_no_notifications_after_rollback(self):
+        self.complete_and_fail()
+        self.assertFalse(Notification.objects.exists())
+    
+    def test_no_quest_progress_after_rollback(self):
+        quest = DailyQuest.objects.create(
+            title='Уровни', description='', quest_type='levels_completed', target_value=2, reward_coins=50
+        )
+        self.complete_and_fail()
+        self.assertFalse(UserDailyProgress.objects.filter(quest=quest).exists())
+        
+        self.client.post(reverse('level_play', args=[self.level.id]), {'calculation_answer_1': '4'})
+        progress = UserDailyProgress.objects.get(user=self.user, quest=quest)
+        self.assertEqual((progress.current_progress, progress.completed_at), (1, None))
+
+
+class AchievementsContextTest(TestCase):
+    """Тесты для ленивого контекста достижений"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='ctxuser')
+        self.achievement = Achievement.objects.create(name='Контекстное', description='')
+        UserAchievement.objects.create(user=self.user, achievement=self.achievement)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+    
+    def test_no_queries_until_read(self):
+        """Без чтения из шаблона контекст-процессор не делает запросов"""
+        with self.assertNumQueries(0):
+            achievements_context(self.request)
+    
+    def test_values_cached_per_user(self):
+        """Повторное чтение берется из кеша"""
+        context = achievements_context(self.request)
+        self.assertEqual(context['mobile_achievements_count'], 1)
+        with self.assertNumQueries(0):
+            context = achievements_context(self.request)
+            self.assertEqual(len(context['mobile_achievements']), 1)
+            self.assertEqual(context['mobile_achievements_count'], 1)
+    
+    def test_cache_invalidated_on_award(self):
+        """Выдача достижения сбрасывает кеш"""
+        get_recent_achievements(self.user)
+        topic = Topic.objects.create(name='Тема контекста')
+        level = Level.objects.create(topic=topic, title='Уровень', description='', order_in_topic=1)
+        progress = UserLevelProgress.objects.create(user=self.user, level=level)
+        before = progress_state(progress)
+        progress.completed = True
+        progress.score = progress.best_score = 100
+        save_level_progress(progress, level, before)
+        dispatch(self.user, LEVEL_COMPLETED)
+        self.assertEqual(get_recent_achievements(self.user)['count'], 2)
+    
+    @override_settings(CONTEXT_PROCESSOR_PROFILING=True)
+    def test_profiling_counts_lazy_queries(self):
+        """Инструментирование учитывает запросы при ленивом вычислении"""
+        context = achievements_context(self.request)
+        self.assertEqual(self.request.context_processor_queries, {'achievements_context': 0})
+        self.assertEqual(context['mobile_achievements_count'], 1)
+        self.assertEqual(self.request.context_processor_queries, {'achievements_context': 2})
+
+
+class QuizAttemptTest(TestCase):
+    """Тесты для хранения попыток викторин вне сессии"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='quizzer')
+        topic = Topic.objects.create(name='Тема попыток')
+        self.level = Level.objects.create(
+            topic=topic, title='Викторина', description='', order_in_topic=1, type='quiz',
+            content={'questions': [
+                {'question': 'Первый?', 'type': 'single', 'options': [
+                    {'text': 'Да', 'correct': True}, {'text': 'Нет', 'correct': False}
+                ]},
+                {'question': 'Второй?', 'type': 'single', 'options': [
+                    {'text': 'Да', 'correct': False}, {'text': 'Нет', 'correct': True}
+                ]},
+            ]}
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.client.get(reverse('level_play', args=[self.level.id]))
+    
+    def answer(self, client, question_index, answer):
+        return client.post(reverse('level_play', args=[self.level.id]), {
+            'question_index': question_index, 'answer': answer
+        })
+    
+    def test_answers_not_stored_in_session(self):
+        """Ответы хранятся в попытке, а не в сессии"""
+        self.answer(self.client, 0, 0)
+        self.assertFalse(any(key.startswith('quiz_') for key in self.client.session.keys()))
+        attempt = QuizAttempt.objects.get(user=self.user, level=self.level)
+        self.assertEqual(attempt.results, [[100, 0], None])
+    
+    def test_attempt_resumed_on_another_device(self):
+        """Попытку можно продолжить из другой сессии"""
+        self.answer(self.client, 0, 0)
+        other_device = Client()
+        other_device.force_login(self.user)
+        response = other_device.get(reverse('level_play', args=[self.level.id]))
+        self.assertEqual(response.context['quiz_data']['current_question'], 1)
+        self.answer(other_device, 1, 0)
+        response = other_device.get(reverse('level_result', args=[self.level.id]))
+        quiz_results = response.context['quiz_results']
+        self.assertEqual(quiz_results['percentage'], 50)
+        self.assertEqual(quiz_results['correct_answers'], 1)
+        self.assertEqual([a['text'] for a in quiz_results['answers']], ['Да', 'Да'])
+    
+    def test_answer_from_other_worker_visible(self):
+        """Ответ, записанный другим процессом, сразу виден на странице вопроса"""
+        QuizAttempt.objects.create(user=self.user, level=self.level, results=[None, None])
+        self.client.get(reverse('level_play', args=[self.level.id]))
+        QuizAttempt.objects.filter(user=self.user, level=self.level).update(results=[[100, 0], None])
+        response = self.client.get(reverse('level_play', args=[self.level.id]))
+        self.assertEqual(response.context['quiz_data']['current_question'], 1)
+    
+    def test_finished_attempt_restarts(self):
+        """После завершения викторина начинается заново, но только с первым ответом"""
+        self.answer(self.client, 0, 0)
+        self.answer(self.client, 1, 1)
+        self.assertTrue(UserLevelProgress.objects.get(user=self.user, level=self.level).completed)
+        response = self.client.get(reverse('level_play', args=[self.level.id]))
+        self.assertEqual(response.context['quiz_data']['current_question'], 0)
+        # Просмотр страницы не сбрасывает завершенную попытку
+        self.assertIsNotNone(QuizAttempt.objects.get(user=self.user, level=self.level).finished_at)
+        response = self.client.get(reverse('level_result', args=[self.level.id]))
+        self.assertEqual(response.context['quiz_results']['percentage'], 100)
+        self.answer(self.client, 0, 1)
+        attempt = QuizAttempt.objects.get(user=self.user, level=self.level)
+        self.assertIsNone(attempt.finished_at)
+        self.assertEqual(attempt.results, [[0, 1], None])
+
+
+class BatchQuizSubmitTest(TestCase):
+    """Тесты для пакетной проверки викторины одним запросом"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='batcher')
+        topic = Topic.objects.create(name='Тема пакета')
+        self.level = Level.objects.create(
+            topic=topic, title='Пакетная викторина', description='', order_in_topic=1, type='quiz',
+            reward_points=20, reward_coins=5,
+            content={'questions': [
+                {'question': 'Один?', 'type': 'single', 'options': [
+                    {'text': 'Да', 'correct': True}, {'text': 'Нет', 'correct': False}
+                ]},
+                {'question': 'Несколько?', 'type': 'multiple', 'options': [
+                    {'text': 'А', 'correct': True}, {'text': 'Б', 'correct': True}, {'text': 'В', 'correct': False}
+                ]},
+                {'question': 'Сопоставь', 'type': 'matching', 'correct_matches': [[0, 1], [1, 0]]},
+                {'question': 'Упорядочь', 'type': 'sorting', 'items': ['x', 'y'], 'correct_order': [1, 0]},
+            ]}
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def submit(self, answers):
+        return self.client.post(
+            reverse('level_submit', args=[self.level.id]),
+            data=json.dumps({'answers': answers, 'completion_time': 42}),
+            content_type='application/json'
+        )
+    
+    def test_questions_hide_correct_answers(self):
+        """Клиент получает вопросы без правильных ответов"""
+        response = self.client.get(reverse('level_questions', args=[self.level.id]))
+        data = response.json()
+        self.assertEqual(data['level']['total_questions'], 4)
+        self.assertNotIn('correct', data['questions'][0]['options'][0])
+        self.assertNotIn('correct_matches', data['questions'][2])
+        self.assertNotIn('correct_order', data['questions'][3])
+    
+    def test_submit_grades_all_questions(self):
+        """Все ответы проверяются одним запросом и уровень засчитывается"""
+        response = self.submit([0, [0, 1], [[1, 0], [0, 1]], [1, 0]])
+        data = response.json()
+        self.assertEqual(data['percentage'], 100)
+        self.assertTrue(data['completed'])
+        self.assertEqual([r['correct'] for r in data['results']], [True, True, True, True])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.points, 20)
+        progress = UserLevelProgress.objects.get(user=self.user, level=self.level)
+        self.assertEqual(progress.best_time, 42)
+        result = self.client.get(data['result_url'])
+        self.assertEqual(result.context['quiz_results']['correct_answers'], 4)
+    
+    def test_submit_partial_score(self):
+        """Неверные ответы снижают итоговый процент"""
+        data = self.submit([1, [0], [[0, 0], [1, 1]], [1, 0]]).json()
+        self.assertEqual([r['percentage'] for r in data['results']], [0, 50, 0, 100])
+        self.assertEqual(data['percentage'], 37)
+        self.assertFalse(data['completed'])
+    
+    def test_submit_rejects_invalid_payload(self):
+        """Неполный или неверный ответ возвращает 400"""
+        self.assertEqual(self.submit([0]).status_code, 400)
+        response = self.submit([5, [0], [], [0, 1]])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['question_index'], 0)
+        self.assertFalse(UserLevelProgress.objects.filter(user=self.user, completed=True).exists())
+
+
+class AnswerKeyTest(TestCase):
+    """Тесты для скомпилированных ключей ответов"""
+    
+    def setUp(self):
+        cache.clear()
+        clear_answer_keys()
+        self.topic = Topic.objects.create(name='Тема ключей')
+        self.puzzle = Level.objects.create(
+            topic=self.topic, title='Загадка', description='', order_in_topic=1, type='puzzle',
+            content={'correct_answers': ['Вклад', ' Депозит ']}
+        )
+    
+    def test_key_is_compiled_once(self):
+        """Пока каталог не менялся, ключ берется из памяти worker'а"""
+        key = get_answer_key(self.puzzle)
+        self.assertEqual(key.data.answers, frozenset({'вклад', 'депозит'}))
+        with self.assertNumQueries(0):
+            self.assertIs(get_answer_key(self.puzzle), key)
+    
+    def test_key_recompiled_after_content_change(self):
+        """После изменения content ключ компилируется заново"""
+        old_key = get_answer_key(self.puzzle)
+        self.puzzle.content = {'correct_answers': ['Кредит']}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.puzzle.save()
+        key = get_answer_key(self.puzzle)
+        self.assertNotEqual(key.content_hash, old_key.content_hash)
+        self.assertEqual(key.data.answers, frozenset({'кредит'}))
+    
+    def test_key_reused_when_content_unchanged(self):
+        """Смена версии каталога без изменения content не пересобирает ключ"""
+        key = get_answer_key(self.puzzle)
+        Topic.objects.create(name='Другая тема')
+        self.assertIs(get_answer_key(self.puzzle), key)
+    
+    def test_answers_are_normalized(self):
+        """Ответы сравниваются без учета регистра и пробелов"""
+        from game.views import process_level_answer
+        self.assertTrue(process_level_answer(self.puzzle, {'puzzle_answer': '  ДЕПОЗИТ'})[0])
+        self.assertFalse(process_level_answer(self.puzzle, {'puzzle_answer': 'акция'})[0])
+        
+        quest = Level.objects.create(
+            topic=self.topic, title='Квест', description='', order_in_topic=2, type='quest',
+            content={'total_steps': 2, 'steps': {
+                '1': {'correct_answers': ['Бюджет']}, '2': {'correct_answers': ['Резерв']}
+            }}
+        )
+        self.assertEqual(process_level_answer(quest, {'current_step': '1', 'quest_answer': 'бюджет '})[0], 'continue')
+        self.assertTrue(process_level_answer(quest, {'current_step': '2', 'quest_answer': 'РЕЗЕРВ'})[0])
+    
+    def test_quiz_questions_compiled(self):
+        """Вопросы JSON-викторины превращаются в множества правильных индексов"""
+        quiz = Level.objects.create(
+            topic=self.topic, title='Викторина', description='', order_in_topic=3, type='quiz',
+            content={'questions': [
+                {'question': 'Что?', 'options': [{'text': 'А'}, {'text': 'Б', 'correct': True}]},
+                {'question': 'Порядок', 'type': 'sorting', 'correct_order': [2, 0, 1]},
+            ]}
+        )
+        single, sorting = get_answer_key(quiz).data
+        self.assertEqual(single.type, 'single')
+        self.assertEqual(single.correct, frozenset({1}))
+        self.assertEqual(single.option_count, 2)
+        self.assertEqual(sorting.order, (2, 0, 1))
+
+
+class LevelOptionGradingTest(TestCase):
+    """Тесты для проверки старых уровней quiz/test с LevelOption"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='tester')
+        self.topic = Topic.objects.create(name='Тема тестов')
+        self.level = Level.objects.create(
+            topic=self.topic, title='Тест', description='', order_in_topic=1, type='test', content={}
+        )
+        self.options = {}
+        for number in (1, 2, 3):
+            for order, correct in enumerate((True, True, False)):
+                self.options[number, order] = LevelOption.objects.create(
+                    level=self.level, text=f'{number}.{order}', is_correct=correct,
+                    order=order, question_number=number
+                )
+    
+    def post_data(self, answers):
+        from django.http import QueryDict
+        data = QueryDict(mutable=True)
+        for number, orders in answers.items():
+            data.setlist(f'answer_{number}', [str(self.options[number, order].id) for order in orders])
+        return data
+    
+    def test_test_graded_with_one_query(self):
+        """Все вопросы теста проверяются по одному запросу вариантов"""
+        from game.views import process_level_answer
+        data = self.post_data({1: [0, 1], 2: [1, 0], 3: [0, 1]})
+        with self.assertNumQueries(1):
+            is_correct, message = process_level_answer(self.level, data)
+        self.assertTrue(is_correct)
+        self.assertIn('3 из 3', message)
+    
+    def test_test_requires_exact_set(self):
+        """Лишний или недостающий вариант делает вопрос неверным"""
+        from game.views import process_level_answer
+        data = self.post_data({1: [0, 1, 2], 2: [0], 3: [0, 1]})
+        is_correct, message = process_level_answer(self.level, data)
+        self.assertFalse(is_correct)
+        self.assertIn('1 из 3', message)
+    
+    def test_quiz_graded_with_one_query(self):
+        """Старая викторина проверяется без запроса на каждый ответ"""
+        from game.views import process_level_answer
+        self.level.type = 'quiz'
+        data = self.post_data({1: [0], 2: [2], 3: [1]})
+        with self.assertNumQueries(1):
+            is_correct, message = process_level_answer(self.level, data)
+        self.assertFalse(is_correct)
+        self.assertIn('2 из 3', message)
+    
+    def test_quiz_submitted_through_level_play(self):
+        """Старая викторина проходится формой страницы (поля answer_<номер>)"""
+        self.level.type = 'quiz'
+        self.level.save()
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('level_play', args=[self.level.id])
+        self.assertContains(client.get(url), 'name="answer_1"', count=3)
+        
+        response = client.post(url, {})
+        self.assertEqual([str(m) for m in get_messages(response.wsgi_request)], ['Выберите вариант ответа!'])
+        data = {f'answer_{number}': self.options[number, 0].id for number in (1, 2, 3)}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(url, data)
+        self.assertRedirects(response, reverse('level_result', args=[self.level.id]), fetch_redirect_response=False)
+        self.assertTrue(UserLevelProgress.objects.get(user=self.user, level=self.level).completed)
+    
+    def test_render_uses_grouped_options(self):
+        """Страница теста строит вопросы из сгруппированных вариантов"""
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('level_play', args=[self.level.id]))
+        self.assertEqual([group.number for group in response.context['option_groups']], [1, 2, 3])
+        self.assertContains(response, 'name="answer_3"', count=3)
+
+
+class LevelSummaryTest(TestCase):
+    """Тесты для загрузки уровней без content"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        self.topic = Topic.objects.create(name='Тема сводок')
+        self.level = Level.objects.create(
+            topic=self.topic, title='Сводка', description='', order_in_topic=1, type='puzzle',
+            content={'correct_answers': ['x' * 1000]}
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def test_summaries_defer_content(self):
+        """summaries() не загружает content, пока к нему не обратились"""
+        level = Level.objects.summaries().get(pk=self.level.pk)
+        self.assertIn('content', level.get_deferred_fields())
+        with self.assertNumQueries(1):
+            self.assertEqual(level.content, self.level.content)
+    
+    def test_topic_levels_skip_content(self):
+        """Список уровней темы не читает content"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('topic_levels', args=[self.topic.id]))
+        self.assertContains(response, 'Сводка')
+        level_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "game_level"' in q['sql']]
+        self.assertTrue(level_queries)
+        for sql in level_queries:
+            self.assertNotIn('"game_level"."content"', sql)
+
+
+class LandingPageCacheTest(TestCase):
+    """Тесты для кеша лендинга анонимных посетителей"""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse('dashboard')
+    
+    def test_second_request_served_from_cache(self):
+        """Повторный запрос не рендерит шаблон и не обращается к БД"""
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header('ETag'))
+        self.assertTrue(first.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.templates, [])
+    
+    def test_conditional_get_returns_304(self):
+        """Клиент с актуальной копией получает 304 без тела"""
+        first = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_mobile_and_desktop_cached_separately(self):
+        """Мобильная и десктопная версии лежат под разными ключами"""
+        desktop = self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0 (Windows NT 10.0)')
+        mobile = self.client.get(self.url, HTTP_USER_AGENT='Mozilla/5.0 (iPhone) Mobile Safari')
+        self.assertNotEqual(desktop['ETag'], mobile['ETag'])
+        self.assertContains(mobile, 'mobile-view')
+        self.assertNotContains(desktop, 'class="mobile-view"')
+    
+    def test_deploy_invalidates_cache(self):
+        """После смены версии деплоя страница рендерится заново"""
+        self.client.get(self.url)
+        with override_settings(DEPLOY_VERSION='next-release'):
+            response = self.client.get(self.url)
+        self.assertTrue(response.templates)
+    
+    def test_authenticated_user_not_cached(self):
+        """Вошедший пользователь получает свою панель, а не лендинг из кеша"""
+        self.client.get(self.url)
+        user = User.objects.create(username='insider')
+        self.client.force_login(user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertTemplateNotUsed(response, 'game/landing.html')
+
+
+class CategoryCardsCacheTest(TestCase):
+    """Тесты для кеша карточек категорий"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='cards')
+        self.topic = Topic.objects.create(name='Карточки', main_category='basics')
+        self.level = Level.objects.create(
+            topic=self.topic, title='Карточка', description='', order_in_topic=1, type='quiz',
+            content={'questions': [
+                {'question': 'Вопрос?', 'type': 'single', 'options': [
+                    {'text': 'Верно', 'correct': True}, {'text': 'Неверно', 'correct': False}
+                ]}
+            ]}
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def progress_queries(self, url_name):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return response, [q for q in ctx.captured_queries if 'game_usertopicprogress' in q['sql']]
+    
+    def test_cards_rendered_from_cache(self):
+        """Повторный просмотр берет карточки из кеша и не считает прогресс"""
+        for url_name in ('categories', 'mobile_skills'):
+            _, queries = self.progress_queries(url_name)
+            self.assertTrue(queries)
+            response, queries = self.progress_queries(url_name)
+            self.assertEqual(queries, [])
+            self.assertContains(response, '0 из 1 уровней')
+    
+    def test_completion_refreshes_cards(self):
+        """Прохождение уровня меняет поколение прогресса и карточки перерисовываются"""
+        self.progress_queries('categories')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('level_play', args=[self.level.id]))
+            self.client.post(reverse('level_play', args=[self.level.id]), {'question_index': 0, 'answer': 0})
+        response, queries = self.progress_queries('categories')
+        self.assertTrue(queries)
+        self.assertContains(response, '1 из 1 уровней')
+    
+    def test_catalog_change_refreshes_cards(self):
+        """Новый уровень в каталоге сбрасывает карточки"""
+        self.progress_queries('mobile_skills')
+        with self.captureOnCommitCallbacks(execute=True):
+            Level.objects.create(
+                topic=self.topic, title='Еще один', description='', order_in_topic=2, type='puzzle', content={}
+            )
+        response, _ = self.progress_queries('mobile_skills')
+        self.assertContains(response, '0 из 2 уровней')
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    """Тесты для учета запросов к БД и бюджетов view"""
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+    
+    def run_view(self, queries, budget=None, **settings):
+        from django.http import HttpResponse
+        from game.db_optimization import query_budget
+        from game.middleware import QueryBudgetMiddleware
+        
+        def view(request):
+            for _ in range(queries):
+                User.objects.exists()
+            return HttpResponse('ok')
+        if budget is not None:
+            view = query_budget(queries=budget)(view)
+        
+        with override_settings(**settings):
+            middleware = QueryBudgetMiddleware(lambda request: view(request))
+            request = self.factory.get('/budget/')
+            middleware.process_view(request, view, (), {})
+            return middleware(request)
+    
+    def test_budget_exceeded_logged(self):
+        """Превышение бюджета view пишется в лог с числом запросов"""
+        with self.assertLogs('game.query_budget', 'WARNING') as logs:
+            self.run_view(3, budget=2)
+        self.assertIn('queries=3 budget_queries=2', logs.output[0])
+        self.assertEqual(logs.records[0].queries, 3)
+    
+    def test_within_budget_not_logged(self):
+        """Запрос в пределах бюджета ничего не пишет в лог"""
+        with self.assertNoLogs('game.query_budget', 'WARNING'):
+            self.run_view(2, budget=2)
+    
+    def test_default_budget_from_settings(self):
+        """View без декоратора проверяется по QUERY_BUDGET_DEFAULT"""
+        with self.assertLogs('game.query_budget', 'WARNING'):
+            self.run_view(2, QUERY_BUDGET_DEFAULT={'queries': 1})
+    
+    def test_server_timing_header(self):
+        """Server-Timing добавляется только если включен"""
+        response = self.run_view(1, QUERY_BUDGET_SERVER_TIMING=True)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[0-9.]+;desc="1 queries"$')
+        response = self.run_view(1, QUERY_BUDGET_SERVER_TIMING=False)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class BenchCommandTest(TestCase):
+    """Тесты для команды bench"""
+    
+    def test_report_and_rollback(self):
+        """Отчет содержит перцентили по каждой странице, данные откатываются"""
+        cache.set('bench_test:unrelated', 'сессия')
+        out = StringIO()
+        call_command('bench', users=2, iterations=3, warmup=1, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(cache.get('bench_test:unrelated'), 'сессия')
+        self.assertEqual(
+            set(report['views']), {'dashboard', 'level_play', 'level_result', 'profile', 'leaderboard'}
+        )
+        for result in report['views'].values():
+            self.assertEqual(result['status'], [200])
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['bytes_median'], 0)
+        self.assertFalse(User.objects.filter(username__startswith='bench_user_').exists())
+        self.assertFalse(Level.objects.exists())
+    
+    def test_percentile_nearest_rank(self):
+        """Ранг — ceil(pct / 100 * n) в пределах [1, n]"""
+        from game.management.commands.bench import percentile
+        values = list(range(1, 51))
+        self.assertEqual(percentile(values, 50), 25)
+        self.assertEqual(percentile(values, 95), 48)
+        self.assertEqual(percentile(values, 100), 50)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile([7], 99), 7)
+
+
+class GenerateDatasetTest(TestCase):
+    """Тесты для генератора синтетических данных"""
+    
+    def setUp(self):
+        topic = Topic.objects.create(name='Тема генератора')
+        for i in range(5):
+            Level.objects.create(
+                topic=topic, title=f'Уровень {i}', description='', order_in_topic=i, type='quiz',
+                content={'questions': [{'question': 'q'}, {'question': 'q'}, {'question': 'q'}]}
+            )
+        DailyQuest.objects.create(title='Уровни', description='', quest_type='levels_completed', target_value=3, reward_coins=5)
+    
+    def generate(self, prefix, seed=7, block_size=10):
+        call_command(
+            'generate_dataset', users=25, notifications=4, seed=seed, chunk_size=20, block_size=block_size,
+            prefix=prefix, stdout=StringIO()
+        )
+        users = User.objects.filter(username__startswith=prefix).order_by('id')
+        return [
+            (
+                user.points,
+                UserLevelProgress.objects.filter(user=user).count(),
+                Notification.objects.filter(user=user).count(),
+                user.leaderboard_entry.levels_completed,
+            )
+            for user in users
+        ]
+    
+    def test_reproducible_from_seed(self):
+        """Один и тот же seed дает одинаковые данные независимо от разбиения на пачки"""
+        first = self.generate('a_')
+        self.assertEqual(len(first), 25)
+        self.assertEqual(first, self.generate('b_', block_size=7))
+        self.assertNotEqual(first, self.generate('c_', seed=8))
+    
+    def test_counters_consistent(self):
+        """Рейтинг и счетчики тем согласованы с прохождениями"""
+        self.generate('d_')
+        for entry in Leaderboard.objects.select_related('user'):
+            completed = UserLevelProgress.objects.filter(user=entry.user, completed=True).count()
+            self.assertEqual(entry.levels_completed, completed)
+            self.assertEqual(entry.total_points, entry.user.points)
+        self.assertEqual(
+            sum(UserTopicProgress.objects.values_list('completed_count', flat=True)),
+            UserLevelProgress.objects.filter(completed=True).count()
+        )
+    
+    def test_existing_prefix_rejected(self):
+        """Повторный запуск с тем же префиксом не создает дубликаты"""
+        from django.core.management.base import CommandError
+        self.generate('e_')
+        with self.assertRaises(CommandError):
+            self.generate('e_')
+
+
+class ContentSyncTest(TestCase):
+    """Тесты для синхронизации каталога без удаления прогресса"""
+    
+    def catalog(self, **changes):
+        catalog = {
+            'topics': [
+                {'name': 'Основы', 'main_category': 'basics', 'is_subcategory': False, 'parent': None},
+                {'name': 'Бюджет', 'main_category': 'basics', 'is_subcategory': True, 'parent': 'Основы'},
+            ],
+            'levels': [
+                {'topic': 'Бюджет', 'title': 'Первый', 'order_in_topic': 1, 'description': '', 'reward_points': 10,
+                 'content': {'questions': []}},
+                {'topic': 'Бюджет', 'title': 'Второй', 'order_in_topic': 2, 'description': '', 'reward_points': 15,
+                 'content': {'questions': []}},
+            ],
+            'achievements': [{'name': 'Первые шаги', 'description': 'Начало'}],
+        }
+        catalog.update(changes)
+        return catalog
+    
+    def test_initial_sync_creates_catalog(self):
+        """Первая синхронизация создает темы с родителями, уровни и достижения"""
+        from game.content_sync import sync_catalog
+        sync_catalog(self.catalog())
+        budget = Topic.objects.get(name='Бюджет')
+        self.assertEqual(budget.parent_category.name, 'Основы')
+        self.assertEqual(list(budget.level_set.order_by('order_in_topic').values_list('title', flat=True)), ['Первый', 'Второй'])
+        self.assertTrue(Achievement.objects.filter(name='Первые шаги').exists())
+    
+    def test_resync_is_idempotent(self):
+        """Повторная синхронизация того же каталога ничего не меняет"""
+        from game.content_sync import has_changes, sync_catalog
+        sync_catalog(self.catalog())
+        with self.assertNumQueries(4):
+            plan = sync_catalog(self.catalog())
+        self.assertFalse(has_changes(plan))
+    
+    def test_update_keeps_user_progress(self):
+        """Изменение и переименование уровней не трогают прогресс пользователей"""
+        from game.content_sync import sync_catalog
+        sync_catalog(self.catalog())
+        user = User.objects.create(username='keeper')
+        first = Level.objects.get(title='Первый')
+        second = Level.objects.get(title='Второй')
+        UserLevelProgress.objects.create(user=user, level=first, completed=True, score=100)
+        UserLevelProgress.objects.create(user=user, level=second, completed=True, score=100)
+        
+        catalog = self.catalog()
+        catalog['levels'][0]['reward_points'] = 50
+        catalog['levels'][1]['title'] = 'Второй (новый)'
+        sync_catalog(catalog)
+        
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.reward_points, 50)
+        self.assertEqual(second.title, 'Второй (новый)')
+        self.assertEqual(UserLevelProgress.objects.filter(user=user).count(), 2)
+    
+    def test_dry_run_reports_plan(self):
+        """Dry-run показывает план, в том числе удаляемый прогресс, и ничего не пишет"""
+        from game.content_sync import describe_plan, sync_catalog
+        sync_catalog(self.catalog())
+        user = User.objects.create(username='planner')
+        UserLevelProgress.objects.create(user=user, level=Level.objects.get(title='Второй'))
+        
+        catalog = self.catalog()
+        del catalog['levels'][1]
+        plan = sync_catalog(catalog, dry_run=True)
+        self.assertEqual(len(plan.levels.delete), 1)
+        self.assertEqual(plan.orphaned_progress, 1)
+        self.assertIn('Будет удалено записей прогресса пользователей: 1', describe_plan(plan))
+        self.assertTrue(Level.objects.filter(title='Второй').exists())
+        
+        sync_catalog(catalog, delete_missing=False)
+        self.assertTrue(Level.objects.filter(title='Второй').exists())
+
+    def test_runtime_achievements_kept(self):
+        """Достижения не из каталога («Мастер <тема>») и выданные их копии не удаляются без явного флага"""
+        from game.content_sync import has_changes, sync_catalog
+        sync_catalog(self.catalog())
+        user = User.objects.create(username='master')
+        master = Achievement.objects.create(name='Мастер Бюджет', description='Пройдите все уровни темы')
+        UserAchievement.objects.create(user=user, achievement=master)
+
+        plan = sync_catalog(self.catalog())
+        self.assertFalse(has_changes(plan))
+        self.assertTrue(UserAchievement.objects.filter(user=user, achievement=master).exists())
+
+        plan = sync_catalog(self.catalog(), delete_achievements=True, dry_run=True)
+        self.assertEqual(plan.achievements.delete, [master])
+        self.assertEqual(plan.orphaned_progress, 1)
+
+    def test_moved_level_keeps_progress(self):
+        """Уровень, перенесенный в другую тему, сохраняет прогресс и счетчики тем"""
+        from game.content_sync import sync_catalog
+        sync_catalog(self.catalog())
+        user = User.objects.create(username='mover')
+        level = Level.objects.get(title='Первый')
+        UserLevelProgress.objects.create(user=user, level=level, completed=True, score=100)
+        
+        catalog = self.catalog()
+        catalog['topics'].append({'name': 'Сбережения', 'main_category': 'basics', 'is_subcategory': True, 'parent': 'Основы'})
+        catalog['levels'][0]['topic'] = 'Сбережения'
+        with self.captureOnCommitCallbacks(execute=True):
+            plan = sync_catalog(catalog)
+        self.assertEqual(plan.moved_levels, 1)
+        level.refresh_from_db()
+        self.assertEqual(level.topic.name, 'Сбережения')
+        self.assertTrue(UserLevelProgress.objects.filter(user=user, level=level).exists())
+        self.assertEqual(UserTopicProgress.objects.get(user=user).topic, level.topic)
+    
+    def test_create_new_structure_is_idempotent(self):
+        """create_new_structure не удаляет прогресс при повторном запуске"""
+        call_command('create_new_structure', stdout=StringIO())
+        user = User.objects.create(username='veteran')
+        UserLevelProgress.objects.create(user=user, level=Level.objects.first(), completed=True)
+        out = StringIO()
+        call_command('create_new_structure', stdout=out)
+        self.assertIn('Каталог уже актуален', out.getvalue())
+        self.assertEqual(UserLevelProgress.objects.filter(user=user).count(), 1)
+
+
+
+class ArticleImportTest(TestCase):
+    """Тесты для потокового импорта статей"""
+    
+    def setUp(self):
+        self.topic = Topic.objects.create(name='Накопления')
+        Topic.objects.create(name='Кредиты')
+    
+    def data(self, count=3, topic='Накопления'):
+        articles = [
+            {
+                'id': i, 'title': f'Статья {i}', 'summary': 'Кратко', 'content': f'<p>Текст {i}</p>',
+                'tags': ['деньги'], 'difficulty': 'beginner', 'reading_time': '5 минут', 'author': 'FinQuest',
+            }
+            for i in range(count)
+        ]
+        return {'articles': {'basics': {'name': 'Основы', 'icon': 'fa', 'subcategories': {
+            'savings': {'name': topic, 'description': '', 'articles': articles},
+        }}}}
+    
+    def run_import(self, data, **kwargs):
+        from game.article_import import import_articles
+        return import_articles(StringIO(json.dumps(data, ensure_ascii=False)), **kwargs)
+    
+    def test_stream_matches_json_load(self):
+        """Потоковый разбор при любом размере куска дает те же статьи, что json.load"""
+        from game.article_import import iter_articles
+        with open('game/fixtures/articles_data.json', encoding='utf-8') as f:
+            data = json.load(f)
+        expected = [
+            (sub['name'], article)
+            for category in data['articles'].values()
+            for sub in category['subcategories'].values()
+            for article in sub['articles']
+        ]
+        for read_size in (1, 7, 4096):
+            with open('game/fixtures/articles_data.json', encoding='utf-8') as f:
+                self.assertEqual(list(iter_articles(f, read_size=read_size)), expected)
+    
+    def test_topic_name_after_articles(self):
+        """Название темы после массива статей тоже поддерживается"""
+        from game.article_import import iter_articles
+        text = '{"articles": {"c": {"subcategories": {"s": {"articles": [{"title": "A"}], "name": "Кредиты"}}}}}'
+        self.assertEqual(list(iter_articles(StringIO(text), read_size=5)), [('Кредиты', {'title': 'A'})])
+    
+    def test_upsert_by_title(self):
+        """Повторный импорт ничего не создает, измененные статьи обновляются"""
+        stats = self.run_import(self.data(), chunk_size=2)
+        self.assertEqual((stats.created, stats.updated), (3, 0))
+        
+        stats = self.run_import(self.data(), chunk_size=2)
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (0, 0, 3))
+        
+        data = self.data(count=4, topic='Кредиты')
+        stats = self.run_import(data)
+        self.assertEqual((stats.created, stats.updated), (1, 3))
+        self.assertEqual(Article.objects.filter(topic__name='Кредиты').count(), 4)
+    
+    def test_queries_per_chunk(self):
+        """Число запросов зависит от числа пачек, а не статей"""
+        with CaptureQueriesContext(connection) as small:
+            self.run_import(self.data(count=5), chunk_size=100)
+        Article.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.run_import(self.data(count=50), chunk_size=100)
+        self.assertEqual(len(small), len(large))
+    
+    def test_missing_topic_skipped(self):
+        """Статьи с неизвестной темой пропускаются"""
+        stats = self.run_import(self.data(topic='Нет такой'))
+        self.assertEqual((stats.skipped, stats.missing_topics), (3, ['Нет такой']))
+        self.assertFalse(Article.objects.exists())
+    
+    def test_html_sanitized(self):
+        """Скрипты, обработчики и javascript:-ссылки удаляются, остальная разметка сохраняется"""
+        from game.article_import import sanitize_html
+        html = '<p onclick="x()">a &amp; b<script>alert(1)</script><a href=" javascript:x">l</a><svg viewBox="0 0 1 1"/></p>'
+        self.assertEqual(sanitize_html(html), '<p>a &amp; b<a>l</a><svg viewBox="0 0 1 1"/></p>')
+    
+    def test_workers(self):
+        """Параллельная сборка HTML дает тот же результат"""
+        self.run_import(self.data(count=6), workers=2, chunk_size=4)
+        contents = list(Article.objects.order_by('title').values_list('content', flat=True))
+        Article.objects.all().delete()
+        self.run_import(self.data(count=6))
+        self.assertEqual(contents, list(Article.objects.order_by('title').values_list('content', flat=True)))
+    
+    def test_command(self):
+        """load_articles загружает файл и сообщает о прогрессе"""
+        out = StringIO()
+        call_command('load_articles', file='game/fixtures/articles_data.json', chunk_size=2, stdout=out)
+        self.assertIn('обработано', out.getvalue())
+        self.assertIn('Тема "Бюджетирование" не найдена', out.getvalue())
+        self.assertEqual(Article.objects.filter(topic=self.topic).count(), 3)
+
+
+
+class FixtureLoaderTest(TestCase):
+    """Тесты для быстрого загрузчика фикстур каталога"""
+    
+    def snapshot(self):
+        return (
+            list(Topic.objects.order_by('pk').values()),
+            list(Level.objects.order_by('pk').values()),
+            list(LevelOption.objects.order_by('pk').values()),
+        )
+    
+    def load(self, records, model):
+        from game.fixture_loader import load_fixture
+        return load_fixture(StringIO(json.dumps(records)), model, {}, batch_size=2)
+    
+    def test_same_result_as_loaddata(self):
+        """Загрузчик дает те же строки, что loaddata"""
+        from game.fixture_loader import load_fixture_files
+        call_command('loaddata', 'game/fixtures/topics.json', 'game/fixtures/levels.json',
+                     'game/fixtures/level_options.json', verbosity=0)
+        expected = self.snapshot()
+        LevelOption.objects.all().delete()
+        Level.objects.all().delete()
+        Topic.objects.all().delete()
+        
+        stats, missing = load_fixture_files('game/fixtures', batch_size=7)
+        self.assertEqual(missing, [])
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual([item.created for item in stats], [len(rows) for rows in expected])
+    
+    def test_reload_updates(self):
+        """Повторная загрузка обновляет строки по pk, не создавая новых"""
+        from game.fixture_loader import load_fixture_files
+        load_fixture_files('game/fixtures')
+        Topic.objects.filter(pk=1).update(name='Переименована')
+        stats, _ = load_fixture_files('game/fixtures')
+        self.assertEqual(sum(item.created for item in stats), 0)
+        self.assertEqual(Topic.objects.get(pk=1).name, 'Накопления')
+    
+    def test_single_catalog_bump(self):
+        """Сигналы не срабатывают, версия каталога поднимается один раз после фиксации"""
+        from game.fixture_loader import load_fixture_files
+        with patch('game.signals.bump_catalog_version') as signal_bump, \
+                patch('game.fixture_loader.bump_catalog_version') as bump:
+            with self.captureOnCommitCallbacks(execute=True):
+                load_fixture_files('game/fixtures')
+        signal_bump.assert_not_called()
+        bump.assert_called_once()
+    
+    def test_forward_reference(self):
+        """Родительская тема может идти ниже по файлу"""
+        stats = self.load([
+            {'model': 'game.topic', 'pk': 10, 'fields': {'name': 'Дочерняя', 'parent_category': 12}},
+            {'model': 'game.topic', 'pk': 11, 'fields': {'name': 'Другая'}},
+            {'model': 'game.topic', 'pk': 12, 'fields': {'name': 'Родитель'}},
+        ], Topic)
+        self.assertEqual(stats.created, 3)
+        self.assertEqual(Topic.objects.get(pk=10).parent_category.name, 'Родитель')
+    
+    def test_invalid_foreign_key(self):
+        """Ссылка на несуществующий объект — ошибка, база не меняется"""
+        from game.fixture_loader import FixtureError, load_fixture_files
+        self.load([{'model': 'game.topic', 'pk': 1, 'fields': {'name': 'Тема'}}], Topic)
+        with self.assertRaises(FixtureError):
+            self.load([{'model': 'game.level', 'pk': 1, 'fields': {
+                'topic': 2, 'title': 'У', 'description': '', 'order_in_topic': 1,
+            }}], Level)
+        with self.assertRaises(FixtureError):
+            self.load([{'model': 'game.topic', 'pk': 3, 'fields': {'name': 'Т', 'parent_category': 99}}], Topic)
+        with self.assertRaises(FixtureError):
+            self.load([{'model': 'game.level', 'pk': 1, 'fields': {}}], Topic)
+        self.assertEqual(Topic.objects.count(), 1)
+    
+    def test_command_rolls_back_on_error(self):
+        """load_fixtures при ошибке в любом файле не оставляет частично загруженных данных"""
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copy('game/fixtures/topics.json', directory)
+            with open(os.path.join(directory, 'levels.json'), 'w', encoding='utf-8') as f:
+                json.dump([{'model': 'game.level', 'pk': 1, 'fields': {
+                    'topic': 999, 'title': 'У', 'description': '', 'order_in_topic': 1,
+                }}], f)
+            with self.assertRaises(CommandError):
+                call_command('load_fixtures', fixtures_dir=directory, stdout=StringIO())
+        self.assertFalse(Topic.objects.exists())
+    
+    def test_bench_command(self):
+        """bench_fixtures сравнивает оба способа и откатывает данные"""
+        out = StringIO()
+        call_command('bench_fixtures', options=200, stdout=out)
+        self.assertIn('loaddata', out.getvalue())
+        self.assertIn('fast', out.getvalue())
+        self.assertFalse(Topic.objects.exists())
+
+
+
+class SearchTest(TestCase):
+    """Тесты для полнотекстового поиска"""
+    
+    def setUp(self):
+        self.topic = Topic.objects.create(name='Накопления', description='Основы сбережений')
+        self.level = Level.objects.create(
+            topic=self.topic, title='Финансовая подушка', description='Сколько откладывать', order_in_topic=1
+        )
+        self.article = Article.objects.create(
+            topic=self.topic, title='Как копить деньги',
+            content='<p>Откладывайте <strong>накопления</strong> каждый месяц</p><td>вклад</td><td>ставка</td>'
+        )
+    
+    def found(self, query):
+        from game.search import search
+        return [(result.kind, result.object_id) for result in search(query).results]
+    
+    def test_stemmer(self):
+        """Разные формы слова дают одну основу"""
+        from game.stemmer import stem
+        self.assertEqual(stem('накопления'), stem('накоплений'))
+        self.assertEqual(stem('кредиты'), stem('кредитов'))
+        self.assertEqual(stem('финансовой'), stem('финансовая'))
+    
+    def test_index_updated_on_save(self):
+        """Сохранение и удаление объектов сразу отражаются в индексе"""
+        self.assertIn(('article', self.article.pk), self.found('накоплениями'))
+        self.assertIn(('level', self.level.pk), self.found('финансовую подушку'))
+        self.assertIn(('article', self.article.pk), self.found('вклад'))
+        self.assertEqual(self.found('вкладставка'), [])
+        
+        self.article.title = 'Облигации для начинающих'
+        self.article.save()
+        self.assertIn(('article', self.article.pk), self.found('облигация'))
+        
+        self.article.delete()
+        self.assertEqual(self.found('облигация'), [])
+        self.topic.is_active = False
+        self.topic.save()
+        self.assertNotIn(('topic', self.topic.pk), self.found('сбережения'))
+    
+    def test_title_ranked_first(self):
+        """Совпадение в названии важнее совпадения в тексте"""
+        Article.objects.create(topic=self.topic, title='Про вклады', content='<p>Текст</p>')
+        results = self.found('вклад')
+        self.assertEqual(results[0][0], 'article')
+        self.assertEqual(Article.objects.get(pk=results[0][1]).title, 'Про вклады')
+    
+    def test_pagination(self):
+        """Страницы по PER_PAGE результатов без подсчета общего числа"""
+        from game.search import PER_PAGE, search
+        for i in range(PER_PAGE + 5):
+            Article.objects.create(topic=self.topic, title=f'Облигации {i}', content='')
+        first, second = search('облигации'), search('облигации', page=2)
+        self.assertEqual((len(first.results), first.has_next), (PER_PAGE, True))
+        self.assertEqual((len(second.results), second.has_next), (5, False))
+        self.assertFalse({r.object_id for r in first.results} & {r.object_id for r in second.results})
+    
+    def test_ranked_over_whole_index(self):
+        """Старое совпадение в названии опережает сотни более новых совпадений в тексте"""
+        from game.search import PER_PAGE, index_objects, search
+        old = Article.objects.create(topic=self.topic, title='Облигации', content='')
+        newer = Article.objects.bulk_create([
+            Article(topic=self.topic, title=f'Статья {i}', content='<p>Купоны по облигациям</p>') for i in range(600)
+        ])
+        index_objects(newer)
+        self.assertEqual(self.found('облигации')[0], ('article', old.pk))
+        last = search('облигации', page=600 // PER_PAGE)
+        self.assertEqual((len(last.results), last.has_next), (PER_PAGE, True))
+    
+    def test_bulk_paths_indexed(self):
+        """Массовые загрузки обновляют индекс, rebuild_search_index строит его заново"""
+        from game.article_import import import_articles
+        data = {'articles': {'c': {'name': 'c', 'subcategories': {'s': {'name': 'Накопления', 'articles': [
+            {'title': 'Импортированная статья', 'summary': '', 'content': '<p>Депозиты</p>', 'tags': []},
+        ]}}}}}
+        import_articles(StringIO(json.dumps(data, ensure_ascii=False)))
+        self.assertEqual(len(self.found('депозит')), 1)
+        
+        from game.models import SearchEntry
+        SearchEntry.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.found('депозит')), 1)
+        self.assertEqual(SearchEntry.objects.count(), 4)
+    
+    def test_view(self):
+        """Страница поиска показывает результаты со ссылками"""
+        user = User.objects.create_user(username='seeker', password='pass')
+        self.client.force_login(user)
+        response = self.client.get(reverse('search'), {'q': 'накопления'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('article_detail', args=[self.article.pk]))
+        self.assertContains(response, reverse('topic_levels', args=[self.topic.pk]))
+        
+        response = self.client.get(reverse('search'), {'q': '', 'page': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['page'])
+
+
+
+class RelatedArticlesTest(TestCase):
+    """Тесты для заранее посчитанных похожих статей"""
+    
+    def setUp(self):
+        self.savings = Topic.objects.create(name='Накопления')
+        self.credit = Topic.objects.create(name='Кредиты')
+        self.deposit = Article.objects.create(
+            topic=self.savings, title='Банковский вклад', content='<p>Вклад, процентная ставка, капитализация вклада</p>'
+        )
+        self.deposit_rates = Article.objects.create(
+            topic=self.credit, title='Ставки по вкладам', content='<p>Как сравнить ставку и капитализацию вкладов</p>'
+        )
+        self.budget = Article.objects.create(
+            topic=self.savings, title='Личный бюджет', content='<p>Доходы, расходы и таблица бюджета</p>'
+        )
+        self.mortgage = Article.objects.create(
+            topic=self.credit, title='Ипотека', content='<p>Первоначальный взнос и срок ипотеки</p>'
+        )
+    
+    def test_content_similarity(self):
+        """Ближайший сосед — статья с общими терминами, даже из другой темы"""
+        from game.models import RelatedArticle
+        from game.related_articles import rebuild_related_articles
+        rebuild_related_articles()
+        links = list(RelatedArticle.objects.filter(article=self.deposit))
+        self.assertEqual(links[0].related, self.deposit_rates)
+        self.assertEqual([link.rank for link in links], list(range(len(links))))
+        self.assertNotIn(self.deposit, [link.related for link in links])
+    
+    def test_rotation_single_query(self):
+        """Подборка читается одним запросом и меняется сдвигом по списку соседей"""
+        from game.related_articles import get_related_articles, rebuild_related_articles
+        for i in range(8):
+            Article.objects.create(topic=self.savings, title=f'Вклад {i}', content='<p>Ставка по вкладу</p>')
+        rebuild_related_articles()
+        
+        seen = set()
+        for seed in range(20):
+            with self.assertNumQueries(1):
+                related = get_related_articles(self.deposit, rng=random.Random(seed))
+            self.assertEqual(len(related), 4)
+            seen.update(article.pk for article in related)
+        self.assertGreater(len(seen), 4)
+    
+    def test_fallback_and_cascade(self):
+        """Новая статья без соседей получает статьи темы; удаленная пропадает из подборок"""
+        from game.related_articles import get_related_articles, rebuild_related_articles
+        fresh = Article.objects.create(topic=self.credit, title='Новая', content='')
+        self.assertEqual(get_related_articles(fresh), [self.mortgage, self.deposit_rates])
+        
+        rebuild_related_articles()
+        self.deposit_rates.delete()
+        self.assertNotIn(self.deposit_rates.title, [a.title for a in get_related_articles(self.deposit)])
+    
+    def test_view(self):
+        """Страница статьи показывает похожие статьи"""
+        from game.related_articles import rebuild_related_articles
+        rebuild_related_articles()
+        user = User.objects.create_user(username='reader', password='pass')
+        self.client.force_login(user)
+        response = self.client.get(reverse('article_detail', args=[self.deposit.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('article_detail', args=[self.deposit_rates.pk]))
+
+
 # Запуск: python manage.py test game.tests
@@ -5,10 +5,13 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),                 # /
     path('articles/', views.media, name='articles'),                   # /articles/
     path('articles/<int:pk>/', views.article_detail, name='article_detail'),  # /articles/1/
+    path('search/', views.search, name='search'),  # /search/?q=...
     path('category/<str:category_slug>/', views.category_detail, name='category_detail'), # /category/basics/
     path('topic/<int:topic_id>/', views.topic_levels, name='topic_levels'), # /topic/1/
     path('level/<int:level_id>/', views.level_play, name='level_play'),     # /level/1/
     path('level/<int:level_id>/result/', views.level_result, name='level_result'), # /level/1/result/
+    path('level/<int:level_id>/questions/', views.level_questions, name='level_questions'), # /level/1/questions/ (JSON)
+    path('level/<int:level_id>/submit/', views.level_submit, name='level_submit'), # /level/1/submit/ (JSON)
     path('notifications/', views.notifications_list, name='notifications_list'),  # /notifications/
     path('daily-quests/', views.daily_quests, name='daily_quests'),  # /daily-quests/
     path('leaderboard/', views.leaderboard, name='leaderboard'),  # /leaderboard/